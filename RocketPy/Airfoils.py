@@ -0,0 +1,152 @@
+# Shared airfoil lift tables for the fins and canards
+# Passing airfoil=("RocketPy/NACA0012.csv", "degrees") makes rocketpy re-read and re-process
+# the csv for every fin set it builds (ascent and descent copies, every sweep point, every
+# Monte Carlo sample). Here each table is read, validated and converted once per process,
+# cached in memory and handed to rocketpy as a ready made Function.
+#
+# usage:
+#   from Airfoils import load_airfoil
+#   NACA0012 = load_airfoil("NACA0012")
+#   canards = Nimbus.add_trapezoidal_fins(..., airfoil=NACA0012.rocketpy_airfoil)
+
+# imports
+import functools
+import os
+import warnings
+
+import numpy as np
+from rocketpy import Function
+from scipy.interpolate import RegularGridInterpolator
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# airfoil tables in the repo, lift coefficient vs angle of attack in degrees
+AIRFOIL_FILES = {
+    "NACA0012": "RocketPy/NACA0012.csv",
+    "NACA0012-alt": "rocketpy/NACA0012-alt.csv",
+    "flatPlate": "RocketPy/flatPlate.csv",
+}
+
+# grid for the compressible lift coefficient table
+MACH_GRID = np.linspace(0, 2, 201)
+ALPHA_GRID = np.radians(np.linspace(-20, 20, 161))
+
+
+def _beta(mach):
+    # Prandtl-Glauert factor, same piecewise definition rocketpy uses for the fins
+    mach = np.asarray(mach, dtype=float)
+    return np.where(
+        mach < 0.8,
+        np.sqrt(np.abs(1 - mach**2)),
+        np.where(mach < 1.1, np.sqrt(1 - 0.8**2), np.sqrt(np.abs(mach**2 - 1))),
+    )
+
+
+def read_airfoil_table(path, units="degrees"):
+    # read a two column (alpha, cl) csv with an optional header, check it and return
+    # alpha (in the file's units) and cl, mirrored to negative alpha if only one side is given
+    with open(path) as file:
+        first_line = file.readline()
+    try:
+        [float(value) for value in first_line.split(",")]
+        skip_rows = 0
+    except ValueError:
+        skip_rows = 1  # header, e.g. "alpha,CL"
+    table = np.loadtxt(path, delimiter=",", skiprows=skip_rows, ndmin=2)
+
+    if table.shape[1] != 2:
+        raise ValueError(f"Airfoil table '{path}' must have two columns (alpha, cl)")
+    if not np.isfinite(table).all():
+        raise ValueError(f"Airfoil table '{path}' contains non numeric values")
+
+    table = table[table[:, 0].argsort()]
+    alpha, cl = table[:, 0], table[:, 1]
+    if (np.diff(alpha) <= 0).any():
+        raise ValueError(f"Airfoil table '{path}' has repeated angles of attack")
+    if not alpha[0] <= 0 <= alpha[-1]:
+        raise ValueError(
+            f"Airfoil table '{path}' must include alpha = 0 to get the lift slope"
+        )
+
+    if units not in ("degrees", "radians"):
+        raise ValueError("`units` must be 'degrees' or 'radians'")
+
+    # symmetric airfoil given for positive alpha only
+    if alpha[0] == 0 and cl[0] == 0:
+        alpha = np.concatenate([-alpha[:0:-1], alpha])
+        cl = np.concatenate([-cl[:0:-1], cl])
+
+    return alpha, cl
+
+
+class Airfoil:
+    # lift data of one airfoil, built by load_airfoil
+    def __init__(
+        self, name, alpha, cl, units="degrees", mach_grid=MACH_GRID, alpha_grid=ALPHA_GRID
+    ):
+        self.name = name
+        self.alpha = np.radians(alpha) if units == "degrees" else alpha
+        self.cl = cl
+
+        # incompressible lift coefficient in the table's own units, this is what rocketpy
+        # wants for `airfoil` (kept in the file units so fins match the csv path bit for bit)
+        table_function = Function(
+            np.column_stack([alpha, cl]),
+            f"Alpha ({units})",
+            f"{name} lift coefficient",
+            interpolation="linear",
+        )
+        self.rocketpy_airfoil = (table_function, units)
+
+        # incompressible lift coefficient vs alpha in radians
+        self.cl_function = Function(
+            np.column_stack([self.alpha, cl]),
+            "Alpha (rad)",
+            f"{name} lift coefficient",
+            interpolation="linear",
+        )
+
+        # lift slope at alpha = 0 as rocketpy computes it (complex step just above 0)
+        self.clalpha2D = table_function.differentiate_complex_step(x=1e-3, dx=1e-3)
+        if units == "degrees":
+            self.clalpha2D *= 180 / np.pi
+        if not 0.5 < self.clalpha2D / (2 * np.pi) < 1.5:
+            warnings.warn(
+                f"Airfoil '{name}' has a lift slope of {self.clalpha2D:.2f} /rad at "
+                "alpha = 0, far from the thin airfoil 2*pi. Check the table near 0."
+            )
+
+        # compressible cl(mach, alpha) on the grid, Prandtl-Glauert corrected
+        self.mach_grid = mach_grid
+        self.alpha_grid = alpha_grid
+        self.cl_table = (
+            np.interp(alpha_grid, self.alpha, cl)[np.newaxis, :] / _beta(mach_grid)[:, np.newaxis]
+        )
+        self._interpolator = RegularGridInterpolator(
+            (mach_grid, alpha_grid), self.cl_table, bounds_error=False, fill_value=None
+        )
+
+    def lift_coefficient(self, alpha, mach):
+        # vectorised cl lookup, alpha in radians
+        alpha, mach = np.broadcast_arrays(alpha, mach)
+        points = np.column_stack([mach.ravel(), alpha.ravel()])
+        return self._interpolator(points).reshape(alpha.shape)
+
+    def __repr__(self):
+        return f"Airfoil('{self.name}', clalpha2D={self.clalpha2D:.4f} /rad)"
+
+
+@functools.lru_cache(maxsize=None)
+def load_airfoil(name, units="degrees"):
+    # `name` is a key of AIRFOIL_FILES or a path to a csv (relative to the repo root)
+    path = AIRFOIL_FILES.get(name, name)
+    if not os.path.isabs(path):
+        path = os.path.join(REPO_ROOT, path)
+    alpha, cl = read_airfoil_table(path, units)
+    return Airfoil(name, alpha, cl, units)
+
+
+if __name__ == "__main__":
+    for airfoil_name in AIRFOIL_FILES:
+        airfoil = load_airfoil(airfoil_name)
+        print(airfoil, "cl(5 deg, M0.5) =", airfoil.lift_coefficient(np.radians(5), 0.5))
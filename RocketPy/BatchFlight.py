@@ -0,0 +1,602 @@
+# Lockstep batch flight engine, N Nimbus samples integrated together
+# A Monte Carlo of rocketpy Flights spends nearly all its time in Flight.u_dot_generalized,
+# one sample and one scalar Function lookup at a time. BatchFlight tabulates everything the
+# equations of motion read, once per rocket / environment:
+#  - vs time: total mass and its derivatives, centre of mass to centre of dry mass and its
+#    derivatives, inertia and its derivative, thrust (rows of a (rockets, time, 13) table),
+#  - vs Mach: power on/off drag (dragCurve.csv) and, per aerodynamic surface, the lift
+#    slope and roll forcing/damping coefficients,
+#  - vs altitude: density, wind, speed of sound, gravity and pressure, per environment,
+# and advances the (N, 13) state of all samples with one fixed step RK4, evaluating the
+# same equations as rocketpy (rail 1-DOF, 6-DOF generalized, 3-DOF parachute) on arrays.
+# Each sample keeps its own phase, with per sample events between steps: rail exit,
+# apogee (switching to the descent rocket, as Descent with initial_solution=Ascent),
+# parachute triggers at their sampling rate (with rocketpy's noise and lag) and landing.
+# Like rocketpy's Flight with the Nimbus rockets, eccentricities, products of inertia and
+# air brakes are not modelled, and every sample starts on the rail at t = 0.
+#
+# usage:
+#   batch = BatchFlight([Nimbus] * 500, env, inclination=rng.normal(86, 1, 500),
+#                       descent_rockets=[NimbusDescent] * 500)
+#   results = batch.run()                  # apogee, out_of_rail_velocity, x_impact, ... (N,)
+#   batch = BatchFlight.from_stochastic(500, stochastic_Ascent, stochastic_env,
+#                                       stochastic_flightAscent, stochastic_Descent)
+#   batch = BatchFlight(..., descent_rockets=[NimbusDescent] * 500,
+#                       parachutes=campaign.parachute_sets())    # see StochasticRecovery.py
+
+# imports
+import numpy as np
+
+RAIL, FLYING, PARACHUTE, DONE = 0, 1, 2, 3  # per sample phase
+ALTITUDE_TRIGGER = "altitude"  # trigger group of the parachutes with a numeric trigger
+
+TIME_STEP = 0.005  # s, rocket tables
+MACH = np.linspace(0, 3, 301)  # Mach grid of the drag and surface tables
+ALTITUDES = np.arange(-200, 12001, 10.0)  # m above sea level, atmosphere tables
+PARACHUTE_ADDED_MASS_VOLUME = 4 / 3 * np.pi * 1.5**3  # rocketpy's parachute added mass, R = 1.5 m
+
+# columns of the time table
+MASS, MASS_DOT, MASS_DDOT, R_CM, R_CM_DOT, R_CM_DDOT = range(6)
+I_11, I_22, I_33, I_11_DOT, I_22_DOT, I_33_DOT, THRUST = range(6, 13)
+# columns of the atmosphere table
+DENSITY, WIND_X, WIND_Y, SPEED_OF_SOUND, GRAVITY, PRESSURE = range(6)
+
+
+def _values(function, x):
+    # rocketpy Function on a grid, constant Functions included
+    return np.broadcast_to(np.asarray(function.get_value(x), dtype=float), np.shape(x))
+
+
+def _lookup(table, rows, index):
+    # linear interpolation of the (rows, grid, ...) table at the fractional grid index,
+    # one per row (or one shared scalar index)
+    index = np.clip(index, 0, table.shape[1] - 1.000001)
+    k = np.asarray(index).astype(np.intp)
+    w = np.asarray(index - k)
+    w = w.reshape(w.shape + (1,) * (table.ndim - 2))
+    return table[rows, k] * (1 - w) + table[rows, k + 1] * w
+
+
+def rocket_tables(rocket, time, mach=MACH):
+    # everything the equations of motion read from one rocketpy Rocket
+    columns = np.empty((len(time), 13))
+    columns[:, MASS] = _values(rocket.total_mass, time)
+    columns[:, MASS_DOT] = _values(rocket.total_mass_flow_rate, time)
+    columns[:, MASS_DDOT] = np.gradient(columns[:, MASS_DOT], time)
+    columns[:, R_CM] = _values(rocket.com_to_cdm_function, time)
+    columns[:, R_CM_DOT] = np.gradient(columns[:, R_CM], time)
+    columns[:, R_CM_DDOT] = np.gradient(columns[:, R_CM_DOT], time)
+    for column, function in ((I_11, rocket.I_11), (I_22, rocket.I_22), (I_33, rocket.I_33)):
+        columns[:, column] = _values(function, time)
+        columns[:, column + 3] = np.gradient(columns[:, column], time)
+    columns[:, THRUST] = _values(rocket.motor.thrust, time)
+
+    # per surface: cp to centre of dry mass, radius and (lift slope, roll forcing, roll damping)
+    surfaces = []
+    for surface, position in rocket.aerodynamic_surfaces:
+        cpz = (position - rocket.center_of_dry_mass_position) * rocket._csys - surface.cpz
+        coefficients = np.zeros((len(mach), 3))
+        # cl is linear in the angle of attack for every rocketpy surface
+        coefficients[:, 0] = [surface.cl.get_value_opt(1, m) for m in mach]
+        roll_parameters = getattr(surface, "roll_parameters", None)
+        if roll_parameters is not None:
+            clf_delta, cld_omega, cant_angle = roll_parameters
+            coefficients[:, 1] = _values(clf_delta, mach) * cant_angle
+            coefficients[:, 2] = _values(cld_omega, mach)
+        surfaces.append((cpz, surface.rocket_radius, coefficients))
+
+    nozzle = rocket.nozzle_gyration_tensor
+    return {
+        "time": columns,
+        "drag": np.column_stack([_values(rocket.power_on_drag, mach), _values(rocket.power_off_drag, mach)]),
+        "surfaces": surfaces,
+        "area": rocket.area,
+        "dry_mass": rocket.dry_mass,
+        "burn_out_time": rocket.motor.burn_out_time,
+        "nozzle_to_cdm": rocket.nozzle_to_cdm,
+        "nozzle_gyration": np.array([nozzle[0][0], nozzle[1][1], nozzle[2][2]], dtype=float),
+        "parachutes": list(rocket.parachutes),
+    }
+
+
+def environment_table(env, altitudes=ALTITUDES):
+    # atmosphere of one rocketpy Environment, taken at once (stochastic environments
+    # mutate the same object on every create_object)
+    functions = (env.density, env.wind_velocity_x, env.wind_velocity_y, env.speed_of_sound,
+                 env.gravity, env.pressure)
+    return {
+        "elevation": float(env.elevation),
+        "table": np.column_stack([_values(function, altitudes) for function in functions]),
+    }
+
+
+def effective_rail_length(rocket, rail_length):
+    # as Flight.effective_1rl, rail length minus the nozzle to upper button distance
+    nozzle = rocket.nozzle_position
+    if rocket.rail_buttons:
+        rail_buttons = rocket.rail_buttons[0]
+        upper_button = rail_buttons.component.buttons_distance * rocket._csys + rail_buttons.position
+    else:
+        upper_button = nozzle
+    return rail_length - abs(nozzle - upper_button)
+
+
+class BatchFlight:
+    # rockets: N rocketpy Rockets (repeats of the same object are tabulated once),
+    # environments: one Environment or N (Environments or environment_table dicts),
+    # rail_length, inclination, heading: scalars or (N,) arrays,
+    # descent_rockets: N Rockets flown from apogee on (their parachutes are used), as the
+    # Nimbus Descent flights, otherwise the ascent rocket's parachutes are used,
+    # parachutes: N lists of Parachutes replacing the rockets' ones per sample (the rockets
+    # are tabulated once however many parachute draws there are)
+    def __init__(
+        self,
+        rockets,
+        environments,
+        rail_length=12,
+        inclination=86,
+        heading=0,
+        descent_rockets=None,
+        parachutes=None,
+        terminate_on_apogee=False,
+        max_time=600,
+        time_step=0.02,
+        descent_time_step=0.1,
+        altitudes=ALTITUDES,
+        seed=None,
+    ):
+        rockets = list(rockets)
+        n = self.n = len(rockets)
+        self.terminate_on_apogee = terminate_on_apogee
+        self.max_time = max_time
+        self.time_step = time_step
+        self.descent_time_step = descent_time_step
+        self.rng = np.random.default_rng(seed)
+
+        # rocket tables, rows 0..n-1 ascent, n..2n-1 descent
+        stages = rockets + (list(descent_rockets) if descent_rockets is not None else [])
+        burn_out = max(rocket.motor.burn_out_time for rocket in stages)
+        self.time = np.arange(0, burn_out + 0.5 + TIME_STEP, TIME_STEP)
+        tabulated = {}
+        for rocket in stages:
+            if id(rocket) not in tabulated:
+                tabulated[id(rocket)] = rocket_tables(rocket, self.time)
+        tables = [tabulated[id(rocket)] for rocket in stages]
+        self.descent_offset = n if descent_rockets is not None else 0
+
+        self.time_table = np.array([table["time"] for table in tables])
+        self.drag = np.array([table["drag"] for table in tables])
+        self.area = np.array([table["area"] for table in tables])
+        self.dry_mass = np.array([table["dry_mass"] for table in tables])
+        self.burn_out_time = np.array([table["burn_out_time"] for table in tables])
+        self.nozzle_to_cdm = np.array([table["nozzle_to_cdm"] for table in tables])
+        self.nozzle_gyration = np.array([table["nozzle_gyration"] for table in tables])
+
+        # surfaces padded to the largest count (zero area surfaces add nothing)
+        n_surfaces = max(len(table["surfaces"]) for table in tables)
+        self.surface_cpz = np.zeros((len(tables), n_surfaces))
+        self.surface_radius = np.zeros((len(tables), n_surfaces))
+        self.surface_coefficients = np.zeros((len(tables), len(MACH), n_surfaces, 3))
+        for row, table in enumerate(tables):
+            for s, (cpz, radius, coefficients) in enumerate(table["surfaces"]):
+                self.surface_cpz[row, s] = cpz
+                self.surface_radius[row, s] = radius
+                self.surface_coefficients[row, :, s] = coefficients
+
+        # parachutes of the rows the samples fall with, in slots
+        parachute_rows = range(self.descent_offset, self.descent_offset + n)
+        self.parachutes = [tables[row]["parachutes"] for row in parachute_rows] if parachutes is None else list(parachutes)
+        n_slots = max((len(parachutes) for parachutes in self.parachutes), default=0)
+        self.n_slots = n_slots
+        self.cd_s = np.zeros((n, n_slots))
+        self.lag = np.zeros((n, n_slots))
+        self.sampling_rate = np.ones((n, n_slots))
+        self.noise = np.zeros((n, n_slots, 3))  # mean, std, correlation
+        self.trigger_altitude = np.full((n, n_slots), np.nan)  # m above the pad, numeric triggers
+        self.has_parachute = np.zeros((n, n_slots), dtype=bool)
+        for i, parachutes in enumerate(self.parachutes):
+            for slot, parachute in enumerate(parachutes):
+                self.cd_s[i, slot] = parachute.cd_s
+                self.lag[i, slot] = parachute.lag
+                self.sampling_rate[i, slot] = parachute.sampling_rate
+                self.noise[i, slot] = (parachute.noise_bias, parachute.noise_deviation, parachute.noise_corr[0])
+                self.has_parachute[i, slot] = True
+                if isinstance(parachute.trigger, (int, float)):
+                    self.trigger_altitude[i, slot] = parachute.trigger
+        # samples sharing a trigger function are evaluated together, the numeric (altitude)
+        # triggers all in one group whatever their altitude
+        self.trigger_groups = []
+        for slot in range(n_slots):
+            groups = {}
+            for i, parachutes in enumerate(self.parachutes):
+                if slot < len(parachutes):
+                    parachute = parachutes[slot]
+                    trigger = ALTITUDE_TRIGGER if isinstance(parachute.trigger, (int, float)) else parachute.triggerfunc
+                    groups.setdefault(trigger, []).append(i)
+            self.trigger_groups.append([(trigger, np.array(members)) for trigger, members in groups.items()])
+        self._scalar_triggers = set()
+
+        # atmosphere, one table per environment
+        if hasattr(environments, "density"):
+            environments = [environments]
+        atmospheres = [
+            environment if isinstance(environment, dict) else environment_table(environment, altitudes)
+            for environment in environments
+        ]
+        self.altitudes = np.asarray(altitudes, dtype=float)
+        self.altitude_step = self.altitudes[1] - self.altitudes[0]
+        self.atmosphere = np.array([atmosphere["table"] for atmosphere in atmospheres])
+        self.env_row = np.arange(n) if len(atmospheres) == n else np.zeros(n, dtype=np.intp)
+        self.elevation = np.array([atmosphere["elevation"] for atmosphere in atmospheres])[self.env_row]
+
+        # launch states on the rail, as Flight
+        self.rail_length = np.broadcast_to(np.asarray(rail_length, dtype=float), (n,))
+        self.effective_rail_length = np.array([
+            effective_rail_length(rocket, length) for rocket, length in zip(rockets, self.rail_length)
+        ])
+        self.inclination = np.broadcast_to(np.asarray(inclination, dtype=float), (n,))
+        self.heading = np.broadcast_to(np.asarray(heading, dtype=float), (n,))
+        psi = -np.radians(self.heading)
+        theta = np.radians(self.inclination - 90)
+        self.initial_states = np.zeros((n, 13))
+        self.initial_states[:, 2] = self.elevation
+        self.initial_states[:, 6] = np.cos(psi / 2) * np.cos(theta / 2)
+        self.initial_states[:, 7] = np.cos(psi / 2) * np.sin(theta / 2)
+        self.initial_states[:, 8] = np.sin(psi / 2) * np.sin(theta / 2)
+        self.initial_states[:, 9] = np.sin(psi / 2) * np.cos(theta / 2)
+
+    @classmethod
+    def from_stochastic(cls, n, stochastic_rocket, stochastic_environment, stochastic_flight,
+                        stochastic_descent=None, altitudes=ALTITUDES, **kwargs):
+        # n samples drawn from the NimbusMonteCarlo stochastic models, without flying them
+        rockets, descent_rockets, environments = [], [], []
+        rail_length, inclination, heading = [], [], []
+        for _ in range(n):
+            rockets.append(stochastic_rocket.create_object())
+            if stochastic_descent is not None:
+                descent_rockets.append(stochastic_descent.create_object())
+            environments.append(environment_table(stochastic_environment.create_object(), altitudes))
+            rail_length.append(stochastic_flight._randomize_rail_length())
+            inclination.append(stochastic_flight._randomize_inclination())
+            heading.append(stochastic_flight._randomize_heading())
+        return cls(
+            rockets,
+            environments,
+            rail_length=np.array(rail_length),
+            inclination=np.array(inclination),
+            heading=np.array(heading),
+            descent_rockets=descent_rockets if stochastic_descent is not None else None,
+            altitudes=altitudes,
+            **kwargs,
+        )
+
+    # equations of motion, u: (m, 13) states of the samples `idx` in one phase
+
+    def _atmosphere(self, idx, z, columns=slice(None)):
+        index = (z - self.altitudes[0]) / self.altitude_step
+        return _lookup(self.atmosphere[:, :, columns], self.env_row[idx], index)
+
+    def _rail(self, t, u, idx):
+        rows = self.row[idx]
+        _, _, z, vx, vy, vz, e0, e1, e2, e3 = u[:, :10].T
+        tt = _lookup(self.time_table, rows, t / TIME_STEP)
+        atm = self._atmosphere(idx, z)
+        speed = np.sqrt((atm[:, WIND_X] - vx) ** 2 + (atm[:, WIND_Y] - vy) ** 2 + vz**2)
+        drag = _lookup(self.drag, rows, speed / atm[:, SPEED_OF_SOUND] / (MACH[1] - MACH[0]))[:, 0]
+        R3 = -0.5 * atm[:, DENSITY] * speed**2 * self.area[rows] * drag
+        a3 = (R3 + tt[:, THRUST]) / tt[:, MASS] - (e0**2 - e1**2 - e2**2 + e3**2) * atm[:, GRAVITY]
+        a3 = np.maximum(a3, 0)  # held on the rail until the thrust beats the weight
+        du = np.zeros_like(u)
+        du[:, 0:3] = u[:, 3:6]
+        du[:, 3] = 2 * (e1 * e3 + e0 * e2) * a3
+        du[:, 4] = 2 * (e2 * e3 - e0 * e1) * a3
+        du[:, 5] = (1 - 2 * (e1**2 + e2**2)) * a3
+        return du
+
+    def _flying(self, t, u, idx):
+        # Flight.u_dot_generalized with diagonal inertia and r_CM along the rocket axis
+        rows = self.row[idx]
+        x, y, z, vx, vy, vz, e0, e1, e2, e3, w1, w2, w3 = u.T
+        tt = _lookup(self.time_table, rows, t / TIME_STEP)
+        m, m_dot, m_ddot = tt[:, MASS], tt[:, MASS_DOT], tt[:, MASS_DDOT]
+        rc, rc_dot, rc_ddot = tt[:, R_CM], tt[:, R_CM_DOT], tt[:, R_CM_DDOT]
+        I1, I2, I3 = tt[:, I_11], tt[:, I_22], tt[:, I_33]
+        thrust = tt[:, THRUST]
+
+        # body to inertial rotation (Matrix.transformation)
+        a11, a12, a13 = 1 - 2 * (e2**2 + e3**2), 2 * (e1 * e2 - e0 * e3), 2 * (e1 * e3 + e0 * e2)
+        a21, a22, a23 = 2 * (e1 * e2 + e0 * e3), 1 - 2 * (e1**2 + e3**2), 2 * (e2 * e3 - e0 * e1)
+        a31, a32, a33 = 2 * (e1 * e3 - e0 * e2), 2 * (e2 * e3 + e0 * e1), 1 - 2 * (e1**2 + e2**2)
+
+        # drag
+        atm = self._atmosphere(idx, z)
+        rho, sound, g = atm[:, DENSITY], atm[:, SPEED_OF_SOUND], atm[:, GRAVITY]
+        speed = np.sqrt((atm[:, WIND_X] - vx) ** 2 + (atm[:, WIND_Y] - vy) ** 2 + vz**2)
+        drag = _lookup(self.drag, rows, speed / sound / (MACH[1] - MACH[0]))
+        drag = np.where(t < self.burn_out_time[rows], drag[:, 0], drag[:, 1])
+        R1, R2 = np.zeros(len(idx)), np.zeros(len(idx))
+        R3 = -0.5 * rho * speed**2 * self.area[rows] * drag
+        M1, M2, M3 = np.zeros(len(idx)), np.zeros(len(idx)), np.zeros(len(idx))
+
+        # lift and roll moment of every surface, at its own stream velocity
+        vBx = a11 * vx + a21 * vy + a31 * vz
+        vBy = a12 * vx + a22 * vy + a32 * vz
+        vBz = a13 * vx + a23 * vy + a33 * vz
+        for s in range(self.surface_cpz.shape[1]):
+            cpz, radius = self.surface_cpz[rows, s], self.surface_radius[rows, s]
+            area = np.pi * radius**2
+            wind = self._atmosphere(idx, z + a33 * cpz, slice(WIND_X, WIND_Y + 1))
+            sx = a11 * wind[:, 0] + a21 * wind[:, 1] - (vBx + w2 * cpz)
+            sy = a12 * wind[:, 0] + a22 * wind[:, 1] - (vBy - w1 * cpz)
+            sz = a13 * wind[:, 0] + a23 * wind[:, 1] - vBz
+            stream_speed = np.sqrt(sx**2 + sy**2 + sz**2)
+            coefficients = _lookup(self.surface_coefficients[:, :, s], rows,
+                                   stream_speed / sound / (MACH[1] - MACH[0]))
+            dynamic_pressure = 0.5 * rho * stream_speed**2 * area
+            lateral = np.sqrt(sx**2 + sy**2)
+            lifting = lateral > 0
+            lateral = np.where(lifting, lateral, 1)
+            attack_angle = np.arccos(np.clip(-sz / np.where(lifting, stream_speed, 1), -1, 1))
+            lift = np.where(lifting, dynamic_pressure * coefficients[:, 0] * attack_angle, 0)
+            lift_x, lift_y = lift * sx / lateral, lift * sy / lateral
+            R1 += lift_x
+            R2 += lift_y
+            M1 -= (cpz + rc) * lift_y
+            M2 += (cpz + rc) * lift_x
+            M3 += dynamic_pressure * 2 * radius * coefficients[:, 1]
+            M3 -= 0.5 * rho * stream_speed * area * (2 * radius) ** 2 * coefficients[:, 2] * w3 / 2
+
+        # T20 (forces) and T21 (moments) of u_dot_generalized, written out per component
+        weight_x, weight_y, weight_z = -m * g * a31, -m * g * a32, -m * g * a33
+        mrc = m * rc
+        nozzle_arm = self.nozzle_to_cdm[rows] - rc
+        T03 = 2 * m_dot * nozzle_arm - 2 * m * rc_dot
+        T04 = thrust - m * rc_ddot - 2 * m_dot * rc_dot + m_ddot * nozzle_arm
+        T20x = -w1 * mrc * w3 + w2 * T03 + weight_x + R1
+        T20y = -w2 * mrc * w3 - w1 * T03 + weight_y + R2
+        T20z = mrc * (w1**2 + w2**2) + T04 + weight_z + R3
+        S = self.nozzle_gyration[rows]
+        T21x = (I2 - I3) * w2 * w3 + (m_dot * S[:, 0] - tt[:, I_11_DOT]) * w1 - weight_y * rc + M1
+        T21y = (I3 - I1) * w3 * w1 + (m_dot * S[:, 1] - tt[:, I_22_DOT]) * w2 + weight_x * rc + M2
+        T21z = (I1 - I2) * w1 * w2 + (m_dot * S[:, 2] - tt[:, I_33_DOT]) * w3 + M3
+
+        du = np.empty_like(u)
+        w1_dot = (T21x + T20y * rc) / (I1 - m * rc**2)
+        w2_dot = (T21y - T20x * rc) / (I2 - m * rc**2)
+        w3_dot = T21z / I3
+        Lx, Ly, Lz = T20x / m + rc * w2_dot, T20y / m - rc * w1_dot, T20z / m
+        du[:, 0:3] = u[:, 3:6]
+        du[:, 3] = a11 * Lx + a12 * Ly + a13 * Lz
+        du[:, 4] = a21 * Lx + a22 * Ly + a23 * Lz
+        du[:, 5] = a31 * Lx + a32 * Ly + a33 * Lz
+        du[:, 6] = 0.5 * (-w1 * e1 - w2 * e2 - w3 * e3)
+        du[:, 7] = 0.5 * (w1 * e0 + w3 * e2 - w2 * e3)
+        du[:, 8] = 0.5 * (w2 * e0 - w3 * e1 + w1 * e3)
+        du[:, 9] = 0.5 * (w3 * e0 + w2 * e1 - w1 * e2)
+        du[:, 10], du[:, 11], du[:, 12] = w1_dot, w2_dot, w3_dot
+        return du
+
+    def _parachute(self, t, u, idx):
+        # Flight.u_dot_parachute, 3-DOF with the canopy's added mass
+        z, vx, vy, vz = u[:, 2:6].T
+        atm = self._atmosphere(idx, z)
+        rho = atm[:, DENSITY]
+        mp = self.dry_mass[self.row[idx]]
+        ma = rho * PARACHUTE_ADDED_MASS_VOLUME
+        fx, fy = vx - atm[:, WIND_X], vy - atm[:, WIND_Y]
+        pseudo_drag = -0.5 * rho * self.parachute_cd_s[idx] * np.sqrt(fx**2 + fy**2 + vz**2)
+        du = np.zeros_like(u)
+        du[:, 0:3] = u[:, 3:6]
+        du[:, 3] = pseudo_drag * fx / (mp + ma)
+        du[:, 4] = pseudo_drag * fy / (mp + ma)
+        du[:, 5] = (pseudo_drag * vz - 9.8 * mp) / (mp + ma)
+        return du
+
+    def _derivatives(self, t, u, groups):
+        du = np.zeros_like(u)
+        for equations, idx in zip((self._rail, self._flying, self._parachute), groups):
+            if len(idx):
+                du[idx] = equations(t, u[idx], idx)
+        return du
+
+    # events
+
+    def _triggers(self, t, t_new, u):
+        # parachute triggers of the samples crossing one of their sampling instants
+        for slot in range(self.n_slots):
+            rate = self.sampling_rate[:, slot]
+            sampled = (
+                self.pending[:, slot]
+                & ((self.phase == FLYING) | (self.phase == PARACHUTE))
+                & (np.floor(t_new * rate) > np.floor(t * rate))
+            )
+            if not sampled.any():
+                continue
+            # pressure noise, first order autoregressive as Parachute.noise_function
+            mean, std, correlation = self.noise[:, slot].T
+            draw = self.rng.normal(mean, np.maximum(std, 0))
+            noise = correlation * self.noise_signal[:, slot] + np.sqrt(1 - correlation**2) * draw
+            self.noise_signal[:, slot] = np.where(sampled, noise, self.noise_signal[:, slot])
+
+            for trigger, members in self.trigger_groups[slot]:
+                idx = members[sampled[members]]
+                if not len(idx):
+                    continue
+                atm = self._atmosphere(idx, u[idx, 2])
+                pressure = atm[:, PRESSURE] + self.noise_signal[idx, slot]
+                # barometric height of the noisy pressure, linearised around the true one
+                height = (u[idx, 2] - self.elevation[idx]
+                          - self.noise_signal[idx, slot] / (atm[:, DENSITY] * atm[:, GRAVITY]))
+                if trigger == ALTITUDE_TRIGGER:
+                    # Parachute's trigger for a number, descending below it
+                    fired = (u[idx, 5] < 0) & (height < self.trigger_altitude[idx, slot])
+                else:
+                    fired = self._evaluate_trigger(trigger, pressure, height, u[idx])
+                fired_idx = idx[fired]
+                self.pending[fired_idx, slot] = False
+                self.trigger_time[fired_idx, slot] = t_new
+                self.deploy_time[fired_idx, slot] = t_new + self.lag[fired_idx, slot]
+
+    def _evaluate_trigger(self, trigger, pressure, height, states):
+        # array safe triggers are called once for the group, scalar ones (the Nimbus
+        # "True if y[5] < 0 else False") once per sample
+        if trigger not in self._scalar_triggers:
+            try:
+                fired = np.broadcast_to(np.asarray(trigger(pressure, height, states.T), dtype=bool), (len(states),))
+                return fired.copy()
+            except (ValueError, TypeError):
+                self._scalar_triggers.add(trigger)
+        return np.array([bool(trigger(p, h, y)) for p, h, y in zip(pressure, height, states)], dtype=bool)
+
+    def _events(self, t, u, t_new, u_new):
+        h = t_new - t
+
+        # rail exit
+        rail = np.flatnonzero(self.phase == RAIL)
+        if len(rail):
+            distance = np.linalg.norm(u_new[rail, :3] - self.initial_states[rail, :3], axis=1)
+            out = rail[distance >= self.effective_rail_length[rail]]
+            if len(out):
+                before = np.linalg.norm(u[out, :3] - self.initial_states[out, :3], axis=1)
+                after = np.linalg.norm(u_new[out, :3] - self.initial_states[out, :3], axis=1)
+                f = ((self.effective_rail_length[out] - before) / np.maximum(after - before, 1e-12))[:, np.newaxis]
+                self.out_of_rail_time[out] = t + f[:, 0] * h
+                self.out_of_rail_velocity[out] = np.linalg.norm(u[out, 3:6] + f * (u_new[out, 3:6] - u[out, 3:6]), axis=1)
+                self.phase[out] = FLYING
+
+        # apogee
+        airborne = (self.phase == FLYING) | (self.phase == PARACHUTE)
+        apogee = np.flatnonzero(airborne & np.isnan(self.apogee_time) & (u[:, 5] > 0) & (u_new[:, 5] <= 0))
+        if len(apogee):
+            f = (u[apogee, 5] / (u[apogee, 5] - u_new[apogee, 5]))[:, np.newaxis]
+            state = u[apogee] + f * (u_new[apogee] - u[apogee])
+            self.apogee_time[apogee] = t + f[:, 0] * h
+            self.apogee_state[apogee] = state
+            if self.terminate_on_apogee:
+                self._finish(apogee, self.apogee_time[apogee], state)
+            elif self.descent_offset:
+                self.row[apogee] = apogee + self.descent_offset
+
+        # parachutes
+        if self.n_slots:
+            self._triggers(t, t_new, u_new)
+            deploying = (self.deploy_time <= t_new) & ~self.deployed & ((self.phase == FLYING) | (self.phase == PARACHUTE))[:, np.newaxis]
+            for i, slot in zip(*np.nonzero(deploying)):
+                self.deployed[i, slot] = True
+                self.phase[i] = PARACHUTE
+                self.parachute_cd_s[i] = self.cd_s[i, slot]
+
+        # landing
+        airborne = (self.phase == FLYING) | (self.phase == PARACHUTE)
+        landed = np.flatnonzero(airborne & (u_new[:, 2] < self.elevation) & (u_new[:, 5] < 0))
+        if len(landed):
+            f = ((u[landed, 2] - self.elevation[landed]) / (u[landed, 2] - u_new[landed, 2]))[:, np.newaxis]
+            self._finish(landed, t + f[:, 0] * h, u[landed] + f * (u_new[landed] - u[landed]))
+
+        if t_new >= self.max_time:
+            running = np.flatnonzero(self.phase != DONE)
+            self._finish(running, np.full(len(running), t_new), u_new[running])
+
+    def _finish(self, idx, time, state):
+        self.phase[idx] = DONE
+        self.t_final[idx] = time
+        self.final_state[idx] = state
+
+    def run(self, record_every=None):
+        # integrates every sample to landing (or apogee with terminate_on_apogee)
+        # returns a dict of (N,) arrays, plus the states every record_every steps
+        n = self.n
+        self.phase = np.full(n, RAIL)
+        self.row = np.arange(n)
+        self.parachute_cd_s = np.zeros(n)
+        self.pending = self.has_parachute.copy()
+        self.deployed = np.zeros_like(self.pending)
+        self.trigger_time = np.full((n, self.n_slots), np.nan)
+        self.deploy_time = np.full((n, self.n_slots), np.inf)
+        self.noise_signal = self.rng.normal(self.noise[..., 0], np.maximum(self.noise[..., 1], 0))
+        self.out_of_rail_time = np.full(n, np.nan)
+        self.out_of_rail_velocity = np.full(n, np.nan)
+        self.apogee_time = np.full(n, np.nan)
+        self.apogee_state = np.full((n, 13), np.nan)
+        self.t_final = np.full(n, np.nan)
+        self.final_state = np.full((n, 13), np.nan)
+        max_speed = np.zeros(n)
+
+        u, t, step = self.initial_states.copy(), 0.0, 0
+        records = []
+        while (self.phase != DONE).any():
+            h = self.time_step if (self.phase <= FLYING).any() else self.descent_time_step
+            h = min(h, self.max_time - t)
+            groups = [np.flatnonzero(self.phase == phase) for phase in (RAIL, FLYING, PARACHUTE)]
+            k1 = self._derivatives(t, u, groups)
+            k2 = self._derivatives(t + h / 2, u + h / 2 * k1, groups)
+            k3 = self._derivatives(t + h / 2, u + h / 2 * k2, groups)
+            k4 = self._derivatives(t + h, u + h * k3, groups)
+            u_new = u + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            u_new[:, 6:10] /= np.linalg.norm(u_new[:, 6:10], axis=1)[:, np.newaxis]
+            max_speed = np.where(self.phase != DONE, np.maximum(max_speed, np.linalg.norm(u_new[:, 3:6], axis=1)), max_speed)
+
+            self._events(t, u, t + h, u_new)
+            u, t, step = u_new, t + h, step + 1
+            if record_every and step % record_every == 0:
+                records.append((t, np.where((self.phase == DONE)[:, np.newaxis], self.final_state, u)))
+
+        return {
+            "apogee": self.apogee_state[:, 2],
+            "apogee_time": self.apogee_time,
+            "apogee_x": self.apogee_state[:, 0],
+            "apogee_y": self.apogee_state[:, 1],
+            "apogee_state": self.apogee_state,
+            "out_of_rail_time": self.out_of_rail_time,
+            "out_of_rail_velocity": self.out_of_rail_velocity,
+            "max_speed": max_speed,
+            "parachute_trigger_time": self.trigger_time,
+            "t_final": self.t_final,
+            "x_impact": self.final_state[:, 0],
+            "y_impact": self.final_state[:, 1],
+            "impact_velocity": self.final_state[:, 5],
+            "final_state": self.final_state,
+            "records": records,
+        }
+
+
+if __name__ == "__main__":
+    import time as timer
+
+    from rocketpy import Environment, Flight
+
+    from Nimbus import Nimbus, NimbusDescent
+
+    env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+    env.set_atmospheric_model(type="custom_atmosphere", wind_u=2, wind_v=3)
+
+    # reference, the nominal Ascent + Descent with rocketpy
+    start = timer.perf_counter()
+    Ascent = Flight(rocket=Nimbus, environment=env, rail_length=12, inclination=86, heading=0,
+                    terminate_on_apogee=True, name="Ascent")
+    Descent = Flight(rocket=NimbusDescent, environment=env, rail_length=12, inclination=0, heading=0,
+                     initial_solution=Ascent, name="Descent")
+    flight_time = timer.perf_counter() - start
+
+    nominal = BatchFlight([Nimbus], env, descent_rockets=[NimbusDescent], seed=0).run()
+    for label, batch, reference in (
+        ("apogee (m)", nominal["apogee"][0], Ascent.apogee),
+        ("apogee time (s)", nominal["apogee_time"][0], Ascent.apogee_time),
+        ("out of rail velocity (m/s)", nominal["out_of_rail_velocity"][0], Ascent.out_of_rail_velocity),
+        ("landing x (m)", nominal["x_impact"][0], Descent.x_impact),
+        ("landing y (m)", nominal["y_impact"][0], Descent.y_impact),
+        ("landing time (s)", nominal["t_final"][0], Descent.t_final),
+    ):
+        print(f"{label:<28} batch {batch:10.3f}  rocketpy {reference:10.3f}")
+
+    # throughput, dispersed launch angles
+    n = 500
+    rng = np.random.default_rng(0)
+    start = timer.perf_counter()
+    results = BatchFlight([Nimbus] * n, env, inclination=rng.normal(86, 1, n), heading=rng.normal(0, 2, n),
+                          descent_rockets=[NimbusDescent] * n, seed=0).run()
+    batch_time = timer.perf_counter() - start
+    print(f"{n} ascents + descents in {batch_time:.1f} s ({batch_time / n * 1000:.0f} ms per flight), "
+          f"rocketpy {flight_time:.1f} s per flight, {flight_time * n / batch_time:.0f}x")
+    print(f"apogee {np.mean(results['apogee']):.0f} +- {np.std(results['apogee']):.0f} m, "
+          f"landing spread {np.std(results['x_impact']):.0f} x {np.std(results['y_impact']):.0f} m")
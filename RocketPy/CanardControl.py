@@ -0,0 +1,323 @@
+# Closed loop roll control with the canards
+# The Nimbus variants fly the canards at fixed cant angles (0, 10, 12 deg). Here a controller
+# function commands the cant at a fixed rate (100 Hz by default) from sensed states:
+#   controller(time, sensed, gains, memory) -> commanded cant (deg)
+# sensed: {"time", "dt", "roll_rate" (rad/s), "roll_angle" (rad), "speed", "mach",
+# "dynamic_pressure", "altitude"}, gains: {name: value} of one gain set (or arrays, one entry
+# per gain set), memory: a dict the controller keeps its state in (integrators, ...). The
+# controller is written with numpy so the same function runs on one flight or a batch.
+# The actuator follows the command at a limited slew rate, between +-max_cant, with a trim
+# error (cant_offset) the loop has to reject.
+# The canard roll forcing / damping come from a cant x Mach table built once from the fin
+# geometry (RollStudy's coefficients), never from rebuilding the fin set:
+#  - simulate / RollTuner: roll only (RollStudy's I_33 dw3/dt = M3f - M3d with the exact
+#    exponential update) along the speed / altitude history of a flight, every gain set of
+#    a batch at once with numpy, batches split over a process pool,
+#  - closed_loop_flight: a full rocketpy Flight with the controller as a rocketpy discrete
+#    controller, each command swapping the canards' roll_parameters for the table's.
+#
+# usage:
+#   table = RollTable(RollStudy(Nimbus, canards, env))
+#   plant = RollPlant(table, Ascent)
+#   metrics = RollTuner(plant, pi_roll_controller).evaluate(gain_grid(kp=..., ki=..., target=[...]))
+#   Controlled = closed_loop_flight(Nimbus, canards, env, pi_roll_controller, best_gains, table=table)
+
+# imports
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from rocketpy import Flight, Function
+from rocketpy.control.controller import _Controller
+
+from RollStudy import MACH_GRID
+
+CANT_GRID = np.linspace(-20, 20, 161)  # deg, table rows (0.25 deg, the actuator resolution)
+CONTROL_RATE = 100  # Hz
+PLANT_STEP = 0.001  # s, roll only integration step
+MAX_CANT = 15  # deg
+CANT_RATE = 150  # deg/s, actuator slew rate
+Q_REFERENCE = 20000  # Pa, dynamic pressure the gains are tuned at (they are scheduled with 1/q)
+Q_MIN = 500  # Pa, below it the canards are held at zero
+
+
+def roll_angle(e0, e1, e2, e3):
+    # rotation about the body axis (rocketpy's body z), from the attitude quaternion
+    return np.arctan2(2 * (e0 * e3 + e1 * e2), 1 - 2 * (e2**2 + e3**2))
+
+
+class RollTable:
+    # roll forcing (N m per Pa) and damping (N m s per (kg/m^3 * m/s * rad)) of the rocket on
+    # a cant (deg) x Mach grid, from a RollStudy of the controlled fin set
+    def __init__(self, study, cant_grid=CANT_GRID, mach_grid=MACH_GRID):
+        self.cant_grid = np.asarray(cant_grid, dtype=float)
+        self.mach_grid = np.asarray(mach_grid, dtype=float)
+        self.forcing, self.damping = study.coefficients(self.cant_grid, self.mach_grid)
+
+    def lookup(self, cant, mach):
+        # bilinear lookup for arrays of cant (deg) and Mach
+        ci = np.clip((cant - self.cant_grid[0]) / (self.cant_grid[1] - self.cant_grid[0]), 0, len(self.cant_grid) - 1.000001)
+        mi = np.clip((mach - self.mach_grid[0]) / (self.mach_grid[1] - self.mach_grid[0]), 0, len(self.mach_grid) - 1.000001)
+        i, j = ci.astype(int), mi.astype(int)
+        wc, wm = ci - i, mi - j
+
+        def blend(table):
+            return ((table[i, j] * (1 - wm) + table[i, j + 1] * wm) * (1 - wc)
+                    + (table[i + 1, j] * (1 - wm) + table[i + 1, j + 1] * wm) * wc)
+
+        return blend(self.forcing), blend(self.damping)
+
+
+class RollPlant:
+    # speed, density, Mach and roll inertia along a flight (rail exit to apogee) on the
+    # plant step, plain arrays so it can be sent to the workers
+    def __init__(self, table, flight, rocket=None, step=PLANT_STEP):
+        rocket = flight.rocket if rocket is None else rocket
+        env = flight.env
+        self.table = table
+        self.step = step
+        self.time = np.arange(flight.out_of_rail_time, flight.apogee_time, step)
+        self.speed = np.asarray(flight.free_stream_speed(self.time), dtype=float)
+        self.altitude = np.asarray(flight.z(self.time), dtype=float)
+        self.density = np.asarray(env.density(self.altitude), dtype=float)
+        self.mach = self.speed / np.asarray(env.speed_of_sound(self.altitude), dtype=float)
+        self.I_33 = np.array([rocket.I_33.get_value_opt(t) for t in self.time])
+
+
+def gain_grid(**gains):
+    # every combination of the given gain values, {name: array}
+    names = list(gains)
+    grid = np.array(list(itertools.product(*(gains[name] for name in names))), dtype=float)
+    return {name: grid[:, k] for k, name in enumerate(names)}
+
+
+def pi_roll_controller(time, sensed, gains, memory):
+    # PI (+ D) on the roll rate error, gains["target"] in rad/s, kp / ki / kd in deg of cant
+    # per rad/s (/ s, * s) at Q_REFERENCE, scheduled with 1 / dynamic pressure
+    error = gains["target"] - sensed["roll_rate"]
+    scale = Q_REFERENCE / np.maximum(sensed["dynamic_pressure"], Q_MIN)
+    integral = memory.get("integral", 0) + error * sensed["dt"]
+    derivative = (error - memory.get("error", error)) / sensed["dt"]
+    command = scale * (gains["kp"] * error + gains["ki"] * integral + gains.get("kd", 0) * derivative)
+    # anti windup, the integrator stops where the command saturates
+    saturated = np.abs(command) > MAX_CANT
+    memory["integral"] = np.where(saturated, memory.get("integral", 0 * error), integral)
+    memory["error"] = error
+    return np.where(sensed["dynamic_pressure"] > Q_MIN, command, 0)
+
+
+def _actuate(cant, command, dt, max_cant, cant_rate):
+    command = np.clip(command, -max_cant, max_cant)
+    return cant + np.clip(command - cant, -cant_rate * dt, cant_rate * dt)
+
+
+def simulate(plant, controller, gains, rate=CONTROL_RATE, max_cant=MAX_CANT, cant_rate=CANT_RATE,
+             cant_offset=0.0, sensor_noise=0.0, seed=None):
+    # roll only closed loop of every gain set at once, gains: {name: (G,) array}
+    # returns the roll rate, roll angle and cant at the control samples, (G, samples)
+    rng = np.random.default_rng(seed)
+    gains = {name: np.asarray(value, dtype=float) for name, value in gains.items()}
+    n = len(next(iter(gains.values())))
+    omega, phi, cant, command = np.zeros(n), np.zeros(n), np.zeros(n), np.zeros(n)
+    memory = {}
+    every = max(int(round(1 / (rate * plant.step))), 1)
+    dt = every * plant.step
+    samples = {"time": [], "roll_rate": [], "roll_angle": [], "cant": []}
+    for k, t in enumerate(plant.time):
+        if k % every == 0:
+            sensed = {
+                "time": t,
+                "dt": dt,
+                "roll_rate": omega + sensor_noise * rng.standard_normal(n),
+                "roll_angle": phi,
+                "speed": plant.speed[k],
+                "mach": plant.mach[k],
+                "dynamic_pressure": 0.5 * plant.density[k] * plant.speed[k] ** 2,
+                "altitude": plant.altitude[k],
+            }
+            command = np.broadcast_to(controller(t, sensed, gains, memory), (n,))
+            for key, value in (("time", t), ("roll_rate", omega), ("roll_angle", phi), ("cant", cant)):
+                samples[key].append(np.copy(value))
+
+        cant = _actuate(cant, command, plant.step, max_cant, cant_rate)
+        forcing, damping = plant.table.lookup(cant + cant_offset, np.full(n, plant.mach[k]))
+        speed, rho = plant.speed[k], plant.density[k]
+        forcing = 0.5 * rho * speed**2 * forcing
+        damping = 0.5 * rho * speed * damping
+        steady = forcing / damping
+        decayed = steady + (omega - steady) * np.exp(-damping / plant.I_33[k] * plant.step)
+        phi = phi + 0.5 * (omega + decayed) * plant.step
+        omega = decayed
+    return {key: np.array(value).T if key != "time" else np.array(value) for key, value in samples.items()}
+
+
+def roll_metrics(result, gains, settle_band=0.1):
+    # per gain set: rms rate error, peak |roll rate|, settling time into the band (fraction
+    # of the target, or rad/s for a zero target) and actuator travel (deg)
+    target = np.asarray(gains["target"], dtype=float)[:, np.newaxis]
+    error = result["roll_rate"] - target
+    band = np.where(target != 0, settle_band * np.abs(target), settle_band)
+    outside = np.abs(error) > band
+    last_outside = np.where(outside.any(axis=1), outside.shape[1] - 1 - np.argmax(outside[:, ::-1], axis=1), 0)
+    return {
+        "rms_error": np.sqrt(np.mean(error**2, axis=1)),
+        "peak_roll_rate": np.abs(result["roll_rate"]).max(axis=1),
+        "settling_time": result["time"][np.minimum(last_outside, len(result["time"]) - 1)] - result["time"][0],
+        "cant_travel": np.abs(np.diff(result["cant"], axis=1)).sum(axis=1),
+    }
+
+
+def _evaluate_chunk(plant, controller, gains, options):
+    # worker: closed loops and metrics of one chunk of gain sets
+    result = simulate(plant, controller, gains, **options)
+    return roll_metrics(result, gains)
+
+
+class RollTuner:
+    # plant: RollPlant, controller: a module level controller function (sent to the
+    # workers by name), options: simulate's keyword arguments
+    def __init__(self, plant, controller, max_workers=None, chunk_size=256, **options):
+        self.plant = plant
+        self.controller = controller
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.options = options
+
+    def evaluate(self, gains):
+        # metrics of every gain set, {name: (G,)} merged with the gains
+        n = len(next(iter(gains.values())))
+        chunks = [
+            {name: np.asarray(value)[start:start + self.chunk_size] for name, value in gains.items()}
+            for start in range(0, n, self.chunk_size)
+        ]
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(_evaluate_chunk, self.plant, self.controller, chunk, self.options) for chunk in chunks]
+            results = [future.result() for future in futures]
+        metrics = {name: np.concatenate([result[name] for result in results]) for name in results[0]}
+        metrics.update({name: np.asarray(value) for name, value in gains.items()})
+        return metrics
+
+    @staticmethod
+    def best(metrics, key="rms_error", top=5):
+        order = np.argsort(metrics[key])[:top]
+        names = [name for name in metrics if name not in ("rms_error", "peak_roll_rate", "settling_time", "cant_travel")]
+        print(" ".join(f"{name:>8}" for name in names) + f" {'rms (rad/s)':>12} {'peak (rad/s)':>13} {'settle (s)':>11} {'travel (deg)':>13}")
+        for i in order:
+            print(" ".join(f"{metrics[name][i]:>8.3g}" for name in names)
+                  + f" {metrics['rms_error'][i]:>12.3f} {metrics['peak_roll_rate'][i]:>13.2f}"
+                  + f" {metrics['settling_time'][i]:>11.2f} {metrics['cant_travel'][i]:>13.0f}")
+        return order
+
+
+class CanardActuator:
+    # the canards' roll_parameters driven from the table: forcing with the commanded cant,
+    # damping from the Function of the nearest table row (built once)
+    def __init__(self, canards, table, max_cant=MAX_CANT, cant_rate=CANT_RATE, cant_offset=0.0):
+        self.canards = canards
+        self.table = table
+        self.max_cant = max_cant
+        self.cant_rate = cant_rate
+        self.cant_offset = cant_offset
+        self.cant = 0.0
+        self.original = canards.roll_parameters
+        clf_delta, cld_omega, cant_rad = canards.roll_parameters
+        cld_zero = np.array([cld_omega.get_value_opt(m) for m in table.mach_grid]) / np.cos(cant_rad)
+        self.clf_delta = clf_delta
+        self.damping = [
+            Function(np.column_stack([table.mach_grid, cld_zero * np.cos(np.radians(cant))]),
+                     interpolation="linear", extrapolation="constant")
+            for cant in table.cant_grid
+        ]
+        self.set(0.0, 0.0)
+
+    def set(self, command, dt):
+        self.cant = float(_actuate(self.cant, command, dt, self.max_cant, self.cant_rate))
+        cant = self.cant + self.cant_offset
+        row = int(np.clip(np.rint((cant - self.table.cant_grid[0]) / (self.table.cant_grid[1] - self.table.cant_grid[0])),
+                          0, len(self.table.cant_grid) - 1))
+        self.canards.roll_parameters = [self.clf_delta, self.damping[row], np.radians(cant)]
+
+    def restore(self):
+        self.canards.roll_parameters = self.original
+
+
+def closed_loop_flight(rocket, canards, env, controller, gains, table, rate=CONTROL_RATE,
+                       max_cant=MAX_CANT, cant_rate=CANT_RATE, cant_offset=0.0, **flight_kwargs):
+    # rocketpy Flight of the rocket with the controller on its canards, gains: one gain
+    # set {name: value}; the observed variables are [time, roll rate, cant]
+    actuator = CanardActuator(canards, table, max_cant, cant_rate, cant_offset)
+    memory = {}
+
+    def controller_function(time, sampling_rate, state, state_history, observed_variables, interactive_objects):
+        x, y, z, vx, vy, vz, e0, e1, e2, e3, w1, w2, w3 = state
+        wind_x, wind_y = env.wind_velocity_x.get_value_opt(z), env.wind_velocity_y.get_value_opt(z)
+        speed = ((vx - wind_x) ** 2 + (vy - wind_y) ** 2 + vz**2) ** 0.5
+        sensed = {
+            "time": time,
+            "dt": 1 / sampling_rate,
+            "roll_rate": w3,
+            "roll_angle": roll_angle(e0, e1, e2, e3),
+            "speed": speed,
+            "mach": speed / env.speed_of_sound.get_value_opt(z),
+            "dynamic_pressure": 0.5 * env.density.get_value_opt(z) * speed**2,
+            "altitude": z,
+        }
+        command = float(controller(time, sensed, gains, memory)) if vz > 0 else 0.0
+        actuator.set(command, 1 / sampling_rate)
+        return [time, w3, actuator.cant]
+
+    control = _Controller(
+        interactive_objects=actuator, controller_function=controller_function,
+        sampling_rate=rate, name="Canard roll control",
+    )
+    rocket._controllers.append(control)
+    try:
+        flight_kwargs.setdefault("name", "Closed loop")
+        return Flight(rocket=rocket, environment=env, **flight_kwargs)
+    finally:
+        rocket._controllers.remove(control)
+        actuator.restore()
+
+
+if __name__ == "__main__":
+    import time as timer
+
+    from rocketpy import Environment
+
+    from Nimbus import Nimbus, canards
+    from RollStudy import RollStudy
+
+    env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+    env.set_atmospheric_model(type="custom_atmosphere", wind_u=2, wind_v=3)
+    flight_kwargs = dict(rail_length=12, inclination=86, heading=0, terminate_on_apogee=True)
+    Ascent = Flight(rocket=Nimbus, environment=env, name="Ascent", **flight_kwargs)
+
+    table = RollTable(RollStudy(Nimbus, canards, env))
+    plant = RollPlant(table, Ascent)
+
+    # hold the roll against a 2 deg canard trim error
+    target, cant_offset = 0.0, 2.0
+    open_loop = simulate(plant, pi_roll_controller, {"kp": [0], "ki": [0], "target": [target]}, cant_offset=cant_offset)
+    print(f"open loop, peak roll rate {np.abs(open_loop['roll_rate']).max():.2f} rad/s")
+    gains = gain_grid(kp=np.logspace(-2, 1, 12), ki=np.logspace(-2, 1, 12), target=[target])
+    start = timer.perf_counter()
+    metrics = RollTuner(plant, pi_roll_controller, cant_offset=cant_offset).evaluate(gains)
+    print(f"{len(gains['kp'])} gain sets, roll only closed loops at {CONTROL_RATE} Hz in "
+          f"{timer.perf_counter() - start:.2f} s")
+    best = RollTuner.best(metrics)[0]
+    best_gains = {name: float(gains[name][best]) for name in gains}
+
+    # the best gains in a full rocketpy flight
+    start = timer.perf_counter()
+    Controlled = closed_loop_flight(Nimbus, canards, env, pi_roll_controller, best_gains, table,
+                                    cant_offset=cant_offset, **flight_kwargs)
+    print(f"6-DOF closed loop flight in {timer.perf_counter() - start:.1f} s, apogee "
+          f"{Controlled.apogee - env.elevation:.0f} m AGL (uncontrolled {Ascent.apogee - env.elevation:.0f} m)")
+    observed = np.array(Controlled.get_controller_observed_variables())
+    roll_only = simulate(plant, pi_roll_controller, {name: [value] for name, value in best_gains.items()},
+                         cant_offset=cant_offset)
+    for t in (3, 6, 10, 15, 20):
+        k = np.argmin(np.abs(observed[:, 0] - t))
+        j = np.argmin(np.abs(roll_only["time"] - t))
+        print(f"t = {t:>2} s  roll rate 6-DOF {observed[k, 1]:6.2f} / roll only {roll_only['roll_rate'][0, j]:6.2f} rad/s, "
+              f"cant {observed[k, 2]:5.2f} / {roll_only['cant'][0, j]:5.2f} deg")
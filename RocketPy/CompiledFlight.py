@@ -0,0 +1,405 @@
+# Flattened equations of motion for a fixed configuration
+# For one rocket in one environment (Nimbus: Thanos_R, nose, fins, canards, tail) the
+# generic Flight.u_dot_generalized walks the aerodynamic surface list and calls rocketpy
+# Functions (mass, inertia, centre of mass, thrust, drag, lift, roll, atmosphere), some of
+# them differentiated on the fly, at every evaluation. compile_configuration() flattens all
+# of it once into contiguous arrays on uniform grids (the tables of BatchFlight.py, the time
+# table also has a node on every point of the motor's curves):
+#   time table (t, 13)  mass, mass flow and its derivative, r_CM and derivatives, inertia
+#                       and its derivative, thrust
+#   drag (Mach, 2), surfaces (cpz, radius, (Mach, 3 * surfaces) lift/roll coefficients),
+#   atmosphere (altitude, 6)
+# and one specialised derivative routine on scalars reads them. With numba installed the
+# routines are compiled (njit, cached on disk), without it they run as plain Python, which
+# is still several times cheaper than the Function calls.
+# CompiledFlight integrates the rail and 6-DOF phases with the same integrator and
+# tolerances as Flight (LSODA, rtol 1e-6) to apogee or to the ground (ballistic, no
+# parachutes, descents are BatchFlight's job).
+#
+# usage:
+#   configuration = compile_configuration(Nimbus, env)
+#   Ascent = CompiledFlight(configuration, rail_length=12, inclination=86, heading=0)
+#   Ascent.apogee, Ascent.out_of_rail_velocity, Ascent.get_solution_at_time(10)
+
+# imports
+import math
+
+import numpy as np
+from scipy.integrate import solve_ivp
+
+from BatchFlight import ALTITUDES, MACH, effective_rail_length, environment_table, rocket_tables
+from StabilityMap import TANK_CURVES
+
+try:
+    import numba
+
+    jit = numba.njit(cache=True)
+except ImportError:  # plain Python, same code
+    numba = None
+
+    def jit(function):
+        return function
+
+
+NUMBA = numba is not None
+
+# rocketpy's Flight defaults
+RTOL = 1e-6
+ATOL = 6 * [1e-3] + 4 * [1e-6] + 3 * [1e-3]
+
+# agreement with rocketpy's Flight the benchmark below checks: Flight itself moves the Nimbus
+# apogee by 0.55 m between rtol 1e-6 and 1e-7
+APOGEE_TOLERANCE = 0.5  # m
+POSITION_TOLERANCE = 0.5  # m, along the ascent
+DERIVATIVE_TOLERANCE = 2e-3  # 95th percentile of the relative derivative difference
+
+# columns of the time table (as BatchFlight)
+MASS, MASS_DOT, MASS_DDOT, R_CM, R_CM_DOT, R_CM_DDOT = range(6)
+I_11, I_22, I_33, I_11_DOT, I_22_DOT, I_33_DOT, THRUST = range(6, 13)
+DENSITY, WIND_X, WIND_Y, SPEED_OF_SOUND, GRAVITY, PRESSURE = range(6)
+# constants vector
+AREA, BURN_OUT_TIME, NOZZLE_TO_CDM, S_11, S_22, S_33, ALTITUDE_0, ALTITUDE_STEP, MACH_STEP, TIME_STEP = range(10)
+
+# finer than BatchFlight's, the Thanos_R thrust curve has a point every ~7 ms
+COMPILED_TIME_STEP = 0.001
+
+
+@jit
+def _interp(table, index, column):
+    # linear interpolation at a fractional row index of a uniform grid table, held at the ends
+    last = table.shape[0] - 1
+    if index <= 0:
+        return table[0, column]
+    if index >= last:
+        return table[last, column]
+    k = int(index)
+    w = index - k
+    return table[k, column] * (1 - w) + table[k + 1, column] * w
+
+
+@jit
+def _time_index(t, time, buckets, step):
+    # fractional row index of t in the time nodes (uniform grid plus curve points): the
+    # bucket of the uniform grid holds the last node before it, a few curve points follow
+    last = time.shape[0] - 1
+    if t <= time[0]:
+        return 0.0
+    j = int(t / step)
+    if j >= buckets.shape[0]:
+        return float(last)
+    k = buckets[j]
+    while k > 0 and time[k] > t:
+        k -= 1
+    while k < last and time[k + 1] <= t:
+        k += 1
+    if k >= last:
+        return float(last)
+    return k + (t - time[k]) / (time[k + 1] - time[k])
+
+
+@jit
+def rail_u_dot(t, u, time_table, time_nodes, time_buckets, drag, atmosphere, constants):
+    # Flight.udot_rail1
+    z, vx, vy, vz, e0, e1, e2, e3 = u[2], u[3], u[4], u[5], u[6], u[7], u[8], u[9]
+    ti = _time_index(t, time_nodes, time_buckets, constants[TIME_STEP])
+    zi = (z - constants[ALTITUDE_0]) / constants[ALTITUDE_STEP]
+    rho = _interp(atmosphere, zi, DENSITY)
+    speed = math.sqrt((_interp(atmosphere, zi, WIND_X) - vx) ** 2 + (_interp(atmosphere, zi, WIND_Y) - vy) ** 2 + vz**2)
+    mach = speed / _interp(atmosphere, zi, SPEED_OF_SOUND)
+    R3 = -0.5 * rho * speed**2 * constants[AREA] * _interp(drag, mach / constants[MACH_STEP], 0)
+    a3 = (R3 + _interp(time_table, ti, THRUST)) / _interp(time_table, ti, MASS) - (
+        e0**2 - e1**2 - e2**2 + e3**2
+    ) * _interp(atmosphere, zi, GRAVITY)
+    du = np.zeros(13)
+    du[0], du[1], du[2] = vx, vy, vz
+    if a3 > 0:
+        du[3] = 2 * (e1 * e3 + e0 * e2) * a3
+        du[4] = 2 * (e2 * e3 - e0 * e1) * a3
+        du[5] = (1 - 2 * (e1**2 + e2**2)) * a3
+    return du
+
+
+@jit
+def u_dot(t, u, time_table, time_nodes, time_buckets, drag, surface_cpz, surface_radius, surface_coefficients,
+          atmosphere, constants):
+    # Flight.u_dot_generalized with diagonal inertia and r_CM along the rocket axis
+    x, y, z, vx, vy, vz, e0, e1, e2, e3, w1, w2, w3 = u[0], u[1], u[2], u[3], u[4], u[5], u[6], u[7], u[8], u[9], u[10], u[11], u[12]
+    ti = _time_index(t, time_nodes, time_buckets, constants[TIME_STEP])
+    m = _interp(time_table, ti, MASS)
+    m_dot = _interp(time_table, ti, MASS_DOT)
+    m_ddot = _interp(time_table, ti, MASS_DDOT)
+    rc = _interp(time_table, ti, R_CM)
+    rc_dot = _interp(time_table, ti, R_CM_DOT)
+    rc_ddot = _interp(time_table, ti, R_CM_DDOT)
+    I1 = _interp(time_table, ti, I_11)
+    I2 = _interp(time_table, ti, I_22)
+    I3 = _interp(time_table, ti, I_33)
+    thrust = _interp(time_table, ti, THRUST)
+
+    a11, a12, a13 = 1 - 2 * (e2**2 + e3**2), 2 * (e1 * e2 - e0 * e3), 2 * (e1 * e3 + e0 * e2)
+    a21, a22, a23 = 2 * (e1 * e2 + e0 * e3), 1 - 2 * (e1**2 + e3**2), 2 * (e2 * e3 - e0 * e1)
+    a31, a32, a33 = 2 * (e1 * e3 - e0 * e2), 2 * (e2 * e3 + e0 * e1), 1 - 2 * (e1**2 + e2**2)
+
+    # drag
+    altitude_0, altitude_step, mach_step = constants[ALTITUDE_0], constants[ALTITUDE_STEP], constants[MACH_STEP]
+    zi = (z - altitude_0) / altitude_step
+    rho = _interp(atmosphere, zi, DENSITY)
+    sound = _interp(atmosphere, zi, SPEED_OF_SOUND)
+    g = _interp(atmosphere, zi, GRAVITY)
+    speed = math.sqrt((_interp(atmosphere, zi, WIND_X) - vx) ** 2 + (_interp(atmosphere, zi, WIND_Y) - vy) ** 2 + vz**2)
+    drag_coefficient = _interp(drag, speed / sound / mach_step, 0 if t < constants[BURN_OUT_TIME] else 1)
+    R1, R2, R3 = 0.0, 0.0, -0.5 * rho * speed**2 * constants[AREA] * drag_coefficient
+    M1, M2, M3 = 0.0, 0.0, 0.0
+
+    # surfaces
+    vBx = a11 * vx + a21 * vy + a31 * vz
+    vBy = a12 * vx + a22 * vy + a32 * vz
+    vBz = a13 * vx + a23 * vy + a33 * vz
+    for s in range(surface_cpz.shape[0]):
+        cpz, radius = surface_cpz[s], surface_radius[s]
+        area = math.pi * radius**2
+        ci = (z + a33 * cpz - altitude_0) / altitude_step
+        wind_x, wind_y = _interp(atmosphere, ci, WIND_X), _interp(atmosphere, ci, WIND_Y)
+        sx = a11 * wind_x + a21 * wind_y - (vBx + w2 * cpz)
+        sy = a12 * wind_x + a22 * wind_y - (vBy - w1 * cpz)
+        sz = a13 * wind_x + a23 * wind_y - vBz
+        stream_speed = math.sqrt(sx**2 + sy**2 + sz**2)
+        mi = stream_speed / sound / mach_step
+        dynamic_pressure = 0.5 * rho * stream_speed**2 * area
+        lateral = math.sqrt(sx**2 + sy**2)
+        if lateral > 0:
+            attack_angle = math.acos(min(max(-sz / stream_speed, -1.0), 1.0))
+            lift = dynamic_pressure * _interp(surface_coefficients, mi, 3 * s) * attack_angle
+            lift_x, lift_y = lift * sx / lateral, lift * sy / lateral
+            R1 += lift_x
+            R2 += lift_y
+            M1 -= (cpz + rc) * lift_y
+            M2 += (cpz + rc) * lift_x
+        M3 += dynamic_pressure * 2 * radius * _interp(surface_coefficients, mi, 3 * s + 1)
+        M3 -= 0.5 * rho * stream_speed * area * (2 * radius) ** 2 * _interp(surface_coefficients, mi, 3 * s + 2) * w3 / 2
+
+    # T20 / T21 of u_dot_generalized
+    weight_x, weight_y, weight_z = -m * g * a31, -m * g * a32, -m * g * a33
+    mrc = m * rc
+    nozzle_arm = constants[NOZZLE_TO_CDM] - rc
+    T03 = 2 * m_dot * nozzle_arm - 2 * m * rc_dot
+    T04 = thrust - m * rc_ddot - 2 * m_dot * rc_dot + m_ddot * nozzle_arm
+    T20x = -w1 * mrc * w3 + w2 * T03 + weight_x + R1
+    T20y = -w2 * mrc * w3 - w1 * T03 + weight_y + R2
+    T20z = mrc * (w1**2 + w2**2) + T04 + weight_z + R3
+    T21x = (I2 - I3) * w2 * w3 + (m_dot * constants[S_11] - _interp(time_table, ti, I_11_DOT)) * w1 - weight_y * rc + M1
+    T21y = (I3 - I1) * w3 * w1 + (m_dot * constants[S_22] - _interp(time_table, ti, I_22_DOT)) * w2 + weight_x * rc + M2
+    T21z = (I1 - I2) * w1 * w2 + (m_dot * constants[S_33] - _interp(time_table, ti, I_33_DOT)) * w3 + M3
+
+    w1_dot = (T21x + T20y * rc) / (I1 - m * rc**2)
+    w2_dot = (T21y - T20x * rc) / (I2 - m * rc**2)
+    w3_dot = T21z / I3
+    Lx, Ly, Lz = T20x / m + rc * w2_dot, T20y / m - rc * w1_dot, T20z / m
+
+    du = np.empty(13)
+    du[0], du[1], du[2] = vx, vy, vz
+    du[3] = a11 * Lx + a12 * Ly + a13 * Lz
+    du[4] = a21 * Lx + a22 * Ly + a23 * Lz
+    du[5] = a31 * Lx + a32 * Ly + a33 * Lz
+    du[6] = 0.5 * (-w1 * e1 - w2 * e2 - w3 * e3)
+    du[7] = 0.5 * (w1 * e0 + w3 * e2 - w2 * e3)
+    du[8] = 0.5 * (w2 * e0 - w3 * e1 + w1 * e3)
+    du[9] = 0.5 * (w3 * e0 + w2 * e1 - w1 * e2)
+    du[10], du[11], du[12] = w1_dot, w2_dot, w3_dot
+    return du
+
+
+def curve_times(rocket):
+    # the points of the motor's tabulated time curves (thrust, tank flows and masses), where
+    # their slopes change
+    functions = [rocket.motor.thrust]
+    for positioned in getattr(rocket.motor, "positioned_tanks", []):
+        tank = positioned["tank"]
+        functions += [getattr(tank, name) for name in TANK_CURVES.get(type(tank).__name__, ())]
+    times = [function.source[:, 0] for function in functions
+             if isinstance(function.source, np.ndarray) and function.source.ndim == 2]
+    return np.unique(np.concatenate(times)) if times else np.array([])
+
+
+class CompiledConfiguration:
+    # one rocket in one environment, flattened to arrays
+    # the time table's nodes are a uniform grid plus the motor's curve points, so the
+    # piecewise linear thrust and flows are interpolated exactly (off the curve points the
+    # 1 ms grid cuts the thrust tail-off corners, 0.2 % thrust errors)
+    def __init__(self, rocket, env, altitudes=ALTITUDES, time_step=COMPILED_TIME_STEP, name=None):
+        self.name = name or "Rocket"
+        grid = np.arange(0, rocket.motor.burn_out_time + 0.5 + time_step, time_step)
+        # grid nodes next to a curve point are left out, segments that short would make the
+        # finite difference derivatives of the table noisy
+        knots = curve_times(rocket)
+        knots = knots[(knots > 0) & (knots < grid[-1])]
+        padded = np.concatenate([[-np.inf], knots, [np.inf]])
+        after = np.searchsorted(padded, grid)
+        near = np.minimum(grid - padded[after - 1], padded[after] - grid) < 0.1 * time_step
+        self.time = np.union1d(grid[~near | (grid == 0)], knots)
+        self.time_buckets = np.searchsorted(self.time, grid, side="right") - 1  # last node <= grid point
+        tables = rocket_tables(rocket, self.time)
+        atmosphere = environment_table(env, altitudes)
+        self.time_table = np.ascontiguousarray(tables["time"])
+        self.drag = np.ascontiguousarray(tables["drag"])
+        self.surface_cpz = np.array([cpz for cpz, _, _ in tables["surfaces"]], dtype=float)
+        self.surface_radius = np.array([radius for _, radius, _ in tables["surfaces"]], dtype=float)
+        self.surface_coefficients = np.ascontiguousarray(
+            np.hstack([coefficients for _, _, coefficients in tables["surfaces"]])
+        )
+        self.atmosphere = np.ascontiguousarray(atmosphere["table"])
+        self.elevation = atmosphere["elevation"]
+        self.button_distance = -effective_rail_length(rocket, 0)  # nozzle to upper button
+        self.constants = np.array([
+            tables["area"],
+            tables["burn_out_time"],
+            tables["nozzle_to_cdm"],
+            *tables["nozzle_gyration"],
+            altitudes[0],
+            altitudes[1] - altitudes[0],
+            MACH[1] - MACH[0],
+            time_step,
+        ], dtype=float)
+
+    @property
+    def rail_arguments(self):
+        return (self.time_table, self.time, self.time_buckets, self.drag, self.atmosphere, self.constants)
+
+    @property
+    def arguments(self):
+        return (self.time_table, self.time, self.time_buckets, self.drag, self.surface_cpz,
+                self.surface_radius, self.surface_coefficients, self.atmosphere, self.constants)
+
+
+def compile_configuration(rocket, env, altitudes=ALTITUDES, time_step=COMPILED_TIME_STEP, name=None):
+    return CompiledConfiguration(rocket, env, altitudes, time_step, name)
+
+
+class CompiledFlight:
+    # rail and 6-DOF flight of a compiled configuration, to apogee (terminate_on_apogee)
+    # or to the ground
+    def __init__(self, configuration, rail_length=12, inclination=86, heading=0,
+                 terminate_on_apogee=True, max_time=600, rtol=RTOL, atol=ATOL, name=None):
+        self.configuration = configuration
+        self.name = name or f"{configuration.name} (compiled)"
+        self.rail_length = rail_length
+        self.effective_rail_length = rail_length - configuration.button_distance
+        psi, theta = -np.radians(heading), np.radians(inclination - 90)
+        u0 = np.array([
+            0, 0, configuration.elevation, 0, 0, 0,
+            np.cos(psi / 2) * np.cos(theta / 2), np.cos(psi / 2) * np.sin(theta / 2),
+            np.sin(psi / 2) * np.sin(theta / 2), np.sin(psi / 2) * np.cos(theta / 2),
+            0, 0, 0,
+        ])
+
+        # rail
+        def rail_exit(t, u):
+            return (u[0] ** 2 + u[1] ** 2 + (u[2] - u0[2]) ** 2) - self.effective_rail_length**2
+
+        rail_exit.terminal, rail_exit.direction = True, 1
+        rail_args = configuration.rail_arguments
+        rail = solve_ivp(lambda t, u: rail_u_dot(t, u, *rail_args), (0, max_time), u0,
+                         method="LSODA", rtol=rtol, atol=atol, events=rail_exit)
+        if not len(rail.t_events[0]):
+            raise ValueError(f"{self.name} never left the rail before max_time ({max_time} s)")
+        self.out_of_rail_time = rail.t_events[0][0]
+        self.out_of_rail_state = rail.y_events[0][0]
+        self.out_of_rail_velocity = float(np.linalg.norm(self.out_of_rail_state[3:6]))
+
+        # 6-DOF
+        def apogee(t, u):
+            return u[5]
+
+        def impact(t, u):
+            return u[2] - configuration.elevation
+
+        apogee.terminal, apogee.direction = terminate_on_apogee, -1
+        impact.terminal, impact.direction = True, -1
+        args = configuration.arguments
+        flight = solve_ivp(lambda t, u: u_dot(t, u, *args), (self.out_of_rail_time, max_time),
+                           self.out_of_rail_state, method="LSODA", rtol=rtol, atol=atol,
+                           events=[apogee, impact])
+        if len(flight.t_events[0]):
+            self.apogee_time = flight.t_events[0][0]
+            self.apogee_state = flight.y_events[0][0]
+            self.apogee = self.apogee_state[2]
+            self.apogee_x, self.apogee_y = self.apogee_state[0], self.apogee_state[1]
+        else:  # no apogee before max_time (or the ground)
+            self.apogee_time = self.apogee_state = self.apogee = None
+            self.apogee_x = self.apogee_y = None
+        if len(flight.t_events[1]):
+            self.t_final = flight.t_events[1][0]
+            self.x_impact, self.y_impact = flight.y_events[1][0][:2]
+        else:
+            self.t_final = flight.t[-1]
+            self.x_impact = self.y_impact = None
+
+        self.time = np.concatenate([rail.t, flight.t[1:]])
+        self.solution = np.column_stack([rail.y, flight.y[:, 1:]]).T
+        self.function_evaluations = rail.nfev + flight.nfev
+
+    def get_solution_at_time(self, t):
+        # [t, x, y, z, vx, ...] interpolated, as Flight.get_solution_at_time
+        return np.array([t, *(np.interp(t, self.time, column) for column in self.solution.T)])
+
+
+if __name__ == "__main__":
+    import time as timer
+
+    from rocketpy import Environment, Flight
+
+    from Nimbus import Nimbus
+
+    env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+    env.set_atmospheric_model(type="custom_atmosphere", wind_u=2, wind_v=3)
+
+    start = timer.perf_counter()
+    configuration = compile_configuration(Nimbus, env, name="Nimbus")
+    print(f"configuration compiled in {timer.perf_counter() - start:.2f} s "
+          f"({'numba' if NUMBA else 'plain Python, numba not installed'})")
+    CompiledFlight(configuration)  # first call pays for the jit
+
+    repeats = 5
+    start = timer.perf_counter()
+    for _ in range(repeats):
+        Ascent = Flight(rocket=Nimbus, environment=env, rail_length=12, inclination=86, heading=0,
+                        terminate_on_apogee=True, name="Ascent")
+    generic = (timer.perf_counter() - start) / repeats
+    start = timer.perf_counter()
+    for _ in range(repeats):
+        Compiled = CompiledFlight(configuration, rail_length=12, inclination=86, heading=0)
+    compiled = (timer.perf_counter() - start) / repeats
+
+    # same equations: derivatives along the rocketpy trajectory
+    differences = []
+    for t, *u in Ascent.solution[:: max(len(Ascent.solution) // 200, 1)]:
+        if t > Ascent.out_of_rail_time:
+            reference = np.array(Ascent.u_dot_generalized(t, u))
+            difference = np.abs(u_dot(t, np.array(u), *configuration.arguments) - reference)
+            differences.append(np.max(difference / (np.abs(reference) + 1e-3)))
+
+    time = np.linspace(0, Ascent.apogee_time, 500)
+    position = np.array([Ascent.x(time), Ascent.y(time), Ascent.z(time)]).T
+    compiled_position = np.array([Compiled.get_solution_at_time(t)[1:4] for t in time])
+    print(f"Nimbus ascent, generic Flight {generic * 1000:.0f} ms, compiled {compiled * 1000:.0f} ms "
+          f"({generic / compiled:.1f}x, {Compiled.function_evaluations} evaluations)")
+    # the largest differences sit on the thrust tail-off, where rocketpy differentiates the
+    # mass flow on the fly and the tables hold finite differences
+    print(f"relative derivative difference along the ascent: median {np.median(differences):.1e}, "
+          f"95th percentile {np.percentile(differences, 95):.1e}")
+    print(f"apogee {Compiled.apogee:.2f} m (rocketpy {Ascent.apogee:.2f} m), "
+          f"apogee time {Compiled.apogee_time:.3f} s ({Ascent.apogee_time:.3f} s), "
+          f"out of rail {Compiled.out_of_rail_velocity:.3f} m/s ({Ascent.out_of_rail_velocity:.3f} m/s)")
+    position_difference = np.max(np.linalg.norm(compiled_position - position, axis=1))
+    print(f"max position difference along the ascent {position_difference:.2f} m")
+
+    checks = {
+        "apogee (m)": (abs(Compiled.apogee - Ascent.apogee), APOGEE_TOLERANCE),
+        "position (m)": (position_difference, POSITION_TOLERANCE),
+        "derivative (95th percentile)": (np.percentile(differences, 95), DERIVATIVE_TOLERANCE),
+    }
+    failed = [f"{name} {value:.2g} > {tolerance:.2g}" for name, (value, tolerance) in checks.items()
+              if not value <= tolerance]
+    if failed:
+        raise AssertionError(f"compiled flight outside tolerance: {', '.join(failed)}")
+    print("within tolerance of rocketpy's Flight")
@@ -0,0 +1,345 @@
+# Persistent, content addressed cache of Flight results
+# Nimbus.py, Nimbus_Ballistic.py and the canard variants are rerun with identical inputs
+# all the time. cached_flight() takes the same arguments as rocketpy's Flight, hashes
+# everything the simulation depends on into a key:
+#  - the rocket, motor (tanks, fluids), aerodynamic surfaces and parachutes (trigger code
+#    included), walked attribute by attribute, Functions by their source data/code,
+#  - the environment (so a new forecast is a new key),
+#  - the flight parameters (initial_solution=Ascent by Ascent's final state),
+#  - the contents of every input file named in them (dragCurve.csv, .eng, airfoils),
+#  - the rocketpy version,
+# and returns the stored Flight from .flight_cache/<key>.npz when there is one: the solver
+# solution plus the flight's scalar state, rebuilt into a real Flight on the live rocket
+# and environment (post processing, plots and all_info work as usual). Otherwise the flight
+# is simulated and stored. The cache is bounded in size and entries, least recently used
+# first out (a hit touches the file).
+#
+# NIMBUS_FLIGHT_CACHE=0 turns it off (always simulate, store nothing).
+#
+# usage:
+#   Ascent = cached_flight(rocket=Nimbus, environment=env, rail_length=12, inclination=86,
+#                          heading=0, terminate_on_apogee=True, name="Ascent")
+#   python RocketPy/FlightCache.py list | invalidate [key ...] | demo
+
+# imports
+import hashlib
+import json
+import os
+import types
+from importlib.metadata import version
+
+import numpy as np
+from rocketpy import Flight, Function
+from rocketpy.plots.flight_plots import _FlightPlots
+from rocketpy.prints.flight_prints import _FlightPrints
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+CACHE_DIR = os.path.join(REPO_ROOT, ".flight_cache")
+CACHE_ENABLED = os.environ.get("NIMBUS_FLIGHT_CACHE", "1").lower() not in ("0", "false", "no")
+FORMAT_VERSION = 1
+ROCKETPY_VERSION = version("rocketpy")
+
+MAX_BYTES = 512 * 1024**2
+MAX_ENTRIES = 2000
+
+# written during or after a simulation, not inputs of it
+SKIP_ATTRIBUTES = {
+    "prints", "plots",
+    "noise_signal", "noisy_pressure_signal", "clean_pressure_signal",
+    "noise_signal_function", "noisy_pressure_signal_function", "clean_pressure_signal_function",
+}
+# Flight attributes rebuilt on load instead of stored
+LIVE_ATTRIBUTES = {
+    "env", "rocket", "prints", "plots", "parachutes", "parachute_events", "flight_phases",
+    "initial_derivative", "_controllers", "solution", "_Flight__post_processed_variables",
+}
+
+
+# hashing
+
+
+def _hash_code(digest, code, seen):
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            _hash_code(digest, constant, seen)
+        else:
+            _feed(digest, constant, seen)
+
+
+def _feed(digest, value, seen):
+    if value is None or isinstance(value, (bool, int, float, complex, np.number)):
+        digest.update(f"{type(value).__name__}:{value!r};".encode())
+    elif isinstance(value, str):
+        digest.update(f"str:{value};".encode())
+        if len(value) < 512 and os.path.isfile(value):  # an input file, by its contents
+            with open(value, "rb") as file:
+                digest.update(hashlib.sha256(file.read()).digest())
+    elif isinstance(value, np.ndarray):
+        if value.dtype == object:
+            _feed(digest, value.tolist(), seen)
+        else:
+            digest.update(f"array:{value.dtype}:{value.shape};".encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}:{len(value)};".encode())
+        for item in value:
+            _feed(digest, item, seen)
+    elif isinstance(value, dict):
+        digest.update(f"dict:{len(value)};".encode())
+        for key in sorted(value, key=str):
+            _feed(digest, str(key), seen)
+            _feed(digest, value[key], seen)
+    elif id(value) in seen:  # shared or cyclic reference, by first visit order
+        digest.update(f"ref:{seen[id(value)]};".encode())
+    elif isinstance(value, Function):
+        seen[id(value)] = len(seen)
+        digest.update(b"Function;")
+        _feed(digest, value.source, seen)
+        _feed(digest, getattr(value, "__interpolation__", None), seen)
+        _feed(digest, getattr(value, "__extrapolation__", None), seen)
+    elif isinstance(value, types.MethodType):
+        seen[id(value)] = len(seen)
+        _feed(digest, value.__func__, seen)
+        _feed(digest, value.__self__, seen)
+    elif callable(value) and hasattr(value, "__code__"):
+        seen[id(value)] = len(seen)
+        digest.update(f"function:{value.__qualname__};".encode())
+        _hash_code(digest, value.__code__, seen)
+        _feed(digest, value.__defaults__, seen)
+        for cell in value.__closure__ or ():
+            try:
+                _feed(digest, cell.cell_contents, seen)
+            except ValueError:  # empty cell
+                pass
+    elif hasattr(value, "__dict__") and not isinstance(value, type):
+        seen[id(value)] = len(seen)
+        digest.update(f"object:{type(value).__qualname__};".encode())
+        for key in sorted(value.__dict__):
+            if key not in SKIP_ATTRIBUTES:
+                _feed(digest, key, seen)
+                _feed(digest, value.__dict__[key], seen)
+    elif hasattr(value, "isoformat"):  # dates
+        digest.update(f"date:{value.isoformat()};".encode())
+    else:  # no stable content to hash (open datasets, builtins), by type only
+        digest.update(f"opaque:{type(value).__qualname__};".encode())
+
+
+def flight_key(rocket, environment, **flight_kwargs):
+    # hex key of a Flight(rocket, environment, **flight_kwargs)
+    initial_solution = flight_kwargs.get("initial_solution")
+    if isinstance(initial_solution, Flight):
+        flight_kwargs["initial_solution"] = [float(value) for value in initial_solution.solution[-1]]
+    digest = hashlib.sha256()
+    _feed(digest, (FORMAT_VERSION, ROCKETPY_VERSION), {})
+    _feed(digest, flight_kwargs, {})
+    seen = {}
+    _feed(digest, rocket, seen)
+    _feed(digest, environment, seen)
+    return digest.hexdigest()[:32]
+
+
+# Flight <-> file
+
+
+def _plain(value):
+    # JSON-able copy of a simple attribute, None when it isn't one
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    if isinstance(value, np.number):
+        return value.item()
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        return {"array": value.tolist()}
+    if isinstance(value, (list, tuple)):
+        items = [_plain(item) for item in value]
+        if all(item is not None or original is None for item, original in zip(items, value)):
+            return items
+    return None
+
+
+def _restore(value):
+    if isinstance(value, dict) and "array" in value:
+        return np.array(value["array"])
+    if isinstance(value, list):
+        return [_restore(item) for item in value]
+    return value
+
+
+def _phase_record(phase):
+    # (t, derivative name, parachute cd_s set by its callbacks)
+    probe = types.SimpleNamespace()
+    for callback in phase.callbacks:
+        callback(probe)
+    derivative = None if phase.derivative is None else phase.derivative.__name__
+    return [float(phase.t), derivative, getattr(probe, "parachute_cd_s", None), phase.clear]
+
+
+def save_flight(flight, path):
+    attributes = {}
+    for key, value in flight.__dict__.items():
+        if key in LIVE_ATTRIBUTES:
+            continue
+        plain = _plain(value)
+        if plain is not None or value is None:
+            attributes[key] = plain
+    metadata = {
+        "attributes": attributes,
+        "parachutes": [parachute.name for parachute in flight.parachutes],
+        "parachute_events": [[float(time), parachute.name] for time, parachute in flight.parachute_events],
+        "phases": [_phase_record(phase) for phase in flight.flight_phases],
+    }
+    np.savez(path, solution=np.array(flight.solution, dtype=float), metadata=np.array(json.dumps(metadata)))
+
+
+def load_flight(path, rocket, environment):
+    # a Flight on the live rocket and environment, without simulating it
+    data = np.load(path)
+    metadata = json.loads(str(data["metadata"]))
+    flight = Flight.__new__(Flight)
+    flight.env, flight.rocket = environment, rocket
+    for key, value in metadata["attributes"].items():
+        setattr(flight, key, _restore(value))
+    flight.solution = data["solution"].tolist()
+    flight._controllers = []
+    flight._Flight__post_processed_variables = []
+    parachutes = {parachute.name: parachute for parachute in rocket.parachutes}
+    flight.parachutes = [parachutes[name] for name in metadata["parachutes"]]
+    flight.parachute_events = [[time, parachutes[name]] for time, name in metadata["parachute_events"]]
+
+    flight.flight_phases = Flight.FlightPhases()
+    for time, derivative, cd_s, clear in metadata["phases"]:
+        callbacks = [] if cd_s is None else [lambda self, cd_s=cd_s: setattr(self, "parachute_cd_s", cd_s)]
+        derivative = None if derivative is None else getattr(flight, derivative)
+        flight.flight_phases.list.append(Flight.FlightPhases.FlightPhase(time, derivative, callbacks, clear))
+    flight.initial_derivative = flight.flight_phases[0].derivative
+    flight.prints = _FlightPrints(flight)
+    flight.plots = _FlightPlots(flight)
+    return flight
+
+
+# the cache
+
+
+class FlightCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES, max_entries=MAX_ENTRIES, enabled=CACHE_ENABLED):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def flight(self, rocket, environment, **flight_kwargs):
+        # as Flight(rocket=..., environment=..., **flight_kwargs), from disk when cached
+        if not self.enabled:
+            return Flight(rocket=rocket, environment=environment, **flight_kwargs)
+        key = flight_key(rocket, environment, **flight_kwargs)
+        path = self.path(key)
+        if os.path.exists(path):
+            try:
+                flight = load_flight(path, rocket, environment)
+                os.utime(path)  # most recently used
+                self.hits += 1
+                return flight
+            except (OSError, ValueError, KeyError):  # unreadable or stale entry, simulate again
+                self.invalidate(key)
+        flight = Flight(rocket=rocket, environment=environment, **flight_kwargs)
+        self.misses += 1
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = os.path.join(self.directory, f"{key}.{os.getpid()}.tmp.npz")
+        save_flight(flight, temporary)
+        os.replace(temporary, path)  # other processes never see half written entries
+        self.evict()
+        return flight
+
+    def entries(self):
+        # [(key, bytes, last use)] oldest first
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz") and ".tmp" not in name:
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((name[:-4], stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        while entries and (total > self.max_bytes or len(entries) > self.max_entries):
+            key, size, _ = entries.pop(0)
+            self.invalidate(key)
+            total -= size
+            removed.append(key)
+        return removed
+
+    def invalidate(self, *keys):
+        # removes the given entries, or every entry without keys; returns how many
+        keys = keys or [key for key, _, _ in self.entries()]
+        removed = 0
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+default_cache = FlightCache()
+
+
+def cached_flight(rocket, environment, **flight_kwargs):
+    return default_cache.flight(rocket, environment, **flight_kwargs)
+
+
+if __name__ == "__main__":
+    import sys
+    import time as timer
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "demo"
+
+    if command == "list":
+        for key, size, last_use in default_cache.entries():
+            print(f"{key}  {size / 1024:8.0f} kB  {timer.strftime('%Y-%m-%d %H:%M', timer.localtime(last_use))}")
+        print(default_cache.stats())
+
+    elif command == "invalidate":
+        print(f"removed {default_cache.invalidate(*sys.argv[2:])} cached flights")
+
+    else:
+        from rocketpy import Environment
+
+        from Nimbus import Nimbus, NimbusDescent
+
+        env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+        env.set_atmospheric_model(type="custom_atmosphere", wind_u=2, wind_v=3)
+
+        for attempt in ("first run", "second run"):
+            start = timer.perf_counter()
+            Ascent = cached_flight(rocket=Nimbus, environment=env, rail_length=12, inclination=86, heading=0,
+                                   terminate_on_apogee=True, name="Ascent")
+            Descent = cached_flight(rocket=NimbusDescent, environment=env, rail_length=12, inclination=0,
+                                    heading=0, initial_solution=Ascent, name="Descent")
+            print(f"{attempt}: {(timer.perf_counter() - start) * 1000:.0f} ms, apogee {Ascent.apogee:.2f} m, "
+                  f"landing ({Descent.x_impact:.1f}, {Descent.y_impact:.1f}) m, "
+                  f"max Mach {Ascent.max_mach_number:.3f}, {default_cache.stats()}")
+
+        # a changed input is a new key
+        key = flight_key(Nimbus, env, rail_length=12, inclination=86, heading=0, terminate_on_apogee=True, name="Ascent")
+        changed = flight_key(Nimbus, env, rail_length=12, inclination=85, heading=0, terminate_on_apogee=True, name="Ascent")
+        print(f"Ascent key {key}, inclination 85 deg {changed}")
@@ -0,0 +1,195 @@
+# Opt-in profiling of where a Flight's time goes, by physics component
+# Inside a FlightProfiler context the Functions and methods the equations of motion call
+# are wrapped with call counters and timers (restored on exit, nothing is touched outside
+# it, so a disabled profiler costs nothing):
+#   aero <surface> @ <position>   lift (cl) and roll coefficients of each surface
+#   aero drag                     power on/off drag curves
+#   motor thrust                  Thanos_R thrust curve
+#   motor mass/inertia            total mass, mass flow, centre of mass and inertia tensor
+#                                 (and their derivatives), the three tank model
+#   environment                   density, wind, speed of sound, gravity, pressure
+#   triggers                      parachute trigger functions and pressure noise
+#   equations of motion (other)   the rest of u_dot_generalized / udot_rail1 / u_dot_parachute
+#   integrator overhead           everything else while the Flights are built (LSODA, phases)
+# Times are exclusive (a Function called inside another wrapped call counts once, for the
+# inner one), so the rows add up to the wall time.
+#
+# NIMBUS_PROFILE=1 profiles the nominal flights of Nimbus.py.
+#
+# usage:
+#   with FlightProfiler([Nimbus, NimbusDescent], env, name="Nimbus") as profiler:
+#       Ascent = Flight(...); Descent = Flight(...)
+#   profiler.table()
+#   compare_profiles([profiler, other])       # one column per configuration
+
+# imports
+import os
+import time
+from collections import defaultdict
+
+from rocketpy import Flight
+
+PROFILE = os.environ.get("NIMBUS_PROFILE", "").lower() in ("1", "true", "yes")
+
+EQUATIONS_OF_MOTION = ("u_dot_generalized", "udot_rail1", "u_dot_parachute", "u_dot")
+EQUATIONS_LABEL = "equations of motion (other)"
+OVERHEAD_LABEL = "integrator overhead"
+
+_MISSING = object()
+
+
+class FlightProfiler:
+    # rockets: a Rocket or a list of them (ascent and descent), env: their Environment,
+    # enabled=False makes the context a no-op
+    def __init__(self, rockets, env, name=None, enabled=True):
+        self.rockets = rockets if isinstance(rockets, (list, tuple)) else [rockets]
+        self.env = env
+        self.name = name or "Flight"
+        self.enabled = enabled
+        self.calls = defaultdict(int)
+        self.times = defaultdict(float)
+        self.wall_time = 0.0
+        self._stack = []
+        self._patches = []
+        self._active = [False]
+
+    # wrapping
+
+    def _timed(self, label, function):
+        stack, calls, times, active = self._stack, self.calls, self.times, self._active
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            if not active[0]:  # a Flight built inside the context, post processed after it
+                return function(*args, **kwargs)
+            stack.append(0.0)
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                times[label] += elapsed - stack.pop()
+                calls[label] += 1
+                if stack:
+                    stack[-1] += elapsed
+
+        return timed
+
+    def _patch(self, owner, attribute, label):
+        if owner is None or any(o is owner and a == attribute for o, a, _ in self._patches):
+            return
+        original = owner.__dict__.get(attribute, _MISSING)
+        setattr(owner, attribute, self._timed(label, getattr(owner, attribute)))
+        self._patches.append((owner, attribute, original))
+
+    def _patch_function(self, function, label, methods=("get_value_opt",)):
+        for method in methods:
+            if hasattr(function, method):
+                self._patch(function, method, label)
+
+    def _instrument(self):
+        derivatives = ("get_value_opt", "differentiate_complex_step", "differentiate")
+        for rocket in self.rockets:
+            for surface, position in rocket.aerodynamic_surfaces:
+                label = f"aero {surface.name} @ {position:g}"
+                self._patch_function(surface.cl, label)
+                for coefficient in getattr(surface, "roll_parameters", [])[:2]:
+                    self._patch_function(coefficient, label)
+            self._patch_function(rocket.power_on_drag, "aero drag")
+            self._patch_function(rocket.power_off_drag, "aero drag")
+            self._patch_function(rocket.motor.thrust, "motor thrust")
+            for function in (rocket.total_mass, rocket.total_mass_flow_rate, rocket.com_to_cdm_function):
+                self._patch_function(function, "motor mass/inertia", derivatives)
+            for method in ("get_inertia_tensor_at_time", "get_inertia_tensor_derivative_at_time"):
+                self._patch(rocket, method, "motor mass/inertia")
+            for parachute in rocket.parachutes:
+                self._patch(parachute, "triggerfunc", "triggers")
+                self._patch(parachute, "noise_function", "triggers")
+        for function in (self.env.density, self.env.wind_velocity_x, self.env.wind_velocity_y,
+                         self.env.speed_of_sound, self.env.gravity, self.env.pressure,
+                         self.env.barometric_height):
+            self._patch_function(function, "environment")
+        for method in EQUATIONS_OF_MOTION:
+            if method in Flight.__dict__:
+                self._patch(Flight, method, EQUATIONS_LABEL)
+
+    def __enter__(self):
+        if self.enabled:
+            self._instrument()
+            self._active[0] = True
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.enabled:
+            self.wall_time += time.perf_counter() - self._start
+            self._active[0] = False
+            for owner, attribute, original in reversed(self._patches):
+                if original is _MISSING:
+                    delattr(owner, attribute)
+                else:
+                    setattr(owner, attribute, original)
+            self._patches = []
+        return False
+
+    # results
+
+    def as_dict(self):
+        # {component: {"calls", "time"}} in seconds, the integrator overhead included
+        profile = {label: {"calls": self.calls[label], "time": self.times[label]} for label in self.times}
+        profile[OVERHEAD_LABEL] = {"calls": 0, "time": self.wall_time - sum(self.times.values())}
+        return profile
+
+    def table(self):
+        profile = self.as_dict()
+        print(f"----- {self.name} flight profile, {self.wall_time * 1000:.0f} ms -----")
+        print(f"{'component':<36} {'calls':>9} {'time (ms)':>10} {'per call (us)':>14} {'share':>7}")
+        for label, row in sorted(profile.items(), key=lambda item: -item[1]["time"]):
+            per_call = f"{row['time'] / row['calls'] * 1e6:.1f}" if row["calls"] else "-"
+            print(f"{label:<36} {row['calls']:>9} {row['time'] * 1000:>10.1f} {per_call:>14} "
+                  f"{row['time'] / self.wall_time:>7.1%}")
+        return profile
+
+
+def compare_profiles(profilers):
+    # time (ms) per component, one column per profiled configuration
+    profiles = [profiler.as_dict() for profiler in profilers]
+    labels = sorted({label for profile in profiles for label in profile},
+                    key=lambda label: -max(profile.get(label, {"time": 0})["time"] for profile in profiles))
+    print(f"{'component (ms)':<36}" + "".join(f"{profiler.name:>16}" for profiler in profilers))
+    for label in labels:
+        print(f"{label:<36}" + "".join(f"{profile.get(label, {'time': 0})['time'] * 1000:>16.1f}" for profile in profiles))
+    print(f"{'total':<36}" + "".join(f"{profiler.wall_time * 1000:>16.1f}" for profiler in profilers))
+
+
+if __name__ == "__main__":
+    from rocketpy import Environment
+
+    import Nimbus_Canardless
+    from Nimbus import Nimbus, NimbusDescent
+
+    env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+    env.set_atmospheric_model(type="custom_atmosphere", wind_u=2, wind_v=3)
+
+    def nominal(ascent_rocket, descent_rocket):
+        Ascent = Flight(rocket=ascent_rocket, environment=env, rail_length=12, inclination=86, heading=0,
+                        terminate_on_apogee=True, name="Ascent")
+        return Flight(rocket=descent_rocket, environment=env, rail_length=12, inclination=0, heading=0,
+                      initial_solution=Ascent, name="Descent")
+
+    # disabled: the same code path, nothing wrapped
+    start = time.perf_counter()
+    with FlightProfiler([Nimbus, NimbusDescent], env, enabled=False):
+        nominal(Nimbus, NimbusDescent)
+    print(f"disabled profiler, nominal flights in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    profilers = []
+    for name, ascent_rocket, descent_rocket in (
+        ("Nimbus", Nimbus, NimbusDescent),
+        ("Canardless", Nimbus_Canardless.Nimbus, Nimbus_Canardless.NimbusDescent),
+    ):
+        with FlightProfiler([ascent_rocket, descent_rocket], env, name=name) as profiler:
+            nominal(ascent_rocket, descent_rocket)
+        profiler.table()
+        profilers.append(profiler)
+    compare_profiles(profilers)
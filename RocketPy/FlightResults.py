@@ -0,0 +1,161 @@
+# Lazy, headless friendly results of an ascent/descent pair
+# all_info(), draw() and trajectories_3d() evaluate and plot every derived quantity of a
+# flight, which is most of a script's runtime when it only needs a few numbers (and the
+# plots go nowhere on a headless server). FlightResults only evaluates what is asked for,
+# memoises it, skips every plot when headless, and writes a small JSON/NPZ summary.
+#
+# headless when NIMBUS_HEADLESS=1 is set or matplotlib has a non interactive backend
+# (the default on a machine without a display)
+#
+# usage:
+#   results = FlightResults(Ascent, Descent, name="Nimbus")
+#   results.save_summary()   # results/Nimbus_summary.json
+#   results.all_info()       # summary only when headless, the usual rocketpy dumps otherwise
+
+# imports
+import functools
+import json
+import os
+
+import matplotlib
+import numpy as np
+from rocketpy import CompareFlights
+
+NON_INTERACTIVE_BACKENDS = ("agg", "cairo", "pdf", "pgf", "ps", "svg", "template")
+
+
+def is_headless():
+    if os.environ.get("NIMBUS_HEADLESS", "").lower() in ("1", "true", "yes"):
+        return True
+    return matplotlib.get_backend().lower() in NON_INTERACTIVE_BACKENDS
+
+
+HEADLESS = is_headless()
+
+RESULTS_DIR = "results"
+
+
+class FlightResults:
+    # ascent: Flight terminated at apogee, descent: the Flight started from it (optional)
+    def __init__(self, ascent, descent=None, name=None):
+        self.ascent = ascent
+        self.descent = descent
+        self.name = name or ascent.name
+        self.environment = ascent.env
+
+    @functools.cached_property
+    def apogee(self):
+        # above sea level, as rocketpy reports it
+        return float(self.ascent.apogee)
+
+    @functools.cached_property
+    def apogee_agl(self):
+        return self.apogee - self.environment.elevation
+
+    @functools.cached_property
+    def apogee_time(self):
+        return float(self.ascent.apogee_time)
+
+    @functools.cached_property
+    def max_mach(self):
+        return float(self.ascent.max_mach_number)
+
+    @functools.cached_property
+    def max_speed(self):
+        return float(self.ascent.max_speed)
+
+    @functools.cached_property
+    def rail_exit_velocity(self):
+        return float(self.ascent.out_of_rail_velocity)
+
+    @functools.cached_property
+    def stability_margins(self):
+        # in calibers
+        return {
+            "initial": float(self.ascent.initial_stability_margin),
+            "out_of_rail": float(self.ascent.out_of_rail_stability_margin),
+            "min": float(self.ascent.min_stability_margin),
+            "max": float(self.ascent.max_stability_margin),
+        }
+
+    @functools.cached_property
+    def landing_point(self):
+        # x (east) / y (north) from the rail in m, and latitude/longitude
+        flight = self.descent or self.ascent
+        t_final = flight.t_final
+        return {
+            "x": float(flight.x_impact),
+            "y": float(flight.y_impact),
+            "latitude": float(flight.latitude(t_final)),
+            "longitude": float(flight.longitude(t_final)),
+            "time": float(t_final),
+            "velocity": float(flight.impact_velocity),
+        }
+
+    @functools.cached_property
+    def summary(self):
+        summary = {
+            "name": self.name,
+            "apogee": self.apogee,
+            "apogee_agl": self.apogee_agl,
+            "apogee_time": self.apogee_time,
+            "max_mach": self.max_mach,
+            "max_speed": self.max_speed,
+            "rail_exit_velocity": self.rail_exit_velocity,
+            "stability_margin": self.stability_margins,
+        }
+        if self.descent is not None:
+            summary["landing"] = self.landing_point
+        return summary
+
+    def save_summary(self, path=None, trajectories=False):
+        # .json (default) or .npz, the npz can also hold the raw solution arrays
+        path = path or os.path.join(RESULTS_DIR, f"{self.name}_summary.json")
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        if path.endswith(".npz"):
+            arrays = {"summary": json.dumps(self.summary)}
+            if trajectories:
+                arrays["ascent"] = np.asarray(self.ascent.solution)
+                if self.descent is not None:
+                    arrays["descent"] = np.asarray(self.descent.solution)
+            np.savez(path, **arrays)
+        else:
+            with open(path, "w") as file:
+                json.dump(self.summary, file, indent=2)
+        return path
+
+    def print_summary(self):
+        print(f"----- {self.name} SUMMARY -----")
+        print(f"Apogee: {self.apogee_agl:.2f} m AGL at {self.apogee_time:.2f} s")
+        print(f"Max Mach: {self.max_mach:.3f}, rail exit velocity: {self.rail_exit_velocity:.2f} m/s")
+        margins = self.stability_margins
+        print(
+            f"Stability margin: {margins['out_of_rail']:.2f} c out of rail, "
+            f"{margins['min']:.2f} to {margins['max']:.2f} c"
+        )
+        if self.descent is not None:
+            landing = self.landing_point
+            print(
+                f"Landing: x {landing['x']:.1f} m, y {landing['y']:.1f} m "
+                f"({landing['latitude']:.5f}, {landing['longitude']:.5f}) at {landing['time']:.1f} s"
+            )
+
+    def trajectories_3d(self):
+        if HEADLESS:
+            return
+        flights = [self.ascent] if self.descent is None else [self.ascent, self.descent]
+        CompareFlights(flights).trajectories_3d(legend=True)
+
+    def all_info(self):
+        # full rocketpy output when there is a display, the summary only when headless
+        self.print_summary()
+        if HEADLESS:
+            return
+        self.trajectories_3d()
+        print("----- ASCENT INFO -----")
+        self.ascent.all_info()
+        if self.descent is not None:
+            print("----- DESCENT INFO -----")
+            self.descent.info()
@@ -0,0 +1,197 @@
+# Landing probability heatmaps from Monte Carlo landing points, built as they arrive
+# MonteCarlo.plots.ellipses only gives confidence ellipses, EuRoC range safety wants the
+# probability of landing per area. LandingHeatmap keeps a fixed grid of counts (memory is
+# the grid, not the number of samples) plus running moments, so it can be updated point by
+# point or straight from a MonteCarlo outputs file while the campaign is still running.
+# The density is a binned kernel density estimate (the histogram smoothed with a gaussian of
+# the chosen or Scott's rule bandwidth) and the contours enclose the most likely 50/90/99%.
+#
+# usage:
+#   heatmap = LandingHeatmap(xlim=(-1500, 1500), ylim=(-1000, 2500), cell_size=10)
+#   heatmap.update_from_outputs("descent.outputs.txt")  # only reads lines it hasn't seen
+#   heatmap.plot(); heatmap.export("descent_heatmap.npz")
+
+# imports
+import json
+import os
+
+import contourpy
+import matplotlib.pyplot as plt
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+PROBABILITY_LEVELS = (0.5, 0.9, 0.99)
+
+
+class LandingHeatmap:
+    def __init__(self, xlim=(-1500, 1500), ylim=(-1000, 2500), cell_size=10):
+        self.x_edges = np.arange(xlim[0], xlim[1] + cell_size / 2, cell_size)
+        self.y_edges = np.arange(ylim[0], ylim[1] + cell_size / 2, cell_size)
+        self.cell_size = cell_size
+        self.counts = np.zeros((len(self.x_edges) - 1, len(self.y_edges) - 1))
+
+        # running totals of every sample (also the ones off the grid) for the moments
+        self.n_samples = 0
+        self.n_outside = 0
+        self._sum = np.zeros(2)
+        self._sum_outer = np.zeros((2, 2))
+
+        # where update_from_outputs stopped reading, per file
+        self._file_offsets = {}
+
+    @property
+    def x_centers(self):
+        return (self.x_edges[:-1] + self.x_edges[1:]) / 2
+
+    @property
+    def y_centers(self):
+        return (self.y_edges[:-1] + self.y_edges[1:]) / 2
+
+    def add(self, x, y):
+        # one landing point or arrays of them
+        points = np.column_stack([np.ravel(x), np.ravel(y)]).astype(float)
+        points = points[np.isfinite(points).all(axis=1)]
+        if len(points) == 0:
+            return
+
+        i = np.floor((points[:, 0] - self.x_edges[0]) / self.cell_size).astype(int)
+        j = np.floor((points[:, 1] - self.y_edges[0]) / self.cell_size).astype(int)
+        inside = (i >= 0) & (i < self.counts.shape[0]) & (j >= 0) & (j < self.counts.shape[1])
+        np.add.at(self.counts, (i[inside], j[inside]), 1)
+
+        self.n_samples += len(points)
+        self.n_outside += int((~inside).sum())
+        self._sum += points.sum(axis=0)
+        self._sum_outer += points.T @ points
+
+    def update_from_outputs(self, path):
+        # add the landing points of a MonteCarlo "<filename>.outputs.txt" written since the
+        # last call, returns how many were added
+        if not os.path.exists(path):
+            return 0
+        x, y = [], []
+        with open(path, "r", encoding="utf-8") as file:
+            file.seek(self._file_offsets.get(path, 0))
+            while True:
+                line = file.readline()
+                if not line.endswith("\n"):
+                    break  # end of file, or a line the campaign is still writing
+                self._file_offsets[path] = file.tell()
+                output = json.loads(line)
+                if "x_impact" in output and "y_impact" in output:
+                    x.append(output["x_impact"])
+                    y.append(output["y_impact"])
+        self.add(x, y)
+        return len(x)
+
+    @property
+    def mean(self):
+        return self._sum / max(self.n_samples, 1)
+
+    @property
+    def covariance(self):
+        mean = self.mean
+        return self._sum_outer / max(self.n_samples, 1) - np.outer(mean, mean)
+
+    def scott_bandwidth(self):
+        # Scott's rule for 2D, per axis, in m
+        std = np.sqrt(np.clip(np.diag(self.covariance), 0, None))
+        return std * max(self.n_samples, 1) ** (-1 / 6)
+
+    def probability(self, bandwidth=None):
+        # probability of landing in each cell (kernel density x cell area), sums to the
+        # fraction of samples that landed on the grid. bandwidth in m, None for Scott's
+        # rule, 0 for the raw histogram
+        if self.n_samples == 0:
+            return np.zeros_like(self.counts)
+        if bandwidth is None:
+            bandwidth = self.scott_bandwidth()
+        sigma = np.broadcast_to(np.asarray(bandwidth, dtype=float) / self.cell_size, (2,))
+        smoothed = gaussian_filter(self.counts, sigma=sigma, mode="constant")
+        return smoothed / self.n_samples
+
+    def density(self, bandwidth=None):
+        # probability per m^2
+        return self.probability(bandwidth) / self.cell_size**2
+
+    def level_thresholds(self, levels=PROBABILITY_LEVELS, bandwidth=None):
+        # probability per cell above which the cells hold `level` of the landings
+        # (highest density regions)
+        probability = np.sort(self.probability(bandwidth).ravel())[::-1]
+        cumulative = np.cumsum(probability)
+        index = np.searchsorted(cumulative, np.asarray(levels) * cumulative[-1])
+        return probability[np.clip(index, 0, len(probability) - 1)]
+
+    def contours(self, levels=PROBABILITY_LEVELS, bandwidth=None):
+        # {level: [(n, 2) arrays of x, y]} of the regions holding each fraction of landings
+        probability = self.probability(bandwidth)
+        generator = contourpy.contour_generator(
+            self.x_centers, self.y_centers, probability.T, line_type="Separate"
+        )
+        thresholds = self.level_thresholds(levels, bandwidth)
+        return {
+            level: generator.lines(threshold) for level, threshold in zip(levels, thresholds)
+        }
+
+    def export(self, path, levels=PROBABILITY_LEVELS, bandwidth=None):
+        # grid, probability and contours (flattened with offsets) to a .npz
+        contours = self.contours(levels, bandwidth)
+        arrays = {
+            "x_edges": self.x_edges,
+            "y_edges": self.y_edges,
+            "counts": self.counts,
+            "probability": self.probability(bandwidth),
+            "n_samples": self.n_samples,
+            "n_outside": self.n_outside,
+            "mean": self.mean,
+            "covariance": self.covariance,
+            "levels": np.asarray(levels),
+        }
+        for level, lines in contours.items():
+            key = f"contour_{int(round(level * 100))}"
+            arrays[key] = np.concatenate(lines) if lines else np.empty((0, 2))
+            arrays[f"{key}_offsets"] = np.cumsum([0] + [len(line) for line in lines])
+        np.savez(path, **arrays)
+        return path
+
+    def plot(self, levels=PROBABILITY_LEVELS, bandwidth=None, ax=None, show=True):
+        if ax is None:
+            _, ax = plt.subplots()
+        density = self.density(bandwidth)
+        mesh = ax.pcolormesh(self.x_edges, self.y_edges, density.T, cmap="viridis")
+        plt.colorbar(mesh, ax=ax, label="Landing probability density (1/m$^2$)")
+        for level, lines in self.contours(levels, bandwidth).items():
+            for k, line in enumerate(lines):
+                ax.plot(line[:, 0], line[:, 1], color="w", lw=1,
+                        label=f"{level:.0%}" if k == 0 else None)
+        ax.plot(0, 0, "r^", label="Launch")
+        ax.set_xlabel("x (m)")
+        ax.set_ylabel("y (m)")
+        ax.set_aspect("equal")
+        ax.set_title(f"Landing probability, {self.n_samples} flights")
+        ax.legend(loc="upper right", fontsize="small")
+        if show:
+            plt.show()
+        return ax
+
+
+if __name__ == "__main__":
+    import sys
+    import time as timer
+
+    heatmap = LandingHeatmap()
+    if len(sys.argv) > 1:
+        # e.g. python RocketPy/LandingHeatmap.py descent.outputs.txt
+        for path in sys.argv[1:]:
+            print(f"{path}: {heatmap.update_from_outputs(path)} landing points")
+    else:
+        # a million fake landing points, streamed in batches
+        rng = np.random.default_rng(0)
+        start = timer.perf_counter()
+        for _ in range(100):
+            heatmap.add(rng.normal(-100, 150, 10_000), rng.normal(600, 300, 10_000))
+        print(f"{heatmap.n_samples} points in {timer.perf_counter() - start:.2f} s, "
+              f"grid {heatmap.counts.nbytes / 1024:.0f} kB")
+
+    print("mean", heatmap.mean, "bandwidth", heatmap.scott_bandwidth())
+    heatmap.plot()
@@ -0,0 +1,449 @@
+# Live landing prediction from downlinked telemetry
+# During the real Nimbus flight the recovery team gets a state estimate at a few Hz. The
+# LandingPredictor turns each one into landing ellipses fast enough to keep up: the state
+# (with its uncertainty) is spread into an ensemble of samples and all of them are
+# propagated together with numpy, point mass through the coast (power off drag of the
+# ascent rocket, no thrust, so messages during the burn are skipped) and then rocketpy's
+# parachute equations (added mass included) under the NimbusDescent drogue and main, down
+# to the pad elevation. The atmosphere is tabulated once (BatchFlight's environment_table,
+# from a cached ForecastWindow hour or any Environment), every sample flies its own wind
+# realisation (perturbed_winds, drawn once) and its own drag areas, and the ellipses are the
+# 1, 2 and 3 sigma contours of the landing points.
+# Telemetry is one JSON object per message:
+#   {"t": s, "state": [x, y, z, vx, vy, vz], "std": [6 values, optional],
+#    "deployed": ["drogue", ...] optional}
+# x east, y north from the rail, z above sea level, as rocketpy's Flight. It is read from a
+# growing file (file_tail) or a UDP socket (udp_source), the predictions go out the same
+# ways (JsonLinesPublisher, UdpPublisher). TelemetryGenerator replays rocketpy flights as a
+# noisy telemetry stream to test against. The sources hand over only the newest message of
+# whatever arrived since the last prediction, so a slow update never leaves the predictor
+# working on stale states.
+#
+# usage:
+#   predictor = LandingPredictor(NimbusDescent, env, ascent_rocket=Nimbus)
+#   predictor.serve(file_tail("telemetry.jsonl"), JsonLinesPublisher("predictions.jsonl"))
+#   python RocketPy/LandingPredictor.py serve --udp 5005 [--forecast window.npz --hour 3]
+#   python RocketPy/LandingPredictor.py generate --udp 127.0.0.1:5005
+
+# imports
+import json
+import os
+import socket
+import time as timer
+
+import numpy as np
+
+from BatchFlight import ALTITUDES, DENSITY, GRAVITY, MACH, PARACHUTE_ADDED_MASS_VOLUME, SPEED_OF_SOUND, \
+    WIND_X, WIND_Y, environment_table
+from Payload import perturbed_winds
+from TrajectoryStore import interpolate_states
+
+STATE_STD = (10, 10, 10, 2, 2, 2)  # m, m/s, default 1 sigma of a state estimate
+SIGMAS = (1, 2, 3)
+COAST, DROGUE, MAIN, LANDED = 0, 1, 2, 3
+
+
+def confidence_ellipses(x, y, sigmas=SIGMAS):
+    # n sigma ellipses of the points, centre, semi axes (m) and angle (deg from east)
+    center = np.array([np.mean(x), np.mean(y)])
+    covariance = np.cov(np.vstack([x, y])) if len(x) > 1 else np.zeros((2, 2))
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    angle = float(np.degrees(np.arctan2(eigenvectors[1, 1], eigenvectors[0, 1])))
+    major, minor = np.sqrt(np.maximum(eigenvalues[::-1], 0))
+    return [
+        {"sigma": sigma, "center": center.tolist(), "semi_major": float(sigma * major),
+         "semi_minor": float(sigma * minor), "angle": angle}
+        for sigma in sigmas
+    ]
+
+
+class LandingPredictor:
+    # descent_rocket: the rocket under the parachutes (NimbusDescent), atmosphere: an
+    # Environment or an environment_table dict, ascent_rocket: for the coast before apogee,
+    # main_altitude: m above the pad (the Nimbus main_trigger is a function, so it's given
+    # here unless the main's trigger is a number), n: ensemble size,
+    # dt, canopy_dt: steps (s) while any sample coasts and once all are under a canopy
+    def __init__(
+        self,
+        descent_rocket,
+        atmosphere,
+        ascent_rocket=None,
+        main_altitude=500,
+        n=500,
+        dt=0.25,
+        canopy_dt=1.0,
+        state_std=STATE_STD,
+        cd_s_std=0.05,
+        wind_std=1.0,
+        altitudes=ALTITUDES,
+        seed=None,
+    ):
+        self.rng = np.random.default_rng(seed)
+        self.n = n
+        self.dt = dt
+        self.canopy_dt = canopy_dt
+        self.state_std = np.asarray(state_std, dtype=float)
+
+        atmosphere = atmosphere if isinstance(atmosphere, dict) else environment_table(atmosphere, altitudes)
+        self.elevation = atmosphere["elevation"]
+        self.table = atmosphere["table"]
+        self.altitudes = np.asarray(altitudes, dtype=float)
+        self.altitude_step = self.altitudes[1] - self.altitudes[0]
+        # one wind realisation per sample, altitude correlated, next to the atmosphere
+        winds = perturbed_winds(self.table[:, [WIND_X, WIND_Y]], n, std=wind_std,
+                                spacing=self.altitude_step, rng=self.rng)
+        atmosphere = np.broadcast_to(self.table[:, [DENSITY, SPEED_OF_SOUND, GRAVITY]], (n, len(self.altitudes), 3))
+        self.atmosphere = np.concatenate([atmosphere, winds], axis=2).reshape(-1, 5)
+
+        # recovery, drag areas dispersed by cd_s_std (fraction)
+        parachutes = {parachute.name: parachute for parachute in descent_rocket.parachutes}
+        drogue, main = parachutes["drogue"], parachutes["main"]
+        self.mass = descent_rocket.dry_mass
+        self.drogue_cd_s = drogue.cd_s * (1 + cd_s_std * self.rng.standard_normal(n))
+        self.main_cd_s = main.cd_s * (1 + cd_s_std * self.rng.standard_normal(n))
+        self.drogue_lag, self.main_lag = drogue.lag, main.lag
+        self.main_altitude = main.trigger if isinstance(main.trigger, (int, float)) else main_altitude
+
+        # coast, power off drag vs Mach and the mass after burn out
+        self.burn_out_time = 0.0
+        self.coast_drag = np.zeros_like(MACH)
+        self.coast_mass = self.mass
+        if ascent_rocket is not None:
+            self.burn_out_time = ascent_rocket.motor.burn_out_time
+            self.coast_drag = np.asarray(ascent_rocket.power_off_drag.get_value(MACH), dtype=float) * ascent_rocket.area
+            self.coast_mass = float(ascent_rocket.total_mass(self.burn_out_time))
+
+    def _atmosphere(self, z, rows):
+        # density, speed of sound, gravity and wind x, y of each sample at z, one gather
+        # from the flattened (n * altitudes, 5) table
+        index = np.clip((z - self.altitudes[0]) / self.altitude_step, 0, len(self.altitudes) - 1.000001)
+        k = index.astype(np.intp)
+        w = (index - k)[:, np.newaxis]
+        flat = rows * len(self.altitudes) + k
+        return (self.atmosphere.take(flat, axis=0) * (1 - w) + self.atmosphere.take(flat + 1, axis=0) * w).T
+
+    def propagate(self, t, states, deployed=()):
+        # landing x, y, time of (n, 6) states at time t, deployed: parachutes already out
+        n = len(states)
+        rows = np.arange(n)
+        position, velocity = states[:, :3].copy(), states[:, 3:].copy()
+        if "main" in deployed:
+            phase = np.full(n, MAIN)
+        elif "drogue" in deployed:
+            phase = np.full(n, DROGUE)
+        else:
+            phase = np.where(velocity[:, 2] > 0, COAST, DROGUE)
+        drogue_time = np.where(phase == COAST, np.inf, t)
+        # a main trigger already passed (still inside the lag) went off when the descent
+        # crossed the trigger altitude
+        below = position[:, 2] - self.elevation - self.main_altitude
+        main_trigger_time = np.where(
+            phase == MAIN, t, np.where((phase == DROGUE) & (below < 0), t + below / np.maximum(-velocity[:, 2], 1), np.inf))
+        # samples the state noise put under the ground land where they are
+        landing = np.full((n, 3), np.nan)
+        grounded = position[:, 2] <= self.elevation
+        landing[grounded] = np.column_stack([position[grounded, :2], np.full(grounded.sum(), t)])
+        phase[grounded] = LANDED
+        time = t
+        while True:
+            flying = phase != LANDED
+            if not flying.any():
+                break
+            coasting = phase == COAST
+            # short steps through the coast, the canopy phases are quasi-steady
+            dt = self.dt if coasting.any() else self.canopy_dt
+            rho, speed_of_sound, gravity, wind_x, wind_y = self._atmosphere(position[:, 2], rows)
+            wind = np.column_stack([wind_x, wind_y, np.zeros(n)])
+            relative = velocity - wind
+            speed = np.sqrt(np.einsum("ij,ij->i", relative, relative))
+
+            # drag area and mass per phase, the added mass under a canopy as rocketpy
+            cd_s = np.where(phase == MAIN, self.main_cd_s, np.where(time >= drogue_time, self.drogue_cd_s, 0.0))
+            cd_s = np.where(coasting, np.interp(speed / speed_of_sound, MACH, self.coast_drag), cd_s)
+            mass = np.where(coasting, self.coast_mass, self.mass)
+            total_mass = mass + np.where(coasting, 0, rho * PARACHUTE_ADDED_MASS_VOLUME)
+
+            # drag implicit in the relative velocity (stable under the main at any step),
+            # rocketpy's 9.8 under a canopy
+            k = 0.5 * rho * cd_s * speed / total_mass
+            relative[:, 2] -= np.where(coasting, gravity, 9.8 * mass / total_mass) * dt
+            relative /= (1 + k * dt)[:, np.newaxis]
+            new_velocity = np.where(flying[:, np.newaxis], relative + wind, velocity)
+            new_position = np.where(flying[:, np.newaxis], position + 0.5 * (velocity + new_velocity) * dt, position)
+            time += dt
+
+            # landing, interpolated to the pad elevation inside the step
+            landed = flying & (new_position[:, 2] <= self.elevation)
+            if landed.any():
+                above = position[landed, 2] - self.elevation
+                fraction = (above / np.maximum(above - (new_position[landed, 2] - self.elevation), 1e-9))[:, np.newaxis]
+                landing[landed, :2] = position[landed, :2] + fraction * (new_position[landed, :2] - position[landed, :2])
+                landing[landed, 2] = time - dt * (1 - fraction[:, 0])
+                phase[landed] = LANDED
+            position, velocity = new_position, new_velocity
+
+            # apogee (drogue), main trigger and inflation
+            apogee = coasting & (velocity[:, 2] <= 0)
+            drogue_time[apogee] = time + self.drogue_lag
+            phase[apogee] = DROGUE
+            under_drogue = phase == DROGUE
+            trigger = under_drogue & np.isinf(main_trigger_time) & (position[:, 2] - self.elevation < self.main_altitude)
+            main_trigger_time[trigger] = time
+            phase[under_drogue & (time >= main_trigger_time + self.main_lag)] = MAIN
+        return landing
+
+    def predict(self, message):
+        # landing ellipses of one telemetry message, None during the burn
+        start = timer.perf_counter()
+        t = float(message["t"])
+        if t < self.burn_out_time:
+            return None
+        std = np.asarray(message.get("std", self.state_std), dtype=float)
+        states = np.asarray(message["state"], dtype=float) + std * self.rng.standard_normal((self.n, 6))
+        landing = self.propagate(t, states, message.get("deployed", ()))
+        return {
+            "t": t,
+            "landing_time": float(np.mean(landing[:, 2])),
+            "ellipses": confidence_ellipses(landing[:, 0], landing[:, 1]),
+            "elapsed_ms": (timer.perf_counter() - start) * 1000,
+        }
+
+    def serve(self, source, publish, every=1):
+        # predictions of every `every`-th message of the source, handed to publish(prediction)
+        for count, message in enumerate(source):
+            if count % every == 0:
+                try:
+                    prediction = self.predict(message)
+                except (KeyError, TypeError, ValueError) as error:  # no t/state, or a malformed one
+                    print(f"Skipped telemetry message {str(message)[:80]}: {error!r}")
+                    continue
+                if prediction is not None:
+                    publish(prediction)
+
+
+# telemetry in
+
+
+def _messages(lines, latest):
+    # the JSON messages of a batch of lines, only the newest when latest (a predictor that
+    # fell behind skips to the current state), None at the end of the stream. Lines that
+    # aren't JSON objects are reported and skipped
+    messages = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError as error:
+            print(f"Skipped malformed telemetry line {line.strip()[:80]}: {error}")
+            continue
+        if not isinstance(message, dict):
+            print(f"Skipped telemetry line {line.strip()[:80]}: not a JSON object")
+            continue
+        messages.append(message)
+    if any(message.get("end") for message in messages):
+        messages = messages[:[message.get("end", False) for message in messages].index(True)] + [None]
+    if latest and messages and messages[-1] is not None:
+        messages = messages[-1:]
+    return messages
+
+
+def file_tail(path, poll=0.01, latest=True, idle_timeout=None):
+    # messages appended to a JSON lines file, as they arrive
+    while not os.path.exists(path):
+        timer.sleep(poll)
+    last = timer.monotonic()
+    with open(path, "r", encoding="utf-8") as file:
+        partial = ""
+        while True:
+            lines = (partial + file.read()).split("\n")
+            lines, partial = lines[:-1], lines[-1]
+            if lines:
+                last = timer.monotonic()
+                for message in _messages(lines, latest):
+                    if message is None:
+                        return
+                    yield message
+            elif idle_timeout is not None and timer.monotonic() - last > idle_timeout:
+                return
+            else:
+                timer.sleep(poll)
+
+
+def udp_source(port, host="0.0.0.0", latest=True, idle_timeout=None):
+    # messages received as UDP datagrams, one JSON object each
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind((host, port))
+        while True:
+            sock.settimeout(idle_timeout)
+            try:
+                datagrams = [sock.recv(65536)]
+            except socket.timeout:
+                return
+            # the rest of what is queued
+            sock.setblocking(False)
+            try:
+                while True:
+                    datagrams.append(sock.recv(65536))
+            except BlockingIOError:
+                pass
+            for message in _messages([datagram.decode(errors="replace") for datagram in datagrams], latest):
+                if message is None:
+                    return
+                yield message
+
+
+# predictions out
+
+
+class JsonLinesPublisher:
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, prediction):
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(prediction) + "\n")
+
+
+class UdpPublisher:
+    def __init__(self, host, port):
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, prediction):
+        self.socket.sendto(json.dumps(prediction).encode(), self.address)
+
+
+def print_prediction(prediction):
+    ellipse = prediction["ellipses"][1]
+    print(f"t = {prediction['t']:6.1f} s  landing ({ellipse['center'][0]:7.1f}, {ellipse['center'][1]:7.1f}) m "
+          f"at {prediction['landing_time']:6.1f} s, 2 sigma {ellipse['semi_major']:5.0f} x {ellipse['semi_minor']:4.0f} m "
+          f"@ {ellipse['angle']:4.0f} deg  ({prediction['elapsed_ms']:.0f} ms)")
+
+
+# stand in telemetry
+
+
+class TelemetryGenerator:
+    # noisy state estimates of rocketpy flights (Ascent, Descent) at `rate` Hz, with the
+    # parachutes out flagged as the flight computer would
+    def __init__(self, flights, rate=10, state_std=STATE_STD, seed=None):
+        self.flights = flights
+        self.rate = rate
+        self.state_std = np.asarray(state_std, dtype=float)
+        self.rng = np.random.default_rng(seed)
+
+    def messages(self):
+        last_time = -np.inf
+        for flight in self.flights:
+            solution = np.asarray(flight.solution, dtype=float)
+            start = max(solution[0, 0], last_time + 1 / self.rate)
+            times = np.arange(start, solution[-1, 0], 1 / self.rate)
+            states = interpolate_states(solution[:, 0], solution[:, 1:], times)[:, :6]
+            states += self.state_std * self.rng.standard_normal(states.shape)
+            events = [(time + parachute.lag, parachute.name) for time, parachute in flight.parachute_events]
+            for t, state in zip(times, states):
+                yield {
+                    "t": float(t),
+                    "state": state.tolist(),
+                    "std": self.state_std.tolist(),
+                    "deployed": [name for time, name in events if time <= t],
+                }
+            last_time = times[-1] if len(times) else last_time
+
+    def to_file(self, path, speed_up=None):
+        # append the messages to a JSON lines file, in (sped up) real time if speed_up
+        with open(path, "a", encoding="utf-8") as file:
+            self._stream(lambda line: (file.write(line + "\n"), file.flush()), speed_up)
+
+    def to_udp(self, host, port, speed_up=1):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            self._stream(lambda line: sock.sendto(line.encode(), (host, port)), speed_up)
+
+    def _stream(self, send, speed_up):
+        start, first = timer.monotonic(), None
+        for message in self.messages():
+            if speed_up:
+                first = message["t"] if first is None else first
+                delay = (message["t"] - first) / speed_up - (timer.monotonic() - start)
+                if delay > 0:
+                    timer.sleep(delay)
+            send(json.dumps(message))
+        send(json.dumps({"end": True}))
+
+
+def _demo_flights():
+    from rocketpy import Environment, Flight
+
+    from Nimbus import Nimbus, NimbusDescent
+
+    env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+    env.set_atmospheric_model(type="custom_atmosphere", wind_u=2, wind_v=3)
+    Ascent = Flight(rocket=Nimbus, environment=env, rail_length=12, inclination=86, heading=0,
+                    terminate_on_apogee=True, name="Ascent")
+    Descent = Flight(rocket=NimbusDescent, environment=env, rail_length=12, inclination=0, heading=0,
+                     initial_solution=Ascent, name="Descent")
+    return env, Nimbus, NimbusDescent, Ascent, Descent
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import threading
+
+    arguments = sys.argv[1:]
+    command = arguments[0] if arguments else "demo"
+
+    def option(name, default=None):
+        return arguments[arguments.index(name) + 1] if name in arguments else default
+
+    if command == "serve":
+        # the forecast hour the launch window picked, or the demo atmosphere
+        from Nimbus import Nimbus, NimbusDescent
+
+        if option("--forecast"):
+            from LaunchWindow import ForecastWindow
+
+            env = ForecastWindow.load(option("--forecast")).environment(int(option("--hour", 0)))
+        else:
+            env = _demo_flights()[0]
+        predictor = LandingPredictor(NimbusDescent, env, ascent_rocket=Nimbus)
+        source = udp_source(int(option("--udp"))) if option("--udp") else file_tail(option("--file", "telemetry.jsonl"))
+        publishers = [print_prediction]
+        if option("--publish-udp"):
+            host, port = option("--publish-udp").split(":")
+            publishers.append(UdpPublisher(host, int(port)))
+        if option("--publish-file"):
+            publishers.append(JsonLinesPublisher(option("--publish-file")))
+        predictor.serve(source, lambda prediction: [publish(prediction) for publish in publishers])
+
+    elif command == "generate":
+        _, _, _, Ascent, Descent = _demo_flights()
+        generator = TelemetryGenerator([Ascent, Descent], rate=float(option("--rate", 10)))
+        if option("--udp"):
+            host, port = option("--udp").split(":")
+            generator.to_udp(host, int(port), speed_up=float(option("--speed-up", 1)))
+        else:
+            generator.to_file(option("--file", "telemetry.jsonl"), speed_up=float(option("--speed-up", 1)))
+
+    else:
+        # the nominal flight replayed at 20x through a file, predicted live
+        env, Nimbus, NimbusDescent, Ascent, Descent = _demo_flights()
+        predictor = LandingPredictor(NimbusDescent, env, ascent_rocket=Nimbus, seed=0)
+        path = os.path.join(tempfile.mkdtemp(), "telemetry.jsonl")
+        generator = TelemetryGenerator([Ascent, Descent], rate=10, seed=0)
+        writer = threading.Thread(target=generator.to_file, args=(path,), kwargs={"speed_up": 20})
+        writer.start()
+
+        latencies = []
+
+        def publish(prediction):
+            latencies.append(prediction["elapsed_ms"])
+            if len(latencies) % 10 == 1:
+                print_prediction(prediction)
+
+        predictor.serve(file_tail(path), publish)
+        writer.join()
+        print(f"actual landing ({Descent.x_impact:.1f}, {Descent.y_impact:.1f}) m at {Descent.t_final:.1f} s")
+        print(f"{len(latencies)} predictions of {predictor.n} samples, {np.mean(latencies):.1f} ms mean, "
+              f"{np.max(latencies):.1f} ms max")
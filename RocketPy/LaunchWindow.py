@@ -0,0 +1,336 @@
+# Launch window scanner over forecast hours (and rail headings)
+# The Nimbus scripts fly one forecast hour (env.set_date(..., 12)), so a launch window
+# meant editing the hour and rerunning, with rocketpy re-reading the forecast every time.
+# ForecastWindow reads the profiles of every hour of the window from the forecast in one
+# pass (one request per variable) into small per hour tables, which can be saved and
+# reused. LaunchWindowScanner then flies the nominal (and optionally dispersed) Nimbus for
+# every hour x heading on a process pool, each worker building its rockets once, and ranks
+# the windows by landing distance, worst drift and rail exit stability.
+#
+# usage:
+#   forecast = ForecastWindow("GFS", start=datetime.datetime(2024, 10, 12, 6), hours=12)
+#   scanner = LaunchWindowScanner(forecast, headings=(0, 90, 180, 270), n_dispersed=10)
+#   ranking = scanner.rank(scanner.scan())
+#   scanner.print_ranking(ranking)
+
+# imports
+import bisect
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import netCDF4
+import numpy as np
+from rocketpy import Environment, Function
+
+# same variable names rocketpy uses for the NOAA GFS OPeNDAP files
+GFS_DICTIONARY = {
+    "time": "time",
+    "latitude": "lat",
+    "longitude": "lon",
+    "level": "lev",
+    "temperature": "tmpprs",
+    "geopotential_height": "hgtprs",
+    "u_wind": "ugrdprs",
+    "v_wind": "vgrdprs",
+}
+
+LATITUDE, LONGITUDE, ELEVATION = 39.4751, -8.3764, 78  # EuRoC, as in the Nimbus scripts
+
+
+def latest_gfs_url(attempts=10):
+    # newest 0.25 deg GFS run on the NOMADS OPeNDAP server, as rocketpy's file="GFS"
+    time_attempt = datetime.datetime.utcnow()
+    for attempt in range(attempts):
+        time_attempt -= datetime.timedelta(hours=6 * attempt)
+        url = "https://nomads.ncep.noaa.gov/dods/gfs_0p25/gfs{:04d}{:02d}{:02d}/gfs_0p25_{:02d}z".format(
+            time_attempt.year, time_attempt.month, time_attempt.day, 6 * (time_attempt.hour // 6)
+        )
+        try:
+            netCDF4.Dataset(url).close()
+            return url
+        except OSError:
+            continue
+    raise RuntimeError("Unable to find a recent GFS run on the NOMADS server")
+
+
+def _bracket(array, value):
+    # index i such that value lies between array[i - 1] and array[i] (ascending or not)
+    array = list(array)
+    if array[0] > array[-1]:
+        i = len(array) - bisect.bisect_left(array[::-1], value)
+    else:
+        i = bisect.bisect(array, value)
+    if i == len(array) and array[-1] == value:
+        i -= 1
+    if i == 0 or i == len(array):
+        raise ValueError(f"{value} is outside the forecast grid ({array[0]} to {array[-1]})")
+    return i
+
+
+class ForecastWindow:
+    # per hour atmosphere tables at the launch site: height (m ASL), pressure (Pa),
+    # temperature (K), wind_u / wind_v (m/s), one row per pressure level
+    def __init__(
+        self,
+        file="GFS",
+        start=None,
+        hours=24,
+        step=1,
+        dictionary=GFS_DICTIONARY,
+        latitude=LATITUDE,
+        longitude=LONGITUDE,
+        elevation=ELEVATION,
+    ):
+        self.latitude, self.longitude, self.elevation = latitude, longitude, elevation
+        self.tables = []
+        if file is None:
+            return  # filled by load()
+        if file == "GFS":
+            file = latest_gfs_url()
+        start = start or datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        self._read(file, dictionary, start, hours, step)
+
+    def _read(self, file, dictionary, start, hours, step):
+        data = netCDF4.Dataset(file)
+        try:
+            time_array = data.variables[dictionary["time"]]
+            dates = netCDF4.num2date(time_array[:], time_array.units, calendar="gregorian")
+            # times are stored as fractional days, round to the minute
+            dates = [
+                datetime.datetime(*(date + datetime.timedelta(seconds=30)).timetuple()[:5])
+                for date in dates
+            ]
+            end = start + datetime.timedelta(hours=hours)
+            wanted = [i for i, date in enumerate(dates) if start <= date <= end]
+            if not wanted:
+                raise ValueError(
+                    f"The forecast covers {dates[0]} to {dates[-1]}, not {start} to {end}"
+                )
+            first, last = wanted[0], wanted[-1]
+
+            lat_array = np.asarray(data.variables[dictionary["latitude"]][:])
+            lon_array = np.asarray(data.variables[dictionary["longitude"]][:])
+            lon = self.longitude
+            if lon_array.min() >= 0:
+                lon %= 360
+            i_lat = _bracket(lat_array, self.latitude)
+            i_lon = _bracket(lon_array, lon)
+
+            # bilinear weights of the four surrounding grid points
+            x1, x2 = lat_array[i_lat - 1], lat_array[i_lat]
+            y1, y2 = lon_array[i_lon - 1], lon_array[i_lon]
+            wx = (self.latitude - x1) / (x2 - x1)
+            wy = (lon - y1) / (y2 - y1)
+            weights = np.array([[(1 - wx) * (1 - wy), (1 - wx) * wy], [wx * (1 - wy), wx * wy]])
+
+            # one read per variable for the whole window
+            def read(name):
+                values = data.variables[dictionary[name]][
+                    first : last + 1, :, i_lat - 1 : i_lat + 1, i_lon - 1 : i_lon + 1
+                ]
+                return np.ma.sum(values * weights, axis=(2, 3))
+
+            levels = 100 * np.asarray(data.variables[dictionary["level"]][:])  # mbar to Pa
+            geopotential_height = read("geopotential_height")
+            temperature = read("temperature")
+            wind_u = read("u_wind")
+            wind_v = read("v_wind")
+        finally:
+            data.close()
+
+        # geopotential to geometric height, as rocketpy does
+        R = Environment(latitude=self.latitude, longitude=self.longitude).earth_radius
+        for k, i in enumerate(range(first, last + 1)):
+            if (i - first) % step:
+                continue
+            rows = np.ma.column_stack(
+                [geopotential_height[k], levels, temperature[k], wind_u[k], wind_v[k]]
+            )
+            rows = np.ma.compress_rows(rows) if np.ma.is_masked(rows) else np.asarray(rows)
+            rows[:, 0] = R * rows[:, 0] / (R - rows[:, 0])
+            rows = rows[rows[:, 0].argsort()]
+            self.tables.append(
+                {
+                    "date": dates[i],
+                    "height": rows[:, 0],
+                    "pressure": rows[:, 1],
+                    "temperature": rows[:, 2],
+                    "wind_u": rows[:, 3],
+                    "wind_v": rows[:, 4],
+                }
+            )
+
+    @property
+    def dates(self):
+        return [table["date"] for table in self.tables]
+
+    def environment(self, index):
+        return table_environment(self.tables[index], self.latitude, self.longitude, self.elevation)
+
+    def save(self, path):
+        arrays = {"site": np.array([self.latitude, self.longitude, self.elevation])}
+        arrays["dates"] = np.array([date.isoformat() for date in self.dates])
+        for i, table in enumerate(self.tables):
+            for key in ("height", "pressure", "temperature", "wind_u", "wind_v"):
+                arrays[f"{key}_{i}"] = table[key]
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            window = cls(file=None)
+            window.latitude, window.longitude, window.elevation = data["site"].tolist()
+            for i, date in enumerate(data["dates"]):
+                table = {"date": datetime.datetime.fromisoformat(str(date))}
+                for key in ("height", "pressure", "temperature", "wind_u", "wind_v"):
+                    table[key] = data[f"{key}_{i}"]
+                window.tables.append(table)
+        return window
+
+
+def table_environment(table, latitude=LATITUDE, longitude=LONGITUDE, elevation=ELEVATION):
+    # rocketpy Environment from one hour's table, profiles linearly interpolated in height
+    env = Environment(latitude=latitude, longitude=longitude, elevation=elevation)
+    date = table["date"]
+    env.set_date((date.year, date.month, date.day, date.hour))
+
+    # the lowest pressure level can sit above the pad, extend the profiles down to it
+    # (log linear pressure, the rest held constant) as custom_atmosphere won't extrapolate
+    height, pressure = table["height"], table["pressure"]
+    if height[0] > elevation:
+        slope = np.log(pressure[1] / pressure[0]) / (height[1] - height[0])
+        height = np.insert(height, 0, elevation)
+        pressure = np.insert(pressure, 0, pressure[0] * np.exp(slope * (elevation - table["height"][0])))
+
+    def profile(values):
+        if len(values) < len(height):
+            values = np.insert(values, 0, values[0])
+        return np.column_stack([height, values])
+
+    env.set_atmospheric_model(
+        type="custom_atmosphere",
+        pressure=profile(pressure),
+        temperature=profile(table["temperature"]),
+        wind_u=profile(table["wind_u"]),
+        wind_v=profile(table["wind_v"]),
+    )
+    # rocketpy discretises the inverse of a custom pressure profile over 0 to 1000 Pa, so the
+    # barometric height (what the parachute triggers see) is the profile's top everywhere
+    env.barometric_height = Function(
+        np.column_stack([pressure[::-1], height[::-1]]), inputs="Pressure (Pa)",
+        outputs="Height Above Sea Level (m)", interpolation="linear", extrapolation="natural",
+    )
+    return env
+
+
+def fly_nimbus(env, inclination=86, heading=0):
+    # nominal Nimbus ascent and descent, as the Nimbus scripts fly them
+    from rocketpy import Flight
+
+    from FlightResults import FlightResults
+    from Nimbus import Nimbus, NimbusDescent
+
+    ascent = Flight(
+        rocket=Nimbus, environment=env, rail_length=12, inclination=inclination,
+        heading=heading, terminate_on_apogee=True, name="Ascent",
+    )
+    descent = Flight(
+        rocket=NimbusDescent, environment=env, rail_length=12, inclination=0,
+        heading=0, initial_solution=ascent, name="Descent",
+    )
+    return FlightResults(ascent, descent)
+
+
+def evaluate_window(table, heading, site, inclination=86, n_dispersed=0, seed=None):
+    # worker: nominal flight (and dispersed ones) for one hour and rail heading
+    env = table_environment(table, *site)
+
+    nominal = fly_nimbus(env, inclination, heading)
+    landing = nominal.landing_point
+    distances = [float(np.hypot(landing["x"], landing["y"]))]
+
+    # rail pointing dispersion as in NimbusMonteCarlo's StochasticFlight
+    rng = np.random.default_rng(seed)
+    for _ in range(n_dispersed):
+        dispersed = fly_nimbus(env, rng.normal(inclination, 1), rng.normal(heading, 2))
+        dispersed = dispersed.landing_point
+        distances.append(float(np.hypot(dispersed["x"], dispersed["y"])))
+
+    return {
+        "date": table["date"],
+        "heading": heading,
+        "apogee_agl": nominal.apogee_agl,
+        "landing_x": landing["x"],
+        "landing_y": landing["y"],
+        "landing_distance": distances[0],
+        "max_drift": max(distances),
+        "rail_exit_velocity": nominal.rail_exit_velocity,
+        "rail_exit_stability": nominal.stability_margins["out_of_rail"],
+        "ground_wind": float(np.hypot(table["wind_u"][0], table["wind_v"][0])),
+    }
+
+
+class LaunchWindowScanner:
+    def __init__(self, forecast, headings=(0,), inclination=86, n_dispersed=0, max_workers=None):
+        self.forecast = forecast
+        self.headings = headings
+        self.inclination = inclination
+        self.n_dispersed = n_dispersed
+        self.max_workers = max_workers
+
+    def scan(self):
+        site = (self.forecast.latitude, self.forecast.longitude, self.forecast.elevation)
+        tasks = [
+            (table, heading) for table in self.forecast.tables for heading in self.headings
+        ]
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [
+                pool.submit(
+                    evaluate_window, table, heading, site, self.inclination,
+                    self.n_dispersed, seed,
+                )
+                for seed, (table, heading) in enumerate(tasks)
+            ]
+            return [future.result() for future in futures]
+
+    @staticmethod
+    def rank(results, min_rail_exit_stability=1.5, min_rail_exit_velocity=0):
+        # windows that meet the rail exit limits first, then by worst case drift and
+        # nominal landing distance
+        def key(result):
+            unsafe = (
+                result["rail_exit_stability"] < min_rail_exit_stability
+                or result["rail_exit_velocity"] < min_rail_exit_velocity
+            )
+            return (unsafe, result["max_drift"], result["landing_distance"])
+
+        return sorted(results, key=key)
+
+    @staticmethod
+    def print_ranking(ranking, top=10):
+        print(" rank  date (UTC)         heading  landing (m)  max drift (m)  rail exit (m/s, c)")
+        for rank, result in enumerate(ranking[:top], start=1):
+            print(
+                f"{rank:5d}  {result['date']:%Y-%m-%d %H:%M}  {result['heading']:7.0f}"
+                f"  {result['landing_distance']:11.0f}  {result['max_drift']:13.0f}"
+                f"  {result['rail_exit_velocity']:8.1f}, {result['rail_exit_stability']:.2f}"
+            )
+
+
+if __name__ == "__main__":
+    import sys
+    import time as timer
+
+    # python RocketPy/LaunchWindow.py [forecast file or "GFS"] [hours]
+    file = sys.argv[1] if len(sys.argv) > 1 else "GFS"
+    hours = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    start = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+
+    forecast = ForecastWindow(file, start=start, hours=hours)
+    print(f"{len(forecast.tables)} forecast hours from {forecast.dates[0]}")
+
+    scanner = LaunchWindowScanner(forecast, headings=(0, 90, 180, 270), n_dispersed=5)
+    begin = timer.perf_counter()
+    ranking = scanner.rank(scanner.scan())
+    print(f"{len(ranking)} windows in {timer.perf_counter() - begin:.1f} s")
+    scanner.print_ranking(ranking)
@@ -0,0 +1,155 @@
+# Component based mass properties shared by the ascent/descent rockets
+# The scripts hand enter the mass, centre of mass and inertia of every Rocket copy, and the
+# copies disagree (NimbusDescent 49.892 kg in Nimbus.py vs 32.793 kg elsewhere).
+# Here each component (airframe, recovery bay, and the payload deployed at apogee) is declared
+# once, with its mass, centre of mass and inertia about its own centre of mass, and a
+# configuration is composed with the parallel axis theorem:
+#   m = sum m_i,  cg = sum m_i cg_i / m,  I = sum (I_i + m_i (cg_i - cg)^2)   (I_33: sum I_i)
+# compose() works on arrays (any leading shape), so sweeps and Monte Carlo samples recompose
+# thousands of configurations in one call, and sample_configurations() recomposes every
+# configuration from the same component draws (the ascent and descent of a Monte Carlo
+# sample share their airframe).
+# Positions are along the rocket axis in the scripts' coordinates (tail_to_nose, motor at 0),
+# everything excludes the motor and tanks, as rocketpy's Rocket(mass=..., inertia=...).
+#
+# usage:
+#   Nimbus = Rocket(radius=0.097, **NIMBUS_MASS.rocket_kwargs("ascent"), ...)
+#   samples = NIMBUS_MASS.sample("ascent", 1000, {"payload": {"mass": 0.2, "cg": 0.05}})
+#   samples = NIMBUS_MASS.sample_configurations(1000, {"payload": {"mass": 0.2}})  # {"ascent": ..., "descent": ...}
+
+# imports
+import numpy as np
+
+
+class Component:
+    # mass (kg), cg (m), inertia (I_11, I_22, I_33) about the component's own cg (kg m^2)
+    def __init__(self, name, mass, cg, inertia=(0, 0, 0)):
+        self.name = name
+        self.mass = float(mass)
+        self.cg = float(cg)
+        self.inertia = np.asarray(inertia, dtype=float)
+
+    @classmethod
+    def cylinder(cls, name, mass, cg, length, radius):
+        # solid cylinder along the rocket axis
+        transverse = mass * (3 * radius**2 + length**2) / 12
+        return cls(name, mass, cg, (transverse, transverse, mass * radius**2 / 2))
+
+    @classmethod
+    def tube(cls, name, mass, cg, length, radius):
+        # thin walled tube along the rocket axis, mass spread evenly over its length
+        transverse = mass * (radius**2 / 2 + length**2 / 12)
+        return cls(name, mass, cg, (transverse, transverse, mass * radius**2))
+
+    def __repr__(self):
+        return f"Component('{self.name}', {self.mass:.3f} kg at {self.cg:.3f} m)"
+
+
+def compose(masses, cgs, inertias):
+    # masses, cgs: (..., n_components), inertias: (..., n_components, 3)
+    # -> total mass (...), cg (...), inertia about the total cg (..., 3)
+    masses, cgs, inertias = (np.asarray(a, dtype=float) for a in (masses, cgs, inertias))
+    mass = masses.sum(axis=-1)
+    cg = (masses * cgs).sum(axis=-1) / mass
+    transfer = (masses * (cgs - cg[..., np.newaxis]) ** 2).sum(axis=-1)
+    inertia = inertias.sum(axis=-2)
+    inertia[..., :2] += transfer[..., np.newaxis]
+    return mass, cg, inertia
+
+
+class MassModel:
+    # components: list of Component, configurations: {name: [component names]}
+    def __init__(self, components, configurations):
+        self.components = {component.name: component for component in components}
+        self.configurations = configurations
+        for configuration, names in configurations.items():
+            for name in names:
+                if name not in self.components:
+                    raise ValueError(f"Unknown component '{name}' in configuration '{configuration}'")
+
+    def _arrays(self, configuration):
+        components = [self.components[name] for name in self.configurations[configuration]]
+        return (
+            np.array([component.mass for component in components]),
+            np.array([component.cg for component in components]),
+            np.array([component.inertia for component in components]),
+        )
+
+    def properties(self, configuration):
+        mass, cg, inertia = compose(*self._arrays(configuration))
+        return {"mass": float(mass), "cg": float(cg), "inertia": tuple(inertia.tolist())}
+
+    def rocket_kwargs(self, configuration):
+        # mass, inertia and center_of_mass_without_motor for rocketpy's Rocket
+        properties = self.properties(configuration)
+        return {
+            "mass": properties["mass"],
+            "inertia": properties["inertia"],
+            "center_of_mass_without_motor": properties["cg"],
+        }
+
+    def sample_configurations(self, n, dispersions=None, rng=None):
+        # n draws of every component with normal dispersions, each configuration composed
+        # from the same draws
+        # dispersions: {component: {"mass": std (kg), "cg": std (m), "inertia": relative std}}
+        # returns {configuration: (mass (n,), cg (n,), inertia (n, 3))}
+        rng = np.random.default_rng(rng)
+        draws = {}
+        for name, component in self.components.items():
+            dispersion = (dispersions or {}).get(name, {})
+            draws[name] = (
+                component.mass + rng.normal(0, dispersion.get("mass", 0), n),
+                component.cg + rng.normal(0, dispersion.get("cg", 0), n),
+                component.inertia * (1 + rng.normal(0, dispersion.get("inertia", 0), (n, 1))),
+            )
+        samples = {}
+        for configuration, names in self.configurations.items():
+            masses, cgs, inertias = zip(*(draws[name] for name in names))
+            samples[configuration] = compose(np.stack(masses, axis=-1), np.stack(cgs, axis=-1), np.stack(inertias, axis=-2))
+        return samples
+
+    def sample(self, configuration, n, dispersions=None, rng=None):
+        # n dispersed configurations, per sample mass (n,), cg (n,), inertia (n, 3)
+        return self.sample_configurations(n, dispersions, rng)[configuration]
+
+    def table(self):
+        # every configuration next to the others, to catch copies drifting apart
+        for configuration in self.configurations:
+            properties = self.properties(configuration)
+            inertia = ", ".join(f"{value:.3f}" for value in properties["inertia"])
+            print(f"{configuration:<10} {properties['mass']:8.3f} kg  cg {properties['cg']:.3f} m  "
+                  f"I ({inertia}) kg m^2")
+
+
+# Nimbus, from the layout: tanks up to ~2.5 m, canards at 3.04 m, nose from 3.93 to 4.28 m.
+# The airframe (body tube, fins, boattail, nose, bulkheads) is spread evenly over the 4.28 m,
+# its mass keeps the scripts' 32.793 kg descent rocket. The recovery bay (drogue, main,
+# harness, deployment hardware) sits between the tanks and the canards, the payload in the
+# bay under the nose. Swap in the weighed values as components are built
+AIRFRAME = Component.tube("airframe", 30.293, 4.28 / 2, 4.28, 0.097)
+RECOVERY = Component.cylinder("recovery", 2.5, 3.2, 0.6, 0.09)
+PAYLOAD = Component.cylinder("payload", 3.0, 3.7, 0.3, 0.09)
+
+NIMBUS_MASS = MassModel(
+    [AIRFRAME, RECOVERY, PAYLOAD],
+    {
+        "ascent": ["airframe", "recovery", "payload"],  # Nimbus / NimbusAscent
+        "descent": ["airframe", "recovery"],  # payload deployed at apogee, also the ballistic case
+    },
+)
+
+if __name__ == "__main__":
+    import time as timer
+
+    NIMBUS_MASS.table()
+
+    # a Monte Carlo's worth of recomposed mass properties
+    start = timer.perf_counter()
+    mass, cg, inertia = NIMBUS_MASS.sample(
+        "ascent", 100_000,
+        {"airframe": {"mass": 0.1, "cg": 0.01, "inertia": 0.02}, "payload": {"mass": 0.1, "cg": 0.05}},
+        rng=0,
+    )
+    print(f"{len(mass)} samples in {timer.perf_counter() - start:.3f} s")
+    print(f"mass {mass.mean():.3f} +- {mass.std():.3f} kg, cg {cg.mean():.3f} +- {cg.std():.3f} m, "
+          f"I_11 {inertia[:, 0].mean():.2f} +- {inertia[:, 0].std():.2f} kg m^2")
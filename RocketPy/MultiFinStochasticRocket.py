@@ -0,0 +1,154 @@
+# StochasticRocket that can hold several fin sets (e.g. Nimbus fins + canards)
+# rocketpy's StochasticRocket looks up the nominal position of a surface by checking only
+# the first surface of the same type on the nominal rocket and raises otherwise, so a
+# second StochasticTrapezoidalFins (the canards) could never be added.
+# Every sampled rocket also gets its fin aero coefficients flattened: rocketpy evaluates
+# each fin set's lift/roll coefficients through a chain of nested Function lambdas every
+# solver step (the Prandtl-Glauert factor alone is evaluated ~10 times per fin set), the
+# constants of all fin sets are collected in one pass and each coefficient becomes a single
+# closure, so the canards don't double the per-step aerodynamic cost.
+# set_mass_samples hands out precomposed mass properties (MassModel.sample_configurations)
+# in order instead of the independent mass/inertia draws, so the ascent and descent rockets
+# of the same Monte Carlo sample index carry the same airframe.
+
+# imports
+import numpy as np
+from rocketpy import Function
+from rocketpy.rocket.aero_surface import Fins
+from rocketpy.stochastic import StochasticRocket
+from rocketpy.stochastic.stochastic_aero_surfaces import StochasticRailButtons
+from rocketpy.stochastic.stochastic_motor_model import StochasticMotorModel
+
+def _incompressible_clalpha2D(fins):
+    # 2D lift slope of the fin section, same as rocketpy's Fins.evaluate_lift_coefficient
+    if not fins.airfoil:
+        return 2 * np.pi
+    clalpha2D = fins.airfoil_cl.differentiate_complex_step(x=1e-3, dx=1e-3)
+    if fins.airfoil[1] == "degrees":
+        clalpha2D *= 180 / np.pi
+    return clalpha2D
+
+
+def fin_coefficient_constants(fin_sets):
+    # everything in rocketpy's fin lift/roll coefficients apart from the compressibility
+    # correction is constant, collect those constants for all fin sets in one array
+    # columns: 2D lift slope, 2*pi*AR/cos(gamma_c), (Af/Aref)*cos(gamma_c),
+    #          clalpha multiple/single fin, roll forcing/single fin, roll damping/single fin
+    constants = np.empty((len(fin_sets), 6))
+    for i, fins in enumerate(fin_sets):
+        clf_delta, cld_omega, _ = fins.roll_parameters
+        single = fins.clalpha_single_fin.get_value_opt(0)
+        constants[i] = (
+            _incompressible_clalpha2D(fins),
+            2 * np.pi * fins.AR / np.cos(fins.gamma_c),
+            fins.Af / fins.ref_area * np.cos(fins.gamma_c),
+            fins.clalpha_multiple_fins.get_value_opt(0) / single,
+            clf_delta.get_value_opt(0) / single,
+            cld_omega.get_value_opt(0) / single,
+        )
+    return constants
+
+
+def _single_fin_clalpha(clalpha2D_incompressible, fd_factor, area_factor, beta):
+    # rocketpy's clalpha_single_fin flattened into one closure (Diederich's correlation)
+    def clalpha_single_fin(mach):
+        clalpha2D = clalpha2D_incompressible / beta(mach)
+        FD = fd_factor / clalpha2D
+        return clalpha2D * FD * area_factor / (2 + FD * (1 + (2 / FD) ** 2) ** 0.5)
+
+    return clalpha_single_fin
+
+
+def _scaled(function, factor):
+    return lambda mach: factor * function(mach)
+
+
+def _linear_lift(clalpha):
+    # cl(alpha, mach) = alpha * clalpha(mach), as rocketpy defines it for fins
+    return lambda alpha, mach: alpha * clalpha(mach)
+
+
+def flatten_fin_coefficients(rocket):
+    # replace the lambda chains behind every fin set's lift and roll coefficients with
+    # single closures built from the shared constants, same values as rocketpy's
+    fin_sets = [
+        surface for surface, _ in rocket.aerodynamic_surfaces if isinstance(surface, Fins)
+    ]
+    if not fin_sets:
+        return None
+
+    constants = fin_coefficient_constants(fin_sets)
+    for fins, (c2d, fd_factor, area_factor, k_cl, k_clf, k_cld) in zip(fin_sets, constants):
+        single = _single_fin_clalpha(c2d, fd_factor, area_factor, fins._beta)
+        fins.clalpha = Function(
+            _scaled(single, k_cl),
+            "Mach",
+            f"Lift coefficient derivative for {fins.n} fins",
+        )
+        fins.clalpha_multiple_fins = fins.clalpha
+        fins.cl = Function(
+            _linear_lift(fins.clalpha.get_value_opt),
+            ["Alpha (rad)", "Mach"],
+            "Lift coefficient",
+        )
+        fins.roll_parameters = [
+            Function(_scaled(single, k_clf), "Mach", "Roll moment forcing coefficient derivative"),
+            Function(_scaled(single, k_cld), "Mach", "Roll moment damping coefficient derivative"),
+            fins.roll_parameters[2],
+        ]
+
+    return constants
+
+
+class MultiFinStochasticRocket(StochasticRocket):
+    # drop in replacement for StochasticRocket, same arguments
+    def _create_get_position(self, validated_object):
+        # motors and rail buttons only ever have one instance, keep rocketpy's lookup
+        if isinstance(validated_object, (StochasticMotorModel, StochasticRailButtons)):
+            return super()._create_get_position(validated_object)
+
+        error_msg = (
+            "`position` standard deviation was provided but the rocket does "
+            f"not have the same {validated_object.object.__class__.__name__} "
+            "to get the nominal position value from."
+        )
+
+        # search every surface of the same type, not just the first one
+        def get_surface_position(self_object, _):
+            surfaces = self_object.aerodynamic_surfaces.get_tuple_by_type(
+                validated_object.object.__class__
+            )
+            for surface in surfaces:
+                if surface.component is validated_object.object:
+                    return surface.position
+            raise AssertionError(error_msg)
+
+        return get_surface_position
+
+    def set_mass_samples(self, mass, cg, inertia):
+        # per sample mass (n,), cg (n,) and inertia (n, 3), used in order by create_object
+        # (kept in a dict, rocketpy's dict_generator draws every tuple/list attribute)
+        self._mass_samples = {"mass": np.asarray(mass), "cg": np.asarray(cg), "inertia": np.asarray(inertia)}
+        self._mass_sample_index = 0
+
+    def dict_generator(self):
+        for generated_dict in super().dict_generator():
+            samples = getattr(self, "_mass_samples", None)
+            if samples is not None:
+                if self._mass_sample_index >= len(samples["mass"]):
+                    raise IndexError("Ran out of mass samples, draw one per simulation")
+                i = self._mass_sample_index
+                self._mass_sample_index += 1
+                generated_dict.update(
+                    mass=float(samples["mass"][i]),
+                    center_of_mass_without_motor=float(samples["cg"][i]),
+                    I_11_without_motor=float(samples["inertia"][i, 0]),
+                    I_22_without_motor=float(samples["inertia"][i, 1]),
+                    I_33_without_motor=float(samples["inertia"][i, 2]),
+                )
+            yield generated_dict
+
+    def create_object(self):
+        rocket = super().create_object()
+        flatten_fin_coefficients(rocket)
+        return rocket
@@ -3,8 +3,13 @@ os.chdir(os.path.dirname(os.path.realpath(__file__)))
 os.chdir("..")
 
 # imports
-from rocketpy import Environment, Rocket, Flight, CompareFlights
+from rocketpy import Environment, Rocket, Flight
 from Thanos import Thanos_R
+from MassProperties import NIMBUS_MASS
+from Airfoils import load_airfoil
+from FlightResults import FlightResults, HEADLESS
+from FlightCache import cached_flight
+from FlightProfiler import FlightProfiler, PROFILE
 import datetime
 
 
@@ -14,21 +19,17 @@ import datetime
 # the individual payload + parafoil is not simulated, that's for our guided recovery sim
 Nimbus = Rocket(
     radius=0.097,
-    mass=35.793,  # mass is excluding tanks and engine
-    inertia=(58.1, 58.1, 0.231),
+    **NIMBUS_MASS.rocket_kwargs("ascent"),  # excluding tanks and engine, see MassProperties.py
     power_off_drag="RocketPy/dragCurve.csv",
     power_on_drag="RocketPy/dragCurve.csv",
-    center_of_mass_without_motor=4.28 - 2.3,
     coordinate_system_orientation="tail_to_nose",
 )
 
 NimbusDescent = Rocket(
     radius=0.097,
-    mass=49.892,  # mass is excluding tanks and engine
-    inertia=(42.2, 42.2, 0.222),
+    **NIMBUS_MASS.rocket_kwargs("descent"),  # excluding tanks and engine, see MassProperties.py
     power_off_drag="RocketPy/dragCurve.csv",
     power_on_drag="RocketPy/dragCurve.csv",
-    center_of_mass_without_motor=4.28 - 2.24,
     coordinate_system_orientation="tail_to_nose",
 )
 
@@ -59,6 +60,9 @@ fins2 = NimbusDescent.add_trapezoidal_fins(
     radius=0.076,
 )
 
+# the NACA0012 table is loaded once and shared by every fin set (see Airfoils.py)
+NACA0012 = load_airfoil("NACA0012")
+
 canards = Nimbus.add_trapezoidal_fins(
     n=3,
     root_chord=0.12,
@@ -67,7 +71,7 @@ canards = Nimbus.add_trapezoidal_fins(
     span=0.06,
     position=3.04,
     cant_angle=0,
-    airfoil=("RocketPy/NACA0012.csv", "degrees"),
+    airfoil=NACA0012.rocketpy_airfoil,
 )
 
 canards2 = NimbusDescent.add_trapezoidal_fins(
@@ -78,7 +82,7 @@ canards2 = NimbusDescent.add_trapezoidal_fins(
     span=0.06,
     position=3.04,
     cant_angle=0,
-    airfoil=("RocketPy/NACA0012.csv", "degrees"),
+    airfoil=NACA0012.rocketpy_airfoil,
 )
 
 boattail = Nimbus.add_tail(top_radius=0.097, bottom_radius=0.076, length=0.302, position=0.302)
@@ -127,23 +131,27 @@ if __name__ == "__main__":
     env.set_atmospheric_model(type="Forecast", file="GFS")
 
     # draw rocket
-    Nimbus.draw()
-
-    # Flights
-    Ascent = Flight(rocket=Nimbus, environment=env, rail_length=12, inclination=86, heading=0, terminate_on_apogee=True, name="Ascent")
-    Descent = Flight(rocket=NimbusDescent, environment=env, rail_length=12, inclination=0, heading=0, initial_solution=Ascent, name="Descent")
-
-    # Results
-    comparison = CompareFlights([Ascent, Descent])
-    comparison.trajectories_3d(legend=True)
-
-    print("----- ENV INFO -----")
-    env.all_info()
-    print("----- THANOS INFO -----")
-    Thanos_R.all_info()
-    print("----- Nimbus INFO -----")
-    Nimbus.all_info()
-    print("----- ASCENT INFO -----")
-    Ascent.all_info()
-    print("----- DESCENT INFO -----")
-    Descent.info()
\ No newline at end of file
+    if not HEADLESS:
+        Nimbus.draw()
+
+    # Flights, from the flight cache when nothing changed (NIMBUS_PROFILE=1 simulates them
+    # and prints where their time goes)
+    simulate = Flight if PROFILE else cached_flight
+    with FlightProfiler([Nimbus, NimbusDescent], env, name="Nimbus", enabled=PROFILE) as profiler:
+        Ascent = simulate(rocket=Nimbus, environment=env, rail_length=12, inclination=86, heading=0, terminate_on_apogee=True, name="Ascent")
+        Descent = simulate(rocket=NimbusDescent, environment=env, rail_length=12, inclination=0, heading=0, initial_solution=Ascent, name="Descent")
+    if PROFILE:
+        profiler.table()
+
+    # Results (plots and full info dumps are skipped when headless)
+    results = FlightResults(Ascent, Descent, name="Nimbus")
+    results.save_summary()
+
+    if not HEADLESS:
+        print("----- ENV INFO -----")
+        env.all_info()
+        print("----- THANOS INFO -----")
+        Thanos_R.all_info()
+        print("----- Nimbus INFO -----")
+        Nimbus.all_info()
+    results.all_info()
@@ -6,31 +6,42 @@ os.chdir(os.path.dirname(os.path.realpath(__file__)))
 os.chdir("..")
 
 # Import necessary modules
-from rocketpy import Environment, Rocket, Flight, CompareFlights, MonteCarlo, GenericMotor
+from rocketpy import Environment, Rocket, Flight, CompareFlights, MonteCarlo
 from rocketpy.stochastic import (
     StochasticEnvironment,
-    StochasticRocket,
     StochasticFlight,
     StochasticNoseCone,
     StochasticTail,
     StochasticTrapezoidalFins,
 )
-from Thanos import Thanos_R
+from Thanos import Thanos_R, ox_tank, fuel_tank, press_tank
+from MassProperties import NIMBUS_MASS
+from StochasticLiquidMotor import StochasticLiquidMotor, StochasticMassFlowRateBasedTank
+from MultiFinStochasticRocket import MultiFinStochasticRocket
+from StochasticRecovery import RecoveryCampaign, StochasticRecoveryParachute
+from Airfoils import load_airfoil
+from LandingHeatmap import LandingHeatmap
+from Payload import ParafoilDescent, deployment_states_from_outputs, ensemble_winds, perturbed_winds
 import datetime
+import json
+import numpy as np
+
+# Launch rail and the dispersion of its angles
+RAIL_LENGTH = 12
+INCLINATION = (86, 1)  # mean = 86, std = 1
+HEADING = (0, 2)  # mean = 0, std = 2
+
+# The environment and the flights are built by the functions below, importing this script (Sensitivity.py)
+# only builds the rockets and their stochastic counterparts
 
 # Initialising the (deterministic) simulation environment
-env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
-envtime = datetime.date.today()
-env.set_date((envtime.year, envtime.month, envtime.day, 12))  # UTC time
-env.set_atmospheric_model(type="Ensemble", file="GEFS") # type argument is now "Ensemble" for Monte Carlo sims instead of "Forecast"
-
-# Creating the 'stochastic environment' counterpart
-stochastic_env = StochasticEnvironment(
-    environment=env,
-    ensemble_member=list(range(env.num_ensemble_members)),
-)
-# Reporting the attributes of the `StochasticEnvironment` object:
-# stochastic_env.visualize_attributes()
+def ensemble_environment(date=None):
+    # GEFS ensemble forecast (downloaded) at the launch site, 12:00 UTC of `date` (default today)
+    env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+    envtime = datetime.date.today() if date is None else date
+    env.set_date((envtime.year, envtime.month, envtime.day, 12))  # UTC time
+    env.set_atmospheric_model(type="Ensemble", file="GEFS") # type argument is now "Ensemble" for Monte Carlo sims instead of "Forecast"
+    return env
 
 # Two rocket objects are created for the two different configurations during ascent & descent phases
 # NimbusAscent object includes the payload mass
@@ -40,21 +51,17 @@ stochastic_env = StochasticEnvironment(
 # Creating the (deterministic) rocket objects and flights ----------------------------------------------------
 NimbusAscent = Rocket(
     radius=0.097,
-    mass=35.793,  # This mass value excludes tank and engine masses
-    inertia=(58.1, 58.1, 0.231),
+    **NIMBUS_MASS.rocket_kwargs("ascent"),  # excluding tanks and engine, see MassProperties.py
     power_off_drag="RocketPy/dragCurve.csv",
     power_on_drag="RocketPy/dragCurve.csv",
-    center_of_mass_without_motor=4.28 - 2.3,
     coordinate_system_orientation="tail_to_nose",
 )
 
 NimbusDescent = Rocket(
     radius=0.097,
-    mass=32.793,
-    inertia=(42.2, 42.2, 0.222),
+    **NIMBUS_MASS.rocket_kwargs("descent"),  # excluding tanks and engine, see MassProperties.py
     power_off_drag="RocketPy/dragCurve.csv",
     power_on_drag="RocketPy/dragCurve.csv",
-    center_of_mass_without_motor=4.28 - 2.24,
     coordinate_system_orientation="tail_to_nose",
 )
 
@@ -91,6 +98,9 @@ finsD = NimbusDescent.add_trapezoidal_fins(
 )
 
 # Creating canards for ascent and descent rockets
+# the NACA0012 table is loaded once and shared by every fin set (see Airfoils.py)
+NACA0012 = load_airfoil("NACA0012")
+
 canardsA = NimbusAscent.add_trapezoidal_fins(
     n=3,
     root_chord=0.12,
@@ -99,7 +109,7 @@ canardsA = NimbusAscent.add_trapezoidal_fins(
     span=0.06,
     position=3.04,
     cant_angle=0,
-    airfoil=("RocketPy/NACA0012.csv", "degrees"),
+    airfoil=NACA0012.rocketpy_airfoil,
     name="canardsA",
 )
 
@@ -111,7 +121,7 @@ canardsD = NimbusDescent.add_trapezoidal_fins(
     span=0.06,
     position=3.04,
     cant_angle=0,
-    airfoil=("RocketPy/NACA0012.csv", "degrees"),
+    airfoil=NACA0012.rocketpy_airfoil,
     name="canardsD",
 )
 
@@ -157,39 +167,36 @@ drogue = NimbusDescent.add_parachute(
 # # draw rocket
 # NimbusAscent.draw()
 
-# Flights
-Ascent = Flight(rocket=NimbusAscent, environment=env, rail_length=12, inclination=86, heading=0, terminate_on_apogee=True, name="Ascent")
-Descent = Flight(rocket=NimbusDescent, environment=env, rail_length=12, inclination=0, heading=0, initial_solution=Ascent, name="Descent")
-
-# Results
-comparison = CompareFlights([Ascent, Descent])
-comparison.trajectories_3d(legend=True)
-
-# print("----- ASCENT INFO -----")
-# Ascent.info()
-# print("----- DESCENT INFO -----")
-# Descent.info()
-
 # MONTE CARLO SECTION OF SCRIPT ---------------------------------------------------------
 # Note: The uncertainties assigned to the components in this script are arbitrary - will finalise later
 
 # Creating the corresponding 'stochastic rocket' objects -------------------
-stochastic_Ascent = StochasticRocket(
+# MultiFinStochasticRocket is a StochasticRocket that accepts both the fins and the canards
+# The Monte Carlo runs below replace the mass and inertia draws with MASS_DISPERSIONS recomposed from the
+# components (MassProperties.py), the same draw for the ascent and descent of a sample; the tuples here are
+# what Sensitivity.py samples
+MASS_DISPERSIONS = {
+    "airframe": {"mass": 0.1, "cg": 0.001, "inertia": 0.00025},
+    "recovery": {"mass": 0.05, "cg": 0.001, "inertia": 0.00025},
+    "payload": {"mass": 0.02, "cg": 0.001, "inertia": 0.00025},
+}
+
+stochastic_Ascent = MultiFinStochasticRocket(
     rocket=NimbusAscent,
     radius=0.097 / 2000,
-    mass=(35.793, 0.1, "normal"),
-    inertia_11=(58.1, 0.01),
+    mass=(NimbusAscent.mass, 0.1, "normal"),  # nominals composed in MassProperties.py
+    inertia_11=(NimbusAscent.I_11_without_motor, 0.01),
     inertia_22=0.01,
     inertia_33=0.01,
 )
 # Reporting the attributes of the `StochasticRocket` object:
 # stochastic_Ascent.visualize_attributes()
 
-stochastic_Descent = StochasticRocket(
+stochastic_Descent = MultiFinStochasticRocket(
     rocket=NimbusDescent,
     radius=0.097 / 2000,
-    mass=(32.793, 0.1, "normal"),
-    inertia_11=(42.2, 0.01),
+    mass=(NimbusDescent.mass, 0.1, "normal"),
+    inertia_11=(NimbusDescent.I_11_without_motor, 0.01),
     inertia_22=0.01,
     inertia_33=0.01,
 )
@@ -250,102 +257,194 @@ stochastic_tailD = StochasticTail(
     length=0.001,
 )
 
-# Converting Liquid Motor object to a GenericMotor to be compatible with 'Stochastic' objects
-# Note: From the docs, apparently this object is less accurate than Liquid/SolidMotor (verify values)
-GenericThanos_R = GenericMotor(
-    thrust_source="OpenRocket/ThanosR.eng",
-    burn_time=5.5,
-    chamber_radius=0.085,
-    chamber_height=0.635 + 0.369,
-    chamber_position=1,
-    propellant_initial_mass=7+4,
-    nozzle_radius=0.025,
-    dry_mass=16.2,
-    center_of_dry_mass_position=1.0824,
-    dry_inertia=(0.6050, 0.6094, 0.1004),
-    nozzle_position=0,
-    reshape_thrust_curve=False,
-    interpolation_method="linear",
-    coordinate_system_orientation="nozzle_to_combustion_chamber",
-    )
+# Creating the 'stochastic motor' counterpart of the Thanos_R LiquidMotor (see StochasticLiquidMotor.py)
+# The tank geometries are shared between samples, only fill masses, flow rates and dry mass are redrawn
+stochastic_Thanos_R = StochasticLiquidMotor(
+    liquid_motor=Thanos_R,
+    dry_mass=0.1,
+)
+
+stochastic_ox_tank = StochasticMassFlowRateBasedTank(
+    tank=ox_tank,
+    initial_liquid_mass=0.05,
+    liquid_mass_flow_rate_out_factor=(1, 0.01),
+)
+
+stochastic_fuel_tank = StochasticMassFlowRateBasedTank(
+    tank=fuel_tank,
+    initial_liquid_mass=0.05,
+    liquid_mass_flow_rate_out_factor=(1, 0.01),
+)
+
+stochastic_press_tank = StochasticMassFlowRateBasedTank(
+    tank=press_tank,
+    initial_liquid_mass=0.01,
+)
+
+stochastic_Thanos_R.add_tank(stochastic_ox_tank, position=0.001)
+stochastic_Thanos_R.add_tank(stochastic_fuel_tank, position=0.001)
+stochastic_Thanos_R.add_tank(stochastic_press_tank, position=0.001)
 
 # Adding components to the 'stochastic rocket' objects
-# Note: Bug in code (not sure if it's me or Rocketpy) doesn't allow multiple sets of fins to be added to stochastic rocket
-#       The omission of canards for the ascent phase should lead to the landing ellipses being smaller than reality,
-#       this is due to the destabilising effects of the canards in pitch & yaw not being included.
-#       The omission of the canards for the descent phase should have negligible impact on the results,
-#       this is due to the canards only developing small aerodynamic forces at low speeds (using parachutes)
+# Note: rocketpy's StochasticRocket only finds the nominal position of the first fin set, so the canards could not be added,
+#       MultiFinStochasticRocket (see MultiFinStochasticRocket.py) fixes the lookup so both fin sets are sampled.
+#       A scalar position is read as a standard deviation around the nominal rocket, so nominal positions are given as tuples.
 
 # Ascent
-stochastic_Ascent.add_motor(GenericThanos_R, position=0.001)
+stochastic_Ascent.add_motor(stochastic_Thanos_R, position=0.001)
 stochastic_Ascent.add_nose(stochastic_nose_coneA, position=(4.28, 0.001))
-stochastic_Ascent.add_trapezoidal_fins(stochastic_fin_setA, position=0.32)
-# stochastic_Ascent.add_trapezoidal_fins(stochastic_canardsA, position=3.04)
+stochastic_Ascent.add_trapezoidal_fins(stochastic_fin_setA, position=(0.32, 0.001))
+stochastic_Ascent.add_trapezoidal_fins(stochastic_canardsA, position=(3.04, 0.001))
 stochastic_Ascent.add_tail(stochastic_tailA)
 
 # Descent
 stochastic_Descent.add_nose(stochastic_nose_coneA, position=(4.28, 0.001))
-stochastic_Descent.add_trapezoidal_fins(stochastic_fin_setD, position=0.32)
-# stochastic_Descent.add_trapezoidal_fins(stochastic_canardsD, position=3.04)
+stochastic_Descent.add_trapezoidal_fins(stochastic_fin_setD, position=(0.32, 0.001))
+stochastic_Descent.add_trapezoidal_fins(stochastic_canardsD, position=(3.04, 0.001))
 stochastic_Descent.add_tail(stochastic_tailD)
-stochastic_Descent.add_parachute(main)
-stochastic_Descent.add_parachute(drogue)
+# cd_s, lag and the main deployment altitude vary per sample (see StochasticRecovery.py),
+# the main's trigger_altitude replaces main_trigger's fixed 450 m
+# The nominal lags are 0, so the lag dispersions are one sided: uniform between 0 and 0.6 s / 0.4 s
+# The parachutes aren't added to stochastic_Descent: fly_descents attaches each sample's from a
+# RecoveryCampaign drawn for the whole run
+stochastic_main = StochasticRecoveryParachute(main, cd_s=(29.128, 1.5), lag=(0, 0.6, "uniform"), trigger_altitude=(450, 15))
+stochastic_drogue = StochasticRecoveryParachute(drogue, cd_s=(0.274, 0.02), lag=(0, 0.4, "uniform"))
+stochastic_parachutes = [stochastic_main, stochastic_drogue]  # in NimbusDescent's order
 
 # Monte Carlo Flights -----------------------------------------------------------
 
-# Ascent flight
-stochastic_flightAscent = StochasticFlight(
-    flight=Ascent,
-    inclination=(86, 1),  # mean = 86, std = 1
-    heading=(0, 2),  # mean = 0, std = 2
-)
-
-# Extract the final state at the last timestep from the Ascent flight object
-t_final = Ascent.apogee_time
-final_state_vectorA = Ascent.get_solution_at_time(t_final)
-
-# Print the final ascent state vector for verification
-print("Final State Vector (Initial Solution):", final_state_vectorA)
-
-# Defining another descent flight since 'StochasticFlight' object has to be initialised with a tuple/list and not a 'Flight' object as before
-Descent2 = Flight(rocket=NimbusDescent, environment=env, rail_length=12, inclination=0, heading=0, initial_solution=final_state_vectorA, name="Descent2")
-
-# Descent flight
-stochastic_flightDescent = StochasticFlight(
-    flight=Descent2,                       # Pass the existing flight object
-    inclination=0,                         # Define inclination or randomize it
-    heading=0,                             # Define heading or randomize it
-    initial_solution=final_state_vectorA,  # Use the extracted final ascent state vector
-)
-
-# Initialising Monte Carlo objects for the sims
-numberOfSims = 10 # Setting the number of Monte Carlo sims to run
+def stochastic_launch(env):
+    # the 'stochastic environment' of `env`, the nominal ascent flight and its stochastic counterpart
+    # (StochasticFlight takes its nominal values from a flown Flight)
+    stochastic_env = StochasticEnvironment(
+        environment=env,
+        ensemble_member=list(range(env.num_ensemble_members)),
+    )
+    # Reporting the attributes of the `StochasticEnvironment` object:
+    # stochastic_env.visualize_attributes()
 
-# Data for ascent phase
-test_dispersionAscent = MonteCarlo(
-    filename="ascent",
-    environment=stochastic_env,
-    rocket=stochastic_Ascent,
-    flight=stochastic_flightAscent,
-)
+    Ascent = Flight(rocket=NimbusAscent, environment=env, rail_length=RAIL_LENGTH, inclination=INCLINATION[0],
+                    heading=HEADING[0], terminate_on_apogee=True, name="Ascent")
 
-# Running the Monte Carlo simulations for the ascent phase
-# Note: The result of this call should be multiple ascent flights with ballistic descents and no payload deployment
-test_dispersionAscent.simulate(number_of_simulations=numberOfSims, append=False)
+    # Ascent flight
+    stochastic_flightAscent = StochasticFlight(
+        flight=Ascent,
+        inclination=INCLINATION,
+        heading=HEADING,
+    )
+    return stochastic_env, Ascent, stochastic_flightAscent
+
+
+def fly_descents(ascent_filename, descent_filename, env, stochastic_rocket, campaign):
+    # one descent per ascent of a MonteCarlo run, from that ascent's apogee state (exported as
+    # apogee_state) and ensemble member, with sample i of the RecoveryCampaign's parachutes, written to "<descent_filename>.inputs/outputs.txt" as rocketpy's
+    # MonteCarlo writes them (its flights all start from the one flight.initial_solution, so it can't pair them)
+    # Ascents that never reached apogee, and descents that fail, are reported and skipped
+    with open(f"{ascent_filename}.inputs.txt", "r", encoding="utf-8") as file:
+        ascent_inputs = [json.loads(line) for line in file]
+    with open(f"{ascent_filename}.outputs.txt", "r", encoding="utf-8") as file:
+        ascent_outputs = [json.loads(line) for line in file]
+
+    with open(f"{descent_filename}.inputs.txt", "w", encoding="utf-8") as input_file, \
+            open(f"{descent_filename}.outputs.txt", "w", encoding="utf-8") as output_file:
+        for i, (ascent_input, ascent_output) in enumerate(zip(ascent_inputs, ascent_outputs)):
+            rocket = stochastic_rocket.create_object()  # draws sample i, so the mass samples stay paired
+            campaign.attach(rocket, i)
+            apogee_state = ascent_output.get("apogee_state", [])
+            if len(apogee_state) != 13:  # [x, y, z, vx, vy, vz, e0, e1, e2, e3, w1, w2, w3]
+                print(f"Ascent {i} has no apogee state, descent skipped")
+                continue
+            member = ascent_input.get("ensemble_member", 0)
+            env.select_ensemble_member(member)
+            try:
+                flight = Flight(rocket=rocket, environment=env, rail_length=RAIL_LENGTH, inclination=0, heading=0,
+                                initial_solution=[ascent_output["apogee_time"], *apogee_state])
+            except Exception as error:  # one diverged descent shouldn't lose the campaign
+                print(f"Descent {i} failed: {error}")
+                continue
+            inputs = {"ascent": i, "ensemble_member": member, **stochastic_rocket.last_rnd_dict,
+                      "parachutes": campaign.arguments(i)}
+            outputs = {name: float(getattr(flight, name)) for name in ("t_final", "x_impact", "y_impact", "impact_velocity")}
+            input_file.write(json.dumps(inputs, default=_jsonable) + "\n")
+            output_file.write(json.dumps(outputs) + "\n")
+
+
+def _jsonable(value):
+    return value.tolist() if hasattr(value, "tolist") else str(value)
+
+
+# Flights, Monte Carlo runs, ellipses and heatmap (run the script; see Sensitivity.py for the Sobol indices)
+if __name__ == "__main__":
+    env = ensemble_environment()
+    stochastic_env, Ascent, stochastic_flightAscent = stochastic_launch(env)
+    Descent = Flight(rocket=NimbusDescent, environment=env, rail_length=RAIL_LENGTH, inclination=0, heading=0, initial_solution=Ascent, name="Descent")
+
+    # Results
+    comparison = CompareFlights([Ascent, Descent])
+    comparison.trajectories_3d(legend=True)
+
+    # print("----- ASCENT INFO -----")
+    # Ascent.info()
+    # print("----- DESCENT INFO -----")
+    # Descent.info()
+
+    # Initialising Monte Carlo objects for the sims
+    numberOfSims = 10 # Setting the number of Monte Carlo sims to run
+
+    # Mass properties of every sample, ascent and descent composed from the same component draws
+    mass_samples = NIMBUS_MASS.sample_configurations(numberOfSims, MASS_DISPERSIONS, rng=np.random.randint(2**32, dtype=np.int64))
+    stochastic_Ascent.set_mass_samples(*mass_samples["ascent"])
+    stochastic_Descent.set_mass_samples(*mass_samples["descent"])
+
+    # Data for ascent phase
+    test_dispersionAscent = MonteCarlo(
+        filename="ascent",
+        environment=stochastic_env,
+        rocket=stochastic_Ascent,
+        flight=stochastic_flightAscent,
+        # the standard outputs plus the apogee state, the payload deployment state (see Payload.py)
+        export_list=[
+            "apogee", "apogee_time", "apogee_x", "apogee_y", "apogee_state", "t_final", "x_impact",
+            "y_impact", "impact_velocity", "initial_stability_margin", "out_of_rail_stability_margin",
+            "out_of_rail_time", "out_of_rail_velocity", "max_mach_number", "frontal_surface_wind",
+            "lateral_surface_wind",
+        ],
+    )
 
+    # Running the Monte Carlo simulations for the ascent phase
+    # Note: The result of this call should be multiple ascent flights with ballistic descents and no payload deployment
+    test_dispersionAscent.simulate(number_of_simulations=numberOfSims, append=False)
 
-# Data for descent phase
-test_dispersionDescent = MonteCarlo(
-    filename="descent",
-    environment=stochastic_env,
-    rocket=stochastic_Descent,
-    flight=stochastic_flightDescent,
-)
 
-# Running the Monte Carlo simulations for the descent phase
-# Note: The result of this call should be multiple descent flights, all initialised using the 'nominal' ascent flight (and payload has been deployed)
-test_dispersionDescent.simulate(number_of_simulations=numberOfSims, append=False)
+    # Data for descent phase: descent i starts from ascent i's apogee state, in the ensemble member ascent i
+    # flew, with ascent i's airframe (the i-th mass sample) and recovery sample i
+    recovery_campaign = RecoveryCampaign(stochastic_parachutes, numberOfSims)
+    fly_descents("ascent", "descent", env, stochastic_Descent, recovery_campaign)
+    test_dispersionDescent = MonteCarlo(
+        filename="descent",  # reads the outputs written by fly_descents
+        environment=stochastic_env,
+        rocket=stochastic_Descent,
+        flight=StochasticFlight(flight=Descent),
+    )
 
-# Plotting the simulated apogee and landing zones
-test_dispersionAscent.plots.ellipses(xlim=(-1500, 1500), ylim=(-1000, 2500))
-test_dispersionDescent.plots.ellipses(xlim=(-1500, 1500), ylim=(-1000, 2500))
\ No newline at end of file
+    # Plotting the simulated apogee and landing zones
+    test_dispersionAscent.plots.ellipses(xlim=(-1500, 1500), ylim=(-1000, 2500))
+    test_dispersionDescent.plots.ellipses(xlim=(-1500, 1500), ylim=(-1000, 2500))
+
+    # Landing probability map of the descents for range safety, read from the outputs file
+    # (update_from_outputs can be called again while a longer campaign is still running)
+    landing_heatmap = LandingHeatmap(xlim=(-1500, 1500), ylim=(-1000, 2500), cell_size=10)
+    landing_heatmap.update_from_outputs("descent.outputs.txt")
+    landing_heatmap.export("descent_heatmap.npz")
+    landing_heatmap.plot()
+
+    # Payload parafoil descents from the same ascents, each with the winds of the ensemble member its ascent
+    # flew (from the inputs file) plus a small random perturbation
+    payload_states, members = deployment_states_from_outputs("ascent.outputs.txt", "ascent.inputs.txt")
+    member_winds = ensemble_winds(env)
+    payload_winds = perturbed_winds(member_winds[members], std=0.5)
+    payload_landings = ParafoilDescent().simulate(payload_states, payload_winds, env=env)
+    payload_heatmap = LandingHeatmap(xlim=(-1500, 1500), ylim=(-1000, 2500), cell_size=10)
+    payload_heatmap.add(payload_landings["x"], payload_landings["y"])
+    payload_heatmap.export("payload_heatmap.npz")
+    payload_heatmap.plot()
@@ -3,8 +3,12 @@ os.chdir(os.path.dirname(os.path.realpath(__file__)))
 os.chdir("..")
 
 # imports
-from rocketpy import Environment, Rocket, Flight, CompareFlights
+from rocketpy import Environment, Rocket
 from Thanos import Thanos_R
+from MassProperties import NIMBUS_MASS
+from Airfoils import load_airfoil
+from FlightResults import FlightResults, HEADLESS
+from FlightCache import cached_flight
 import datetime
 
 
@@ -14,21 +18,17 @@ import datetime
 # the individual payload is not simulated, that's for the guided recovery sim
 Nimbus = Rocket(
     radius=0.097,
-    mass=35.793,  # mass is excluding tanks and engine
-    inertia=(58.1, 58.1, 0.231),
+    **NIMBUS_MASS.rocket_kwargs("ascent"),  # excluding tanks and engine, see MassProperties.py
     power_off_drag="RocketPy/dragCurve.csv",
     power_on_drag="RocketPy/dragCurve.csv",
-    center_of_mass_without_motor=4.28 - 2.3,
     coordinate_system_orientation="tail_to_nose",
 )
 
 NimbusDescent = Rocket(
     radius=0.097,
-    mass=32.793,  # mass is excluding tanks and engine
-    inertia=(42.2, 42.2, 0.222),
+    **NIMBUS_MASS.rocket_kwargs("descent"),  # excluding tanks and engine, see MassProperties.py
     power_off_drag="RocketPy/dragCurve.csv",
     power_on_drag="RocketPy/dragCurve.csv",
-    center_of_mass_without_motor=4.28 - 2.24,
     coordinate_system_orientation="tail_to_nose",
 )
 
@@ -81,6 +81,9 @@ fins2 = NimbusDescent.add_trapezoidal_fins(
     radius=0.076,
 )
 
+# the NACA0012 table is loaded once and shared by every fin set (see Airfoils.py)
+NACA0012 = load_airfoil("NACA0012")
+
 canards = Nimbus.add_trapezoidal_fins(
     n=3,
     root_chord=0.12,
@@ -89,7 +92,7 @@ canards = Nimbus.add_trapezoidal_fins(
     span=0.06,
     position=3.04,
     cant_angle=12,
-    airfoil=("RocketPy/NACA0012.csv", "degrees"),
+    airfoil=NACA0012.rocketpy_airfoil,
 )
 
 canards2 = NimbusDescent.add_trapezoidal_fins(
@@ -100,7 +103,7 @@ canards2 = NimbusDescent.add_trapezoidal_fins(
     span=0.06,
     position=3.04,
     cant_angle=12,
-    airfoil=("RocketPy/NACA0012.csv", "degrees"),
+    airfoil=NACA0012.rocketpy_airfoil,
 )
 
 boattail = Nimbus.add_tail(top_radius=0.097, bottom_radius=0.076, length=0.302, position=0.302)
@@ -151,17 +154,14 @@ if __name__ == "__main__":
     env.set_atmospheric_model(type="Forecast", file="GFS")
 
     # draw rocket
-    Nimbus.draw()
+    if not HEADLESS:
+        Nimbus.draw()
 
     # Flights
-    Ascent = Flight(rocket=Nimbus, environment=env, rail_length=12, inclination=86, heading=0, terminate_on_apogee=True, name="Ascent")
-    Descent = Flight(rocket=NimbusDescent, environment=env, rail_length=12, inclination=0, heading=0, initial_solution=Ascent, name="Descent")
-
-    # Results
-    comparison = CompareFlights([Ascent, Descent])
-    comparison.trajectories_3d(legend=True)
+    Ascent = cached_flight(rocket=Nimbus, environment=env, rail_length=12, inclination=86, heading=0, terminate_on_apogee=True, name="Ascent")
+    Descent = cached_flight(rocket=NimbusDescent, environment=env, rail_length=12, inclination=0, heading=0, initial_solution=Ascent, name="Descent")
 
-    print("----- ASCENT INFO -----")
-    Ascent.all_info()
-    print("----- DESCENT INFO -----")
-    Descent.info()
\ No newline at end of file
+    # Results (plots and full info dumps are skipped when headless)
+    results = FlightResults(Ascent, Descent, name="Nimbus_AllCanardSpin")
+    results.save_summary()
+    results.all_info()
@@ -4,9 +4,10 @@ os.chdir(os.path.dirname(os.path.realpath(__file__)))
 os.chdir("..")
 
 # imports
-from rocketpy import Environment, Rocket, Flight, CompareFlights
+from rocketpy import Environment, Rocket, Flight
 from Nimbus import Nimbus, NimbusDescent
 from Thanos import Thanos_R
+from FlightResults import FlightResults, HEADLESS
 import datetime
 
 
@@ -32,9 +33,11 @@ env.set_date((envtime.year, envtime.month, envtime.day, 12))  # UTC time
 env.set_atmospheric_model(
     type="custom_atmosphere", wind_u=0, wind_v=8.9 # set positive wind_v for max drift
 )  # for now ive set the max allowable wind as a constant 8 m/s, this can be changed to a altitude profile or another speed
+# WorstCaseWind.py searches altitude varying profiles within the same max speed for the true worst case
 
 # draw rocket
-Nimbus.draw()
+if not HEADLESS:
+    Nimbus.draw()
 
 # Flights
 Ascent = Flight(
@@ -51,11 +54,7 @@ Descent = Flight(
     max_time=1e4,  # the main at apogee overruns the default max of 600s
 )
 
-# Results
-comparison = CompareFlights([Ascent, Descent])
-comparison.trajectories_3d(legend=True)
-
-print("----- ASCENT INFO -----")
-Ascent.all_info()
-print("----- DESCENT INFO -----")
-Descent.info()
+# Results (plots and full info dumps are skipped when headless)
+results = FlightResults(Ascent, Descent, name="Nimbus_MaxDrift")
+results.save_summary()
+results.all_info()
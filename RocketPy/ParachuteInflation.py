@@ -0,0 +1,238 @@
+# Parachute inflation and reefing
+# rocketpy steps a parachute's cd_s to its full value the moment it inflates ("reefed chute
+# in two configs" in NimbusMonteCarlo is only a comment). An InflationProfile is a reefing
+# program, stages of (cd_s, fill time, dwell): each stage grows the drag area from the
+# previous stage's to its own as (t / fill time) ** exponent (2 for a solid canopy), then
+# holds it for the dwell before the next stage is disreefed. The whole cd_s(t) curve is
+# tabulated on a uniform time grid when the profile is built, so the solver's lookup is an
+# index and a blend. add_inflating_parachute adds the parachute as add_parachute does with
+# the profile attached, and InflationFlight (a Flight) uses the curves in the parachute
+# phases; while a canopy inflates the drag area never drops below the previous one's (the
+# drogue stays on the main's bag), once it's full the flight is rocketpy's again.
+#
+# The loads are estimated without flying, vectorised over Monte Carlo deployment conditions:
+#  - snatch: the pack slows in the air while the lines pay out, the lines then stretch to
+#    stop the relative velocity, F = dv sqrt(k m), k the line stiffness, m the reduced mass,
+#  - opening: the Pflanz method, the peak force of each stage is q cd_s X1 with the force
+#    reduction factor X1 of the stage's inflation curve tabulated against the ballistic
+#    parameter A = 2 m / (rho cd_s v t_fill) when the profile is built, plus the weight (the
+#    velocity at the end of a stage is tabulated too, and the dwell is a vertical fall
+#    towards the stage's terminal velocity, which gives the next stage's opening speed).
+#
+# usage:
+#   profile = InflationProfile([(8, 0.8, 3), (29.128, 1.5, 0)])      # reefed main
+#   add_inflating_parachute(NimbusDescent, "main", profile, trigger=main_trigger, lag=7, ...)
+#   Descent = InflationFlight(rocket=NimbusDescent, environment=env, ..., initial_solution=Ascent)
+#   loads = opening_loads(profile, speeds, densities, NimbusDescent.dry_mass)
+
+# imports
+import numpy as np
+from rocketpy import Flight
+
+TABLE_STEP = 0.001  # s, cd_s(t) table spacing
+BALLISTIC_PARAMETERS = np.logspace(-2, 3, 251)  # A, tabulated force reduction factors
+INFLATION_STEPS = 2000  # per unit non dimensional fill time
+GRAVITY = 9.80665
+
+
+class InflationProfile:
+    # stages: [(cd_s, fill_time, dwell), ...] in m^2 and s, the last stage's cd_s is the
+    # parachute's, initial_cd_s: drag area when inflation starts (the pack)
+    def __init__(self, stages, exponent=2, initial_cd_s=0.0, table_step=TABLE_STEP):
+        self.stages = [tuple(float(value) for value in stage) for stage in stages]
+        self.exponent = exponent
+        self.initial_cd_s = initial_cd_s
+        self.table_step = table_step
+        self.cd_s = self.stages[-1][0]
+
+        # cd_s(t) from inflation on a uniform grid, the lookup is an index and a blend
+        times, values, start, previous = [], [], 0.0, initial_cd_s
+        for cd_s, fill_time, dwell in self.stages:
+            stage_time = np.linspace(0, fill_time, max(int(fill_time / table_step), 1) + 1)
+            fraction = (stage_time / fill_time) ** exponent if fill_time > 0 else np.ones_like(stage_time)
+            times += list(start + stage_time)
+            values += list(previous + (cd_s - previous) * fraction)
+            start, previous = start + fill_time + dwell, cd_s
+        self.duration = start - self.stages[-1][2]
+        grid = np.arange(0, self.duration + table_step, table_step)
+        self.table = np.interp(grid, times, values)
+
+        # force reduction factor and end of fill velocity ratio of every stage against the
+        # ballistic parameter
+        self.reduction_factors, self.end_velocities = [], []
+        previous = initial_cd_s
+        for cd_s, _, _ in self.stages:
+            factor, velocity = self._pflanz(previous / cd_s)
+            self.reduction_factors.append(factor)
+            self.end_velocities.append(velocity)
+            previous = cd_s
+
+    def _pflanz(self, ratio):
+        # non dimensional inflation dv/dtau = -f(tau) v^2 / A, gravity neglected, f the
+        # drag area over the stage's full one, integrated for all the tabulated A at once
+        a = BALLISTIC_PARAMETERS
+        step = 1 / INFLATION_STEPS
+        velocity = np.ones_like(a)
+        factor = np.zeros_like(a)
+        for k in range(INFLATION_STEPS):
+            f = ratio + (1 - ratio) * ((k + 0.5) * step) ** self.exponent
+            velocity = velocity / (1 + f * step * velocity / a)  # exact for a constant f
+            factor = np.maximum(factor, f * velocity**2)
+        return factor, velocity
+
+    def cd_s_at(self, time):
+        # drag area (m^2) time (s) after the inflation started
+        index = time / self.table_step
+        i = int(index)
+        if i >= len(self.table) - 1:
+            return self.cd_s
+        if i < 0:
+            return self.table[0]
+        weight = index - i
+        return self.table[i] * (1 - weight) + self.table[i + 1] * weight
+
+    def __repr__(self):
+        return f"InflationProfile({self.stages}, exponent={self.exponent})"
+
+
+def add_inflating_parachute(rocket, name, profile, trigger, sampling_rate=100, lag=0, noise=(0, 0, 0)):
+    # rocket.add_parachute with the full cd_s of the profile, the profile attached
+    parachute = rocket.add_parachute(
+        name=name, cd_s=profile.cd_s, trigger=trigger, sampling_rate=sampling_rate, lag=lag, noise=noise,
+    )
+    parachute.inflation = profile
+    return parachute
+
+
+class InflationFlight(Flight):
+    # a Flight whose parachute phases follow the inflation profiles of the parachutes
+    # that have one, the others step to their cd_s as in rocketpy
+
+    def _inflating(self, t):
+        # (profile, time since inflation, previous canopy's cd_s) of the last canopy out
+        current, previous_cd_s = None, 0.0
+        for trigger_time, parachute in self.parachute_events:
+            start = trigger_time + parachute.lag
+            if start > t + 1e-9:
+                break
+            if current is not None:
+                previous_cd_s = current[1].cd_s
+            current = (start, parachute)
+        if current is None or getattr(current[1], "inflation", None) is None:
+            return None
+        start, parachute = current
+        if t - start >= parachute.inflation.duration:
+            return None
+        return parachute.inflation, t - start, previous_cd_s
+
+    def u_dot_parachute(self, t, u, post_processing=False):
+        inflating = self._inflating(t)
+        if inflating is None:
+            return super().u_dot_parachute(t, u, post_processing)
+        profile, time, previous_cd_s = inflating
+        full_cd_s = self.parachute_cd_s
+        self.parachute_cd_s = max(previous_cd_s, profile.cd_s_at(time))
+        try:
+            return super().u_dot_parachute(t, u, post_processing)
+        finally:
+            self.parachute_cd_s = full_cd_s
+
+
+def dwell_velocity(speed, terminal_velocity, time):
+    # vertical fall with quadratic drag from `speed` towards the terminal velocity
+    speed, terminal_velocity = np.broadcast_arrays(np.asarray(speed, float), np.asarray(terminal_velocity, float))
+    ratio = speed / terminal_velocity
+    phase = GRAVITY * time / terminal_velocity
+    with np.errstate(divide="ignore", invalid="ignore"):
+        faster = terminal_velocity / np.tanh(phase + np.arctanh(1 / np.maximum(ratio, 1 + 1e-12)))
+        slower = terminal_velocity * np.tanh(phase + np.arctanh(np.minimum(ratio, 1 - 1e-12)))
+    return np.where(ratio > 1, faster, slower)
+
+
+def opening_loads(profile, speed, density, mass, overinflation=1.0):
+    # peak opening force (N) of every reefing stage, (n_stages, n) for n deployments at
+    # `speed` (m/s, air relative) in air of `density` (kg/m^3), mass: suspended mass (kg),
+    # overinflation: the canopy's opening force coefficient (1 for the bare Pflanz factor)
+    speed = np.asarray(speed, dtype=float)
+    density = np.broadcast_to(np.asarray(density, dtype=float), speed.shape)
+    loads, velocities = [], []
+    for (cd_s, fill_time, dwell), factors, ends in zip(profile.stages, profile.reduction_factors, profile.end_velocities):
+        ballistic = 2 * mass / (density * cd_s * speed * max(fill_time, 1e-9))
+        log_ballistic = np.log(np.clip(ballistic, BALLISTIC_PARAMETERS[0], BALLISTIC_PARAMETERS[-1]))
+        factor = np.interp(log_ballistic, np.log(BALLISTIC_PARAMETERS), factors)
+        # the descent is near vertical, the weight adds to the drag the inflation sees
+        loads.append(overinflation * 0.5 * density * speed**2 * cd_s * factor + mass * GRAVITY)
+        velocities.append(speed)
+        speed = speed * np.interp(log_ballistic, np.log(BALLISTIC_PARAMETERS), ends)
+        speed = dwell_velocity(speed, np.sqrt(2 * mass * GRAVITY / (density * cd_s)), dwell)
+    return {"loads": np.array(loads), "stage_speeds": np.array(velocities), "peak": np.max(loads, axis=0)}
+
+
+def snatch_loads(speed, density, mass, pack_mass=1.0, pack_cd_s=0.05, line_length=5.0,
+                 line_stiffness=2e4, ejection_velocity=5.0):
+    # line stretch force (N) for deployments at `speed` (m/s) in air of `density`: the pack,
+    # ejected at ejection_velocity, slows as v exp(-rho cd_s x / 2 m) over the line length
+    # while the rocket keeps its speed, the lines (stiffness N/m) then take the difference
+    speed = np.asarray(speed, dtype=float)
+    pack_speed = speed * np.exp(-density * pack_cd_s * line_length / (2 * pack_mass))
+    relative_velocity = speed - pack_speed + ejection_velocity
+    reduced_mass = pack_mass * mass / (pack_mass + mass)
+    return relative_velocity * np.sqrt(line_stiffness * reduced_mass)
+
+
+def deployment_conditions(flight, name):
+    # air relative speed (m/s) and altitude (m ASL) where parachute `name` inflated
+    for trigger_time, parachute in flight.parachute_events:
+        if parachute.name == name:
+            t = trigger_time + parachute.lag
+            return float(flight.free_stream_speed(t)), float(flight.z(t))
+    raise ValueError(f"{name!r} didn't deploy in {flight.name}")
+
+
+if __name__ == "__main__":
+    import time as timer
+
+    from rocketpy import Environment
+
+    from Nimbus import Nimbus, NimbusDescent, main_trigger
+
+    env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+    env.set_atmospheric_model(type="custom_atmosphere", wind_u=2, wind_v=3)
+    Ascent = Flight(rocket=Nimbus, environment=env, rail_length=12, inclination=86, heading=0,
+                    terminate_on_apogee=True, name="Ascent")
+    Descent = Flight(rocket=NimbusDescent, environment=env, rail_length=12, inclination=0, heading=0,
+                     initial_solution=Ascent, name="Descent")
+
+    # the main reefed to 8 m^2 for 3 s
+    profile = InflationProfile([(8, 0.8, 3), (29.128, 1.5, 0)])
+    parachutes = NimbusDescent.parachutes
+    NimbusDescent.parachutes = [parachute for parachute in parachutes if parachute.name != "main"]
+    try:
+        add_inflating_parachute(NimbusDescent, "main", profile, trigger=main_trigger, sampling_rate=100, lag=7)
+        Reefed = InflationFlight(rocket=NimbusDescent, environment=env, rail_length=12, inclination=0,
+                                 heading=0, initial_solution=Ascent, name="Reefed")
+    finally:
+        NimbusDescent.parachutes = parachutes
+
+    for flight in (Descent, Reefed):
+        speed, altitude = deployment_conditions(flight, "main")
+        start = [t + p.lag for t, p in flight.parachute_events if p.name == "main"][0]
+        times = np.linspace(start, start + 6, 400)
+        deceleration = max(abs(flight.az(t)) for t in times)
+        print(f"{flight.name}: main opens at {speed:.1f} m/s, {altitude - env.elevation:.0f} m AGL, "
+              f"peak deceleration {deceleration / GRAVITY:.1f} g, landing "
+              f"({flight.x_impact:.1f}, {flight.y_impact:.1f}) m at {flight.t_final:.1f} s")
+
+    # loads over a batch of dispersed main deployments
+    n = 100000
+    rng = np.random.default_rng(0)
+    speed, altitude = deployment_conditions(Descent, "main")
+    speeds = np.abs(rng.normal(speed, 3, n))
+    densities = np.asarray(env.density.get_value(rng.normal(altitude, 30, n)), dtype=float)
+    start = timer.perf_counter()
+    step = opening_loads(InflationProfile([(29.128, 1.5, 0)]), speeds, densities, NimbusDescent.dry_mass)
+    reefed = opening_loads(profile, speeds, densities, NimbusDescent.dry_mass)
+    snatch = snatch_loads(speeds, densities, NimbusDescent.dry_mass)
+    print(f"{n} deployments, loads in {(timer.perf_counter() - start) * 1000:.0f} ms")
+    for label, loads in (("unreefed opening", step["peak"]), ("reefed opening", reefed["peak"]), ("snatch", snatch)):
+        print(f"{label:>17}: median {np.median(loads):.0f} N, 99th percentile {np.percentile(loads, 99):.0f} N")
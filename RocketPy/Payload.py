@@ -1 +1,272 @@
-# simulates the payload, deployed at apogee
\ No newline at end of file
+# simulates the payload, deployed at apogee
+# The Nimbus scripts leave the payload and its parafoil out ("that's for our guided recovery
+# sim"), this is that sim. After deployment from the ascent state the payload falls for the
+# opening time, then the parafoil flies at its trim airspeed (wing loading and air density)
+# and glide ratio, turning at a limited rate towards the heading the guidance law asks for:
+#  - homing: fly the ground track towards the target, crabbing against the cross wind,
+#  - loiter: with more height than needed to reach the target, turn away from the bearing
+#    (up to 90 deg, circling the target) to burn it off,
+#  - final approach: below final_altitude, turn into the wind to land slow.
+# The model is a point mass with a heading state, integrated with a fixed step on arrays of
+# deployment states and wind profiles, so thousands of payload descents (one per Monte
+# Carlo ascent and wind realisation) run in one call, and the landings go into the same
+# LandingHeatmap as the main body's.
+#
+# usage:
+#   states = np.array([deployment_state(Ascent)])        # or deployment_states_from_outputs
+#   winds = perturbed_winds(wind_profile(env, ALTITUDES), 1000, rng=0)
+#   landing = ParafoilDescent().simulate(states.repeat(1000, axis=0), winds, ALTITUDES, env)
+
+# imports
+import json
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from MassProperties import PAYLOAD
+
+ALTITUDES = np.arange(0, 6001, 100.0)  # wind profile nodes, m above sea level
+GRAVITY = 9.80665
+
+
+def deployment_state(flight, time=None):
+    # [x, y, z, vx, vy, vz] of the ascent at `time` (default apogee), z above sea level
+    time = flight.apogee_time if time is None else time
+    return np.asarray(flight.get_solution_at_time(time)[1:7], dtype=float)
+
+
+def deployment_states_from_outputs(path, inputs_path=None):
+    # deployment states of every ascent in a MonteCarlo "<filename>.outputs.txt", from the
+    # exported apogee_state if there is one, else the apogee position at rest. Ascents that
+    # never reached apogee (rocketpy leaves apogee_state at [0]) are skipped
+    # with inputs_path, the "<filename>.inputs.txt" written line for line with the outputs,
+    # also returns the ensemble member each of the kept ascents flew
+    ascent_members = None
+    if inputs_path is not None:
+        with open(inputs_path, "r", encoding="utf-8") as file:
+            ascent_members = [json.loads(line).get("ensemble_member", 0) for line in file]
+    states, members = [], []
+    with open(path, "r", encoding="utf-8") as file:
+        for i, line in enumerate(file):
+            output = json.loads(line)
+            if len(output.get("apogee_state", [])) >= 6:
+                states.append(output["apogee_state"][:6])  # [x, y, z, vx, vy, vz, ...], no time
+            elif "apogee_x" in output and "apogee_state" not in output:
+                states.append([output["apogee_x"], output["apogee_y"], output["apogee"], 0, 0, 0])
+            else:
+                continue
+            members.append(ascent_members[i] if ascent_members is not None else 0)
+    states = np.array(states, dtype=float).reshape(-1, 6)
+    if ascent_members is None:
+        return states
+    return states, np.array(members, dtype=int)
+
+
+def wind_profile(env, altitudes=ALTITUDES):
+    # (n_altitudes, 2) east/north wind of a rocketpy Environment
+    return np.column_stack([
+        np.asarray(env.wind_velocity_x.get_value(altitudes), dtype=float),
+        np.asarray(env.wind_velocity_y.get_value(altitudes), dtype=float),
+    ])
+
+
+def ensemble_winds(env, altitudes=ALTITUDES):
+    # (n_members, n_altitudes, 2), one profile per member of an Ensemble environment
+    winds = []
+    for member in range(env.num_ensemble_members):
+        env.select_ensemble_member(member)
+        winds.append(wind_profile(env, altitudes))
+    env.select_ensemble_member(0)
+    return np.array(winds)
+
+
+def perturbed_winds(base, n=None, std=1.5, correlation_length=500, spacing=100, rng=None):
+    # realisations of base profiles plus a smooth random perturbation, first order
+    # autoregressive in altitude with the given std (m/s) and correlation length (m).
+    # base: one (n_altitudes, 2) profile repeated n times, or (n, n_altitudes, 2) profiles
+    rng = np.random.default_rng(rng)
+    base = np.asarray(base, dtype=float)
+    if base.ndim == 2:
+        base = np.broadcast_to(base, (n,) + base.shape)
+    phi = np.exp(-spacing / correlation_length)
+    noise = rng.standard_normal(base.shape)
+    perturbation = np.empty_like(noise)
+    perturbation[:, 0] = std * noise[:, 0]
+    for k in range(1, base.shape[1]):
+        perturbation[:, k] = phi * perturbation[:, k - 1] + std * np.sqrt(1 - phi**2) * noise[:, k]
+    return base + perturbation
+
+
+def _wrap(angle):
+    return (angle + np.pi) % (2 * np.pi) - np.pi
+
+
+class ParafoilDescent:
+    # mass (kg), area (m^2), resultant force coefficient and glide ratio of the parafoil,
+    # max_turn_rate (deg/s), turn_gain (1/s) of the heading loop, guidance altitudes in m AGL
+    def __init__(
+        self,
+        mass=PAYLOAD.mass,
+        area=1.0,
+        force_coefficient=0.8,
+        glide_ratio=3.0,
+        max_turn_rate=20,
+        turn_gain=0.5,
+        opening_time=3.0,
+        target=(0, 0),
+        final_altitude=30,
+        safety_altitude=150,
+        loiter_blend=200,
+        guided=True,
+    ):
+        self.mass = mass
+        self.area = area
+        self.force_coefficient = force_coefficient
+        self.glide_angle = np.arctan(1 / glide_ratio)
+        self.max_turn_rate = np.radians(max_turn_rate)
+        self.turn_gain = turn_gain
+        self.opening_time = opening_time
+        self.target = np.asarray(target, dtype=float)
+        self.final_altitude = final_altitude
+        self.safety_altitude = safety_altitude
+        self.loiter_blend = loiter_blend
+        self.guided = guided
+
+    def airspeed(self, density):
+        # trim airspeed, the lift + drag resultant balances the weight
+        return np.sqrt(2 * self.mass * GRAVITY / (density * self.area * self.force_coefficient))
+
+    def desired_heading(self, x, y, height, wind, horizontal_speed, sink):
+        # heading (rad from north, clockwise) asked by the guidance law
+        dx, dy = self.target[0] - x, self.target[1] - y
+        distance = np.hypot(dx, dy)
+        bearing = np.arctan2(dx, dy)
+
+        # homing, crab so the ground track points at the target
+        cross_wind = wind[:, 0] * np.cos(bearing) - wind[:, 1] * np.sin(bearing)
+        crab = np.arcsin(np.clip(-cross_wind / horizontal_speed, -1, 1))
+        desired = bearing + crab
+
+        # loiter, more height than the glide to the target needs (at the current ground speed
+        # towards it, so a head wind asks for more)
+        along_wind = wind[:, 0] * np.sin(bearing) + wind[:, 1] * np.cos(bearing)
+        ground_speed = np.maximum(horizontal_speed * np.cos(crab) + along_wind, 0.1)
+        excess = height - distance * sink / ground_speed - self.safety_altitude
+        desired = desired + 0.5 * np.pi * np.clip(excess / self.loiter_blend, 0, 1)
+
+        # final approach into the wind
+        upwind = np.arctan2(-wind[:, 0], -wind[:, 1])
+        return np.where(height < self.final_altitude, upwind, desired)
+
+    def simulate(self, states, winds, altitudes=ALTITUDES, env=None, ground=78, dt=0.5, record_every=None):
+        # states: (n, 6) deployment states, winds: (n, n_altitudes, 2) or one (n_altitudes, 2)
+        # profile for all, env gives the density (standard atmosphere without one)
+        # returns landing x, y, time and distance to the target, plus the recorded tracks
+        states = np.atleast_2d(np.asarray(states, dtype=float))
+        n = len(states)
+        winds = np.broadcast_to(np.asarray(winds, dtype=float), (n, len(altitudes), 2))
+        ground = env.elevation if env is not None else ground
+        if env is not None:
+            density = np.asarray(env.density.get_value(altitudes), dtype=float)
+        else:
+            density = 1.225 * np.exp(-np.asarray(altitudes) / 8500)
+        rows = np.arange(n)
+
+        def wind_at(z):
+            # per sample linear interpolation on the shared altitude nodes
+            i = np.clip(np.searchsorted(altitudes, z) - 1, 0, len(altitudes) - 2)
+            w = np.clip((z - altitudes[i]) / (altitudes[i + 1] - altitudes[i]), 0, 1)[:, np.newaxis]
+            return (1 - w) * winds[rows, i] + w * winds[rows, i + 1]
+
+        # opening: ballistic with the deployment velocity
+        x, y, z, vx, vy, vz = states.T
+        t_open = self.opening_time
+        x, y = x + vx * t_open, y + vy * t_open
+        z = z + vz * t_open - 0.5 * GRAVITY * t_open**2
+        heading = np.arctan2(vx, vy)  # the canopy opens along the deployment velocity
+
+        time = np.full(n, t_open)
+        flying = z > ground
+        tracks, step = [], 0
+        while flying.any():
+            wind = wind_at(z)
+            speed = self.airspeed(np.interp(z, altitudes, density))
+            horizontal_speed = speed * np.cos(self.glide_angle)
+            sink = speed * np.sin(self.glide_angle)
+
+            if self.guided:
+                desired = self.desired_heading(x, y, z - ground, wind, horizontal_speed, sink)
+                turn_rate = self.turn_gain * _wrap(desired - heading)
+                heading = heading + np.clip(turn_rate, -self.max_turn_rate, self.max_turn_rate) * dt
+
+            # the samples on the ground don't move, the last step stops at the ground
+            step_time = np.where(flying, np.minimum(dt, (z - ground) / sink), 0)
+            x = x + (horizontal_speed * np.sin(heading) + wind[:, 0]) * step_time
+            y = y + (horizontal_speed * np.cos(heading) + wind[:, 1]) * step_time
+            z = z - sink * step_time
+            time = time + step_time
+            flying &= z > ground + 1e-6
+
+            if record_every and step % record_every == 0:
+                tracks.append(np.column_stack([x, y, z]))
+            step += 1
+
+        return {
+            "x": x,
+            "y": y,
+            "time": time,
+            "distance": np.hypot(x - self.target[0], y - self.target[1]),
+            "tracks": np.array(tracks) if tracks else None,
+        }
+
+
+def plot_landings(landings, labels, target=(0, 0), ax=None, show=True):
+    # scatter of several payload landing sets (e.g. guided vs unguided)
+    if ax is None:
+        _, ax = plt.subplots()
+    for landing, label in zip(landings, labels):
+        median = np.median(landing["distance"])
+        ax.scatter(landing["x"], landing["y"], s=2, alpha=0.5, label=f"{label} (median {median:.0f} m)")
+    ax.plot(*target, "r*", ms=12, label="Target")
+    ax.plot(0, 0, "k^", label="Launch")
+    ax.set_xlabel("x (m)")
+    ax.set_ylabel("y (m)")
+    ax.set_aspect("equal")
+    ax.set_title("Payload landing points")
+    ax.legend(fontsize="small")
+    if show:
+        plt.show()
+    return ax
+
+
+if __name__ == "__main__":
+    import time as timer
+
+    from rocketpy import Environment, Flight
+
+    from LandingHeatmap import LandingHeatmap
+    from Nimbus import Nimbus
+
+    env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+    env.set_atmospheric_model(type="custom_atmosphere", wind_u=2, wind_v=3)
+    Ascent = Flight(rocket=Nimbus, environment=env, rail_length=12, inclination=86, heading=0,
+                    terminate_on_apogee=True, name="Ascent")
+
+    # dispersed deployment states around the nominal apogee and wind realisations
+    n = 5000
+    rng = np.random.default_rng(0)
+    states = deployment_state(Ascent) + rng.normal(0, [30, 30, 20, 2, 2, 0.5], (n, 6))
+    winds = perturbed_winds(wind_profile(env), n, rng=rng)
+
+    results = {}
+    for label, guided in (("guided", True), ("unguided", False)):
+        start = timer.perf_counter()
+        results[label] = ParafoilDescent(guided=guided).simulate(states, winds, env=env)
+        print(f"{n} {label} payload descents in {timer.perf_counter() - start:.2f} s, "
+              f"median miss {np.median(results[label]['distance']):.0f} m, "
+              f"flight time {np.mean(results[label]['time']):.0f} s")
+
+    heatmap = LandingHeatmap(xlim=(-3000, 3000), ylim=(-3000, 3000), cell_size=20)
+    heatmap.add(results["guided"]["x"], results["guided"]["y"])
+    heatmap.export("payload_heatmap.npz")
+    plot_landings(list(results.values()), list(results))
@@ -0,0 +1,216 @@
+# Rail heading / inclination optimiser for minimum drift
+# The scripts launch at inclination=86, heading=0 whatever the wind. Pointing the rail
+# into the wind trades ascent drift against descent drift, this finds the heading and
+# inclination (within the competition limits) that minimise the expected landing distance
+# from a target, or keep the landing inside a zone, for one forecast hour.
+# Full Flights are only used to build and check a surrogate: a handful of ascent+descent
+# runs on a design over the rail tilt, an RBF surrogate of the landing point vs tilt, the
+# inner optimisation (with the rail pointing dispersion averaged over) runs on the
+# surrogate warm started from the best point so far, and every optimum is confirmed with
+# a full flight that is then added to the design, until surrogate and flight agree.
+#
+# The rail is parameterised by its tilt, the horizontal part of the rail direction
+#   (east, north) = cos(inclination) * (sin(heading), cos(heading))
+# which is smooth through vertical (where the heading is undefined).
+#
+# usage:
+#   forecast = ForecastWindow("GFS", hours=3)
+#   optimiser = RailOptimiser(forecast.tables[0], forecast)
+#   best = optimiser.optimise()
+
+# imports
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.interpolate import RBFInterpolator
+from scipy.optimize import minimize
+
+from LaunchWindow import fly_nimbus, table_environment
+
+INCLINATION_LIMITS = (84, 90)  # EuRoC rail elevation range, deg
+
+
+def rail_to_tilt(inclination, heading):
+    tilt = np.cos(np.radians(inclination))
+    heading = np.radians(heading)
+    return np.stack([tilt * np.sin(heading), tilt * np.cos(heading)], axis=-1)
+
+
+def tilt_to_rail(tilt):
+    tilt = np.asarray(tilt, dtype=float)
+    inclination = np.degrees(np.arccos(np.clip(np.linalg.norm(tilt, axis=-1), 0, 1)))
+    heading = np.degrees(np.arctan2(tilt[..., 0], tilt[..., 1])) % 360
+    return inclination, heading
+
+
+def _landing(table, site, inclination, heading):
+    # worker: full ascent + descent, landing x (east) / y (north) in m
+    results = fly_nimbus(table_environment(table, *site), inclination, heading)
+    landing = results.landing_point
+    return landing["x"], landing["y"]
+
+
+class RailOptimiser:
+    # table: a ForecastWindow hour, site: anything with latitude/longitude/elevation
+    # (the ForecastWindow itself), target: landing target (x, y) from the rail,
+    # zone_radius: keep the landing inside this circle instead of minimising the distance,
+    # dispersion: std of inclination and heading (deg), as NimbusMonteCarlo's StochasticFlight
+    def __init__(
+        self,
+        table,
+        site,
+        inclination_limits=INCLINATION_LIMITS,
+        target=(0, 0),
+        zone_radius=None,
+        dispersion=(1, 2),
+        n_dispersion_samples=64,
+        max_workers=None,
+        seed=0,
+    ):
+        self.table = table
+        self.site = (site.latitude, site.longitude, site.elevation)
+        self.max_tilt = np.cos(np.radians(inclination_limits[0]))
+        self.min_tilt = np.cos(np.radians(inclination_limits[1]))
+        self.target = np.asarray(target, dtype=float)
+        self.zone_radius = zone_radius
+        self.max_workers = max_workers
+
+        # common random numbers for the dispersion, the surrogate objective stays smooth
+        rng = np.random.default_rng(seed)
+        self._dispersion = rng.standard_normal((n_dispersion_samples, 2)) * dispersion
+
+        self.design_tilt = np.empty((0, 2))
+        self.design_landing = np.empty((0, 2))
+        self.surrogate = None
+        self.history = []
+
+    def initial_design(self, rings=(0.5, 1), n_headings=6):
+        # vertical-most rail plus rings of headings across the allowed tilt
+        points = [self.min_tilt * np.array([0, 1])]
+        for ring in rings:
+            tilt = self.min_tilt + ring * (self.max_tilt - self.min_tilt)
+            for heading in np.linspace(0, 2 * np.pi, n_headings, endpoint=False):
+                points.append(tilt * np.array([np.sin(heading), np.cos(heading)]))
+        return np.array(points)
+
+    def run_flights(self, tilts, pool=None):
+        # full flights at the given tilts (in parallel), added to the design. pool: an
+        # executor kept by the caller, so its workers import Nimbus only once
+        if pool is None:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                return self.run_flights(tilts, pool)
+        inclinations, headings = tilt_to_rail(tilts)
+        landings = list(
+            pool.map(
+                _landing, [self.table] * len(tilts), [self.site] * len(tilts),
+                inclinations, headings,
+            )
+        )
+        landings = np.array(landings)
+        self.design_tilt = np.vstack([self.design_tilt, tilts])
+        self.design_landing = np.vstack([self.design_landing, landings])
+        self.surrogate = RBFInterpolator(
+            self.design_tilt, self.design_landing, kernel="thin_plate_spline", degree=1
+        )
+        return landings
+
+    def _clip(self, tilt):
+        # keep a tilt inside the allowed annulus
+        norm = np.linalg.norm(tilt, axis=-1, keepdims=True)
+        clipped = np.clip(norm, self.min_tilt, self.max_tilt)
+        direction = np.where(norm > 0, tilt / np.where(norm > 0, norm, 1), [0, 1])
+        return direction * clipped
+
+    def _cost(self, landings):
+        distance = np.linalg.norm(landings - self.target, axis=-1)
+        if self.zone_radius is None:
+            return distance
+        # outside the zone dominates, the distance only breaks ties inside it
+        return np.maximum(distance - self.zone_radius, 0) + 1e-3 * distance
+
+    def expected_cost(self, tilt):
+        # surrogate cost averaged over the rail pointing dispersion
+        inclination, heading = tilt_to_rail(tilt)
+        samples = rail_to_tilt(
+            inclination + self._dispersion[:, 0], heading + self._dispersion[:, 1]
+        )
+        samples = self._clip(samples)
+        return self._cost(self.surrogate(samples)).mean()
+
+    def _inner_optimise(self, start):
+        # on the surrogate only, the tilt is clipped into the limits inside the objective
+        step = 0.25 * self.max_tilt
+        simplex = np.array([start, start + [step, 0], start + [0, step]])
+        result = minimize(
+            lambda tilt: self.expected_cost(self._clip(tilt)),
+            start,
+            method="Nelder-Mead",
+            options={"xatol": 1e-5, "fatol": 1e-2, "initial_simplex": simplex},
+        )
+        return self._clip(result.x)
+
+    def optimise(self, max_iterations=6, tolerance=5):
+        # tolerance: surrogate vs full flight landing disagreement to stop at, m
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            if len(self.design_tilt) == 0:
+                self.run_flights(self.initial_design(), pool)
+
+            # the best confirmed design point, what is returned without any iteration
+            i = int(np.argmin([self.expected_cost(tilt) for tilt in self.design_tilt]))
+            best, confirmed, error = self.design_tilt[i], self.design_landing[i], 0.0
+
+            for _ in range(max_iterations):
+                # warm start from the best confirmed design point
+                costs = [self.expected_cost(tilt) for tilt in self.design_tilt]
+                start = self.design_tilt[int(np.argmin(costs))]
+                best = self._inner_optimise(start)
+                predicted = self.surrogate(best[np.newaxis])[0]
+
+                confirmed = self.run_flights(best[np.newaxis], pool)[0]
+                error = np.linalg.norm(confirmed - predicted)
+                self.history.append((best, predicted, confirmed, error))
+                if error < tolerance:
+                    break
+
+        inclination, heading = tilt_to_rail(best)
+        distance = float(np.linalg.norm(confirmed - self.target))
+        return {
+            "inclination": float(inclination),
+            "heading": float(heading),
+            "landing": confirmed,
+            "distance": distance,
+            "expected_cost": float(self.expected_cost(best)),
+            "inside_zone": None if self.zone_radius is None else distance <= self.zone_radius,
+            "surrogate_error": float(error),
+            "full_flights": len(self.design_tilt),
+        }
+
+    def compare(self, inclination=86, heading=0):
+        # the fixed rail of the scripts against the optimum, on the surrogate
+        tilt = rail_to_tilt(inclination, heading)
+        return float(self.expected_cost(tilt))
+
+
+if __name__ == "__main__":
+    import sys
+    import time as timer
+
+    from LaunchWindow import ForecastWindow
+
+    # python RocketPy/RailOptimiser.py [forecast file or "GFS"]
+    forecast = ForecastWindow(sys.argv[1] if len(sys.argv) > 1 else "GFS", hours=3)
+    print(f"forecast hour {forecast.dates[0]}")
+
+    optimiser = RailOptimiser(forecast.tables[0], forecast)
+    start = timer.perf_counter()
+    best = optimiser.optimise()
+    print(f"{best['full_flights']} full flights in {timer.perf_counter() - start:.0f} s")
+    print(
+        f"best rail: inclination {best['inclination']:.2f} deg, heading {best['heading']:.1f} deg, "
+        f"landing {best['distance']:.0f} m from the target "
+        f"(surrogate error {best['surrogate_error']:.1f} m)"
+    )
+    print(
+        f"expected distance {best['expected_cost']:.0f} m vs "
+        f"{optimiser.compare(86, 0):.0f} m for inclination 86, heading 0"
+    )
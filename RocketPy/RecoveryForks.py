@@ -0,0 +1,266 @@
+# Recovery sweeps that fly the ascent once
+# Changing the drogue cd_s (0.274 vs 0.3936), the main lag (0 vs 7 s) or the main
+# deployment altitude (450 vs 500 m) doesn't change the powered ascent, but every Flight
+# re-simulates it. take_snapshot saves the solver state of a flown Flight at an event
+# (burn_out, apogee, a parachute's inflation, or any time), with which parachutes are
+# already out or triggered and still in their lag, and fork_flight continues it with
+# changed recovery parameters:
+#  - the descent rocket's parachutes are swapped (and put back afterwards) for copies with
+#    the variant's overrides, parachutes already out at the snapshot deploy on the first
+#    trigger check with no lag, triggered ones finish what is left of their lag,
+#  - a snapshot before apogee coasts the ascent rocket up to apogee first (the payload is
+#    released there, as in the Nimbus scripts).
+# RecoverySweep runs the forks on a process pool like the LaunchWindow scans: the snapshot
+# and a table of the environment's profiles are sent to the workers, which build the
+# Nimbus rockets and the environment once and return a summary of each descent.
+#
+# usage:
+#   snapshot = take_snapshot(Ascent, "apogee")
+#   variants = variant_grid({"drogue": {"cd_s": [0.274, 0.3936]}, "main": {"lag": [0, 7]}})
+#   results = RecoverySweep(snapshot, env, variants).run()
+#   Descent = fork_flight(snapshot, variants[0], NimbusDescent, env)    # one fork, in process
+
+# imports
+import datetime
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from rocketpy import Flight
+from rocketpy.rocket import Parachute
+
+from LaunchWindow import table_environment
+from TrajectoryStore import interpolate_states
+
+PARACHUTE_PARAMETERS = ("cd_s", "trigger", "sampling_rate", "lag", "noise")
+PROFILE_HEIGHTS = np.arange(0, 12001, 10.0)  # environment table nodes, m above the pad
+
+
+class FlightSnapshot:
+    # time (s), state [x, y, z, vx, vy, vz, e0, e1, e2, e3, w1, w2, w3] of a Flight at an
+    # event, deployed: names of the parachutes out by then, triggered: {name: lag left (s)}
+    def __init__(self, event, time, state, deployed=(), triggered=None, rail_length=12):
+        self.event = event
+        self.time = float(time)
+        self.state = np.asarray(state, dtype=float)
+        self.deployed = tuple(deployed)
+        self.triggered = dict(triggered or {})
+        self.rail_length = rail_length
+
+    @property
+    def ascending(self):
+        return self.state[5] > 0
+
+    @property
+    def initial_solution(self):
+        return [self.time, *self.state]
+
+    def __repr__(self):
+        return (f"FlightSnapshot({self.event!r}, t={self.time:.3f} s, z={self.state[2]:.1f} m, "
+                f"deployed={list(self.deployed)})")
+
+
+def _event_time(flight, event):
+    if not isinstance(event, str):
+        return float(event)
+    if event == "apogee":
+        return float(flight.apogee_time)
+    if event == "burn_out":
+        return float(flight.rocket.motor.burn_out_time)
+    if event == "out_of_rail":
+        return float(flight.out_of_rail_time)
+    for trigger_time, parachute in flight.parachute_events:
+        if parachute.name == event:
+            return float(trigger_time + parachute.lag)  # inflation, the cd_s changes here
+    raise ValueError(f"{event!r} is not an event of {flight.name} (parachutes deployed: "
+                     f"{[parachute.name for _, parachute in flight.parachute_events]})")
+
+
+def take_snapshot(flight, event="apogee"):
+    # state of a flown Flight at an event name or a time (s) inside its solution
+    time = _event_time(flight, event)
+    solution = np.asarray(flight.solution, dtype=float)
+    if not solution[0, 0] <= time <= solution[-1, 0]:
+        raise ValueError(f"{event!r} at {time:.3f} s is outside {flight.name}'s solution "
+                         f"({solution[0, 0]:.3f} to {solution[-1, 0]:.3f} s)")
+    state = interpolate_states(solution[:, 0], solution[:, 1:], np.array([time]))[0]
+
+    deployed, triggered = [], {}
+    for trigger_time, parachute in flight.parachute_events:
+        if trigger_time + parachute.lag <= time:
+            deployed.append(parachute.name)
+        elif trigger_time <= time:
+            triggered[parachute.name] = trigger_time + parachute.lag - time
+    return FlightSnapshot(event, time, state, deployed, triggered, flight.rail_length)
+
+
+def _deployed(p, h, y):
+    # trigger of a parachute already out at the snapshot
+    return True
+
+
+def fork_parachutes(rocket, snapshot, variant):
+    # copies of the rocket's parachutes with the variant's {name: {parameter: value}}
+    # overrides, the ones out (or triggered) at the snapshot deploying straight away
+    unknown = set(variant) - {parachute.name for parachute in rocket.parachutes}
+    if unknown:
+        raise ValueError(f"no parachute named {sorted(unknown)} on the rocket")
+    parachutes = []
+    for parachute in rocket.parachutes:
+        parameters = {name: getattr(parachute, name) for name in PARACHUTE_PARAMETERS}
+        parameters.update(variant.get(parachute.name, {}))
+        if parachute.name in snapshot.deployed:
+            parameters.update(trigger=_deployed, lag=0)
+        elif parachute.name in snapshot.triggered:
+            parameters.update(trigger=_deployed, lag=snapshot.triggered[parachute.name])
+        parachutes.append(Parachute(name=parachute.name, **parameters))
+    return parachutes
+
+
+def fork_flight(snapshot, variant, descent_rocket, env, ascent_rocket=None, name="Fork"):
+    # descent Flight continued from the snapshot with the variant's parachutes
+    initial_solution = snapshot.initial_solution
+    if snapshot.ascending:
+        if ascent_rocket is None:
+            raise ValueError(f"the {snapshot.event!r} snapshot is before apogee, the coast "
+                             "needs the ascent rocket")
+        coast = Flight(
+            rocket=ascent_rocket, environment=env, rail_length=snapshot.rail_length,
+            inclination=0, heading=0, initial_solution=initial_solution,
+            terminate_on_apogee=True, name=f"{name} coast",
+        )
+        initial_solution = coast
+
+    parachutes = descent_rocket.parachutes
+    descent_rocket.parachutes = fork_parachutes(descent_rocket, snapshot, variant)
+    try:
+        return Flight(
+            rocket=descent_rocket, environment=env, rail_length=snapshot.rail_length,
+            inclination=0, heading=0, initial_solution=initial_solution, name=name,
+        )
+    finally:
+        descent_rocket.parachutes = parachutes
+
+
+def variant_grid(parameters):
+    # every combination of {name: {parameter: [values]}} as a list of variants
+    keys = [(name, parameter) for name, values in parameters.items() for parameter in values]
+    variants = []
+    for combination in itertools.product(*(parameters[name][parameter] for name, parameter in keys)):
+        variant = {}
+        for (name, parameter), value in zip(keys, combination):
+            variant.setdefault(name, {})[parameter] = value
+        variants.append(variant)
+    return variants
+
+
+def variant_label(variant):
+    return ", ".join(f"{name} {parameter}={value:g}" if isinstance(value, (int, float))
+                     else f"{name} {parameter}" for name, parameters in variant.items()
+                     for parameter, value in parameters.items()) or "nominal"
+
+
+def fork_summary(flight, variant):
+    # landing, drift and deployments of a fork (plain values, sent back by the workers)
+    x, y, z, vx, vy, vz = flight.solution[-1][1:7]
+    return {
+        "variant": variant,
+        "x_impact": float(x),
+        "y_impact": float(y),
+        "drift": float(np.hypot(x, y)),
+        "t_final": float(flight.t_final),
+        "impact_velocity": float(vz),
+        "deployments": {parachute.name: float(time + parachute.lag)
+                        for time, parachute in flight.parachute_events},
+    }
+
+
+def profile_table(env, heights=PROFILE_HEIGHTS):
+    # LaunchWindow style table of an Environment's profiles, to rebuild it in the workers
+    height = env.elevation + heights
+    return {
+        "date": env.datetime_date or datetime.datetime.now().replace(minute=0, second=0, microsecond=0),
+        "height": height,
+        "pressure": np.asarray(env.pressure.get_value(height), dtype=float),
+        "temperature": np.asarray(env.temperature.get_value(height), dtype=float),
+        "wind_u": np.asarray(env.wind_velocity_x.get_value(height), dtype=float),
+        "wind_v": np.asarray(env.wind_velocity_y.get_value(height), dtype=float),
+    }
+
+
+_WORKER = {}
+
+
+def _fork(snapshot, variant, table, site, key):
+    # worker: one fork of the Nimbus descent, the rockets and environment built once
+    from Nimbus import Nimbus, NimbusDescent
+
+    if _WORKER.get("key") != key:
+        _WORKER.update(key=key, env=table_environment(table, *site))
+    flight = fork_flight(snapshot, variant, NimbusDescent, _WORKER["env"], Nimbus)
+    return fork_summary(flight, variant)
+
+
+class RecoverySweep:
+    # snapshot: from take_snapshot, env: the environment it was flown in, variants: list of
+    # {parachute name: {parameter: value}} (variant_grid), forks of the Nimbus rockets
+    def __init__(self, snapshot, env, variants, max_workers=None):
+        self.snapshot = snapshot
+        self.variants = variants
+        self.table = profile_table(env)
+        self.site = (env.latitude, env.longitude, env.elevation)
+        self.max_workers = max_workers
+
+    def run(self):
+        key = id(self)
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [
+                pool.submit(_fork, self.snapshot, variant, self.table, self.site, key)
+                for variant in self.variants
+            ]
+            return [future.result() for future in futures]
+
+    @staticmethod
+    def print_results(results):
+        print(f"{'variant':<44} {'x (m)':>8} {'y (m)':>8} {'drift (m)':>10} {'time (s)':>9} {'impact (m/s)':>13}")
+        for result in results:
+            print(f"{variant_label(result['variant']):<44} {result['x_impact']:>8.1f} {result['y_impact']:>8.1f} "
+                  f"{result['drift']:>10.1f} {result['t_final']:>9.1f} {result['impact_velocity']:>13.2f}")
+
+
+if __name__ == "__main__":
+    import time
+
+    from rocketpy import Environment
+
+    from Nimbus import Nimbus, NimbusDescent
+
+    env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+    env.set_atmospheric_model(type="custom_atmosphere", wind_u=2, wind_v=3)
+
+    start = time.perf_counter()
+    Ascent = Flight(rocket=Nimbus, environment=env, rail_length=12, inclination=86, heading=0,
+                    terminate_on_apogee=True, name="Ascent")
+    Descent = Flight(rocket=NimbusDescent, environment=env, rail_length=12, inclination=0, heading=0,
+                     initial_solution=Ascent, name="Descent")
+    full_time = time.perf_counter() - start
+    print(f"nominal ascent + descent in {full_time:.2f} s, landing "
+          f"({Descent.x_impact:.1f}, {Descent.y_impact:.1f}) m")
+
+    # the nominal parameters forked from apogee and from the drogue inflation land where
+    # the full descent does
+    for event in ("apogee", "drogue"):
+        snapshot = take_snapshot(Descent if event != "apogee" else Ascent, event)
+        fork = fork_flight(snapshot, {}, NimbusDescent, env)
+        print(f"{snapshot}: nominal fork lands at ({fork.x_impact:.1f}, {fork.y_impact:.1f}) m")
+
+    variants = variant_grid({
+        "drogue": {"cd_s": [0.274, 0.3936]},
+        "main": {"lag": [0, 7], "trigger": [450, 500]},
+    })
+    start = time.perf_counter()
+    results = RecoverySweep(take_snapshot(Ascent, "apogee"), env, variants).run()
+    sweep_time = time.perf_counter() - start
+    RecoverySweep.print_results(results)
+    print(f"{len(variants)} forks from apogee in {sweep_time:.2f} s, "
+          f"re-flying the ascent every time would take about {full_time * len(variants):.2f} s")
@@ -0,0 +1,220 @@
+# Sizing of the drogue and main parachutes
+# Nimbus.py and NimbusMonteCarlo.py fly different hand picked recovery settings (drogue cd_s
+# 0.3936 vs 0.274, main lag 7 vs 0 s). RecoverySizing evaluates every combination of drogue
+# cd_s, main cd_s, main lag and main deployment altitude with a quasi-steady descent: under
+# a canopy the rocket falls at the local terminal velocity sqrt(2 m g / (rho cd_s)) (rocketpy
+# flies the parachute phases with the latest canopy's cd_s and the dry mass) and drifts with
+# the wind. The descent is marched down altitude layers from apogee, vectorised over the
+# grid and over wind realisations, so thousands of designs x winds take a fraction of a
+# second. For each design:
+#   opening_velocity  drogue descent rate when the main inflates (what loads the main)
+#   landing_velocity  main descent rate at the ground
+#   drift / max_drift landing distance from the rail, nominal wind / worst realisation
+#   descent_time      apogee to landing, nominal wind
+# pareto_front keeps the designs no other design beats on all the objectives, and verify
+# flies chosen designs as full rocketpy descents, forked from the apogee snapshot
+# (RecoveryForks), next to the model's numbers.
+#
+# usage:
+#   sizing = RecoverySizing(Ascent, NimbusDescent, env, winds=perturbed_winds(...))
+#   designs = sizing.evaluate(design_grid(drogue_cd_s=..., main_cd_s=..., main_lag=..., main_altitude=...))
+#   front = pareto_front(designs, limits={"landing_velocity": 6})
+#   sizing.verify(designs, front[:4])
+
+# imports
+import itertools
+
+import numpy as np
+
+from Payload import wind_profile
+from RecoveryForks import RecoverySweep, take_snapshot
+
+LAYER = 5.0  # m, altitude step of the descent march
+OBJECTIVES = ("landing_velocity", "max_drift", "opening_velocity")
+DESIGN_PARAMETERS = ("drogue_cd_s", "main_cd_s", "main_lag", "main_altitude")
+
+
+def design_grid(drogue_cd_s, main_cd_s, main_lag, main_altitude):
+    # every combination as a dict of parameter arrays, main_altitude in m above the pad
+    grid = np.array(list(itertools.product(drogue_cd_s, main_cd_s, main_lag, main_altitude)), dtype=float)
+    return dict(zip(DESIGN_PARAMETERS, grid.T))
+
+
+def pareto_front(designs, objectives=OBJECTIVES, limits=None):
+    # indices of the designs within the limits ({objective: max}) that no other one beats
+    # on every objective (all minimised), sorted by the first objective
+    values = np.column_stack([designs[name] for name in objectives])
+    feasible = np.ones(len(values), dtype=bool)
+    for name, limit in (limits or {}).items():
+        feasible &= designs[name] <= limit
+    candidates = np.flatnonzero(feasible)
+    values = values[candidates]
+    dominated = np.zeros(len(candidates), dtype=bool)
+    for i, row in enumerate(values):
+        dominated[i] = np.any(np.all(values <= row, axis=1) & np.any(values < row, axis=1))
+    front = candidates[~dominated]
+    return front[np.argsort(designs[objectives[0]][front], kind="stable")]
+
+
+def design_variant(designs, index):
+    # RecoveryForks variant of one design, the main triggered by altitude
+    return {
+        "drogue": {"cd_s": float(designs["drogue_cd_s"][index])},
+        "main": {
+            "cd_s": float(designs["main_cd_s"][index]),
+            "lag": float(designs["main_lag"][index]),
+            "trigger": float(designs["main_altitude"][index]),
+        },
+    }
+
+
+class RecoverySizing:
+    # ascent: the Flight to apogee (where the drogue opens), rocket: the descent rocket,
+    # winds: (n, n_altitudes, 2) wind realisations on `altitudes` for the max drift, the
+    # environment's own profile is the nominal one
+    def __init__(self, ascent, rocket, env, winds=None, altitudes=None, layer=LAYER):
+        self.ascent = ascent
+        self.rocket = rocket
+        self.env = env
+        self.layer = layer
+        self.mass = rocket.dry_mass
+
+        apogee = ascent.get_solution_at_time(ascent.apogee_time)
+        self.apogee = np.asarray(apogee[1:4], dtype=float)
+        self.apogee_velocity = np.asarray(apogee[4:6], dtype=float)
+        self.heights = np.arange(self.apogee[2], env.elevation, -layer)  # layer tops, descending
+        self.heights = np.append(self.heights, env.elevation)
+        middle = 0.5 * (self.heights[:-1] + self.heights[1:])
+        self.thickness = -np.diff(self.heights)
+        self.weight_over_density = (
+            self.mass * np.asarray(env.gravity.get_value(middle), dtype=float)
+            / np.asarray(env.density.get_value(middle), dtype=float)
+        )
+        self.above_ground = self.heights[1:] - env.elevation
+
+        nominal = wind_profile(env, middle)[np.newaxis]
+        if winds is not None:
+            winds = np.asarray(winds, dtype=float)
+            winds = np.array([
+                np.column_stack([np.interp(middle, altitudes, wind[:, k]) for k in range(2)])
+                for wind in winds
+            ])
+            nominal = np.concatenate([nominal, winds])
+        self.winds = nominal  # (n_winds, n_layers, 2), the nominal first
+
+    def terminal_velocity(self, cd_s, layer):
+        return np.sqrt(2 * self.weight_over_density[layer] / cd_s)
+
+    def evaluate(self, designs):
+        # quasi-steady descents of every design under every wind, returns the designs with
+        # their objectives added
+        drogue_cd_s = designs["drogue_cd_s"][:, np.newaxis]
+        main_cd_s = designs["main_cd_s"][:, np.newaxis]
+        main_lag = designs["main_lag"][:, np.newaxis]
+        main_altitude = designs["main_altitude"][:, np.newaxis]
+        n = len(drogue_cd_s)
+
+        # the descent time and main state only depend on the design, the drift on the wind
+        time = np.zeros((n, 1))
+        trigger_time = np.full((n, 1), np.inf)
+        opened = np.zeros((n, 1), dtype=bool)
+        opening_velocity = np.full((n, 1), np.inf)
+        opening_altitude = np.full((n, 1), np.nan)
+        drift = np.zeros((n, len(self.winds), 2))
+        for k in range(len(self.thickness)):
+            drogue_velocity = self.terminal_velocity(drogue_cd_s, k)
+            velocity = np.where(opened, self.terminal_velocity(main_cd_s, k), drogue_velocity)
+            dt = self.thickness[k] / velocity
+            time += dt
+            drift += self.winds[np.newaxis, :, k] * dt[:, :, np.newaxis]
+
+            trigger_time = np.where(np.isinf(trigger_time) & (self.above_ground[k] < main_altitude), time, trigger_time)
+            opening = ~opened & (time >= trigger_time + main_lag)
+            opening_velocity = np.where(opening, drogue_velocity, opening_velocity)
+            opening_altitude = np.where(opening, self.above_ground[k], opening_altitude)
+            opened |= opening
+
+        # the horizontal velocity left at apogee relaxes to the wind in about v_t / g
+        relaxation = self.terminal_velocity(drogue_cd_s, 0) / self.env.gravity.get_value(self.apogee[2])
+        drift += (self.apogee_velocity - self.winds[np.newaxis, :, 0]) * relaxation[:, :, np.newaxis]
+
+        landing = self.apogee[np.newaxis, np.newaxis, :2] + drift
+        distance = np.hypot(landing[..., 0], landing[..., 1])
+        results = dict(designs)
+        results.update(
+            x_impact=landing[:, 0, 0],
+            y_impact=landing[:, 0, 1],
+            drift=distance[:, 0],
+            max_drift=distance.max(axis=1),
+            descent_time=time[:, 0],
+            # the main never inflating lands under the drogue, an unusable design
+            landing_velocity=np.where(opened, self.terminal_velocity(main_cd_s, -1), np.inf)[:, 0],
+            opening_velocity=opening_velocity[:, 0],
+            opening_altitude=opening_altitude[:, 0],
+        )
+        return results
+
+    def verify(self, designs, indices, max_workers=None):
+        # full rocketpy descents of the chosen designs, forked from the apogee, next to the
+        # quasi-steady model
+        sweep = RecoverySweep(
+            take_snapshot(self.ascent, "apogee"), self.env,
+            [design_variant(designs, index) for index in indices], max_workers=max_workers,
+        )
+        flights = sweep.run()
+        print(f"{'drogue cd_s':>11} {'main cd_s':>9} {'lag':>4} {'alt':>5} | "
+              f"{'drift model/flight (m)':>23} {'landing model/flight (m/s)':>27} {'time model/flight (s)':>22}")
+        for index, flight in zip(indices, flights):
+            print(f"{designs['drogue_cd_s'][index]:>11.4g} {designs['main_cd_s'][index]:>9.4g} "
+                  f"{designs['main_lag'][index]:>4.0f} {designs['main_altitude'][index]:>5.0f} | "
+                  f"{designs['drift'][index]:>11.0f} / {flight['drift']:<9.0f} "
+                  f"{designs['landing_velocity'][index]:>13.2f} / {-flight['impact_velocity']:<11.2f} "
+                  f"{designs['descent_time'][index]:>10.1f} / {flight['t_final'] - self.ascent.apogee_time:<9.1f}")
+        return flights
+
+
+def print_designs(designs, indices):
+    print(f"{'drogue cd_s':>11} {'main cd_s':>9} {'lag (s)':>7} {'alt (m)':>7} {'opening (m/s)':>13} "
+          f"{'landing (m/s)':>13} {'drift (m)':>9} {'max drift (m)':>13}")
+    for i in indices:
+        print(f"{designs['drogue_cd_s'][i]:>11.4g} {designs['main_cd_s'][i]:>9.4g} {designs['main_lag'][i]:>7.0f} "
+              f"{designs['main_altitude'][i]:>7.0f} {designs['opening_velocity'][i]:>13.1f} "
+              f"{designs['landing_velocity'][i]:>13.2f} {designs['drift'][i]:>9.0f} {designs['max_drift'][i]:>13.0f}")
+
+
+if __name__ == "__main__":
+    import time as timer
+
+    from rocketpy import Environment, Flight
+
+    from Nimbus import Nimbus, NimbusDescent
+    from Payload import ALTITUDES, perturbed_winds
+
+    env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+    env.set_atmospheric_model(type="custom_atmosphere", wind_u=2, wind_v=3)
+    Ascent = Flight(rocket=Nimbus, environment=env, rail_length=12, inclination=86, heading=0,
+                    terminate_on_apogee=True, name="Ascent")
+
+    winds = perturbed_winds(wind_profile(env, ALTITUDES), 200, rng=0)
+    sizing = RecoverySizing(Ascent, NimbusDescent, env, winds=winds, altitudes=ALTITUDES)
+    designs = design_grid(
+        drogue_cd_s=np.linspace(0.2, 1.2, 11),
+        main_cd_s=np.linspace(10, 40, 13),
+        main_lag=[0, 3, 7],
+        main_altitude=[300, 450, 500, 600, 800],
+    )
+    start = timer.perf_counter()
+    designs = sizing.evaluate(designs)
+    print(f"{len(designs['drogue_cd_s'])} designs x {len(sizing.winds)} winds in "
+          f"{timer.perf_counter() - start:.2f} s")
+
+    # the two hand picked settings
+    for label, values in (("Nimbus.py", (0.3936, 29.128, 7, 500)), ("NimbusMonteCarlo.py", (0.274, 29.128, 0, 450))):
+        single = sizing.evaluate({name: np.array([value], dtype=float) for name, value in zip(DESIGN_PARAMETERS, values)})
+        print(f"{label}:")
+        print_designs(single, [0])
+
+    front = pareto_front(designs, limits={"landing_velocity": 6, "opening_velocity": 40})
+    print(f"Pareto front, {len(front)} designs:")
+    print_designs(designs, front)
+    sizing.verify(designs, front[np.linspace(0, len(front) - 1, min(4, len(front))).astype(int)])
@@ -0,0 +1,231 @@
+# Roll only study of canted canards
+# Nimbus_AllCanardSpin.py / Nimbus_SingleCanard.py answer "how fast does it spin" with one
+# full 6-DOF flight per cant angle. The roll rate only depends on the roll forcing and
+# damping of the fin sets, so here those coefficients are tabulated vs Mach once from the
+# fin geometry (same formulas rocketpy's Flight uses) and only the roll axis
+#   I_33 * dw3/dt = M3f - M3d
+# is integrated, for a whole grid of cant angles x speeds at once with numpy.
+# Cross coupling with pitch/yaw, the I_33 rate term and roll from body lift are ignored.
+#
+# usage:
+#   study = RollStudy(Nimbus, canards, env)
+#   sweep = study.sweep(cant_angles=np.arange(0, 16), speeds=np.linspace(30, 300, 28))
+#   sweep.plot_spin_families(); sweep.plot_peak_roll_map()
+#   profile = study.along_flight(Ascent, cant_angles=np.arange(0, 16))
+
+# imports
+import matplotlib.pyplot as plt
+import numpy as np
+from rocketpy.rocket.aero_surface import Fins
+
+MACH_GRID = np.linspace(0, 2, 201)
+
+
+class RollSweep:
+    # roll rate families of one study, omega has shape (cant angles, speeds, time) in rad/s
+    def __init__(self, cant_angles, speeds, time, omega, speed_label="Speed (m/s)"):
+        self.cant_angles = np.asarray(cant_angles, dtype=float)
+        self.speeds = np.asarray(speeds, dtype=float)
+        self.time = time
+        self.omega = omega
+        self.speed_label = speed_label
+
+    @property
+    def peak_roll_rate(self):
+        # (cant angles, speeds) map of the largest roll rate reached, rad/s
+        return np.abs(self.omega).max(axis=-1)
+
+    @property
+    def time_to_peak(self):
+        return self.time[np.abs(self.omega).argmax(axis=-1)]
+
+    @property
+    def peak_spin_rps(self):
+        return self.peak_roll_rate / (2 * np.pi)
+
+    def plot_spin_families(self, speed_index=None, cant_index=None):
+        # w3(t) for every cant angle at one speed (default the fastest), or for every
+        # speed at one cant angle if cant_index is given
+        fig, ax = plt.subplots()
+        if cant_index is not None:
+            for j, speed in enumerate(self.speeds):
+                ax.plot(self.time, self.omega[cant_index, j], label=f"{speed:.3g}")
+            ax.set_title(f"Roll rate, cant {self.cant_angles[cant_index]:.3g} deg")
+            ax.legend(title=self.speed_label, fontsize="small")
+        else:
+            speed_index = -1 if speed_index is None else speed_index
+            for i, cant in enumerate(self.cant_angles):
+                ax.plot(self.time, self.omega[i, speed_index], label=f"{cant:.3g}")
+            ax.set_title(f"Roll rate, {self.speed_label} = {self.speeds[speed_index]:.3g}")
+            ax.legend(title="Cant (deg)", fontsize="small")
+        ax.set_xlabel("Time (s)")
+        ax.set_ylabel("Roll rate (rad/s)")
+        ax.grid(True)
+        plt.show()
+
+    def plot_peak_roll_map(self):
+        fig, ax = plt.subplots()
+        mesh = ax.pcolormesh(
+            self.speeds, self.cant_angles, self.peak_spin_rps, shading="auto"
+        )
+        fig.colorbar(mesh, ax=ax, label="Peak spin rate (rev/s)")
+        ax.set_xlabel(self.speed_label)
+        ax.set_ylabel("Cant angle (deg)")
+        ax.set_title("Peak roll rate")
+        plt.show()
+
+    def plot_spin_histogram(self, bins=30):
+        # distribution of the peak spin rate over the whole sweep
+        fig, ax = plt.subplots()
+        ax.hist(self.peak_spin_rps.ravel(), bins=bins)
+        ax.set_xlabel("Peak spin rate (rev/s)")
+        ax.set_ylabel("Number of cases")
+        ax.set_title("Peak spin rate over the sweep")
+        plt.show()
+
+    def summary(self):
+        peak = self.peak_spin_rps
+        i, j = np.unravel_index(peak.argmax(), peak.shape)
+        print(
+            f"{peak.size} cases, peak spin {peak.min():.2f} to {peak.max():.2f} rev/s, "
+            f"max at cant {self.cant_angles[i]:.3g} deg, "
+            f"{self.speed_label} {self.speeds[j]:.3g}"
+        )
+
+
+class RollStudy:
+    # rocket: the nominal rocket with all its fin sets, canards: the fin set whose cant is
+    # swept (the others keep their own cant), environment: for density and speed of sound
+    def __init__(self, rocket, canards, environment, mach_grid=MACH_GRID):
+        self.rocket = rocket
+        self.environment = environment
+        self.mach_grid = mach_grid
+
+        fin_sets = [
+            surface for surface, _ in rocket.aerodynamic_surfaces if isinstance(surface, Fins)
+        ]
+        if not any(fins is canards for fins in fin_sets):
+            raise ValueError("`canards` must be one of the fin sets of `rocket`")
+
+        # roll moment per unit dynamic pressure per radian of cant, and damping moment per
+        # unit (0.5 * rho * V * w3), both vs Mach, as in rocketpy's Flight.u_dot
+        self.canard_forcing = np.zeros_like(mach_grid)
+        self.canard_damping = np.zeros_like(mach_grid)  # at zero cant, scales with cos(cant)
+        self.other_forcing = np.zeros_like(mach_grid)  # already times their own cant
+        self.other_damping = np.zeros_like(mach_grid)
+        for fins in fin_sets:
+            clf_delta, cld_omega, cant_angle_rad = fins.roll_parameters
+            clf = np.array([clf_delta.get_value_opt(mach) for mach in mach_grid])
+            cld = np.array([cld_omega.get_value_opt(mach) for mach in mach_grid])
+            forcing = fins.ref_area * 2 * fins.rocket_radius * clf
+            damping = fins.ref_area * (2 * fins.rocket_radius) ** 2 * cld / 2
+            if fins is canards:
+                self.canard_forcing += forcing
+                self.canard_damping += damping / np.cos(cant_angle_rad)
+            else:
+                self.other_forcing += forcing * cant_angle_rad
+                self.other_damping += damping
+
+    def coefficients(self, cant_angles, mach):
+        # forcing (N m per Pa) and damping (N m s per (kg/m^3 * m/s * rad)) for every
+        # cant angle (deg) x mach, broadcast to (cant angles, *mach.shape)
+        cant = np.radians(np.asarray(cant_angles, dtype=float))
+        cant = cant.reshape(cant.shape + (1,) * np.ndim(mach))
+        forcing = (
+            np.interp(mach, self.mach_grid, self.canard_forcing) * cant
+            + np.interp(mach, self.mach_grid, self.other_forcing)
+        )
+        damping = (
+            np.interp(mach, self.mach_grid, self.canard_damping) * np.cos(cant)
+            + np.interp(mach, self.mach_grid, self.other_damping)
+        )
+        return forcing, damping
+
+    def steady_roll_rate(self, cant_angles, speeds, altitude=None):
+        # w3 the roll settles to at constant speed, rad/s: forcing balances damping at
+        # w3 = V * forcing / damping, so it grows linearly with speed away from Mach effects
+        altitude = self.environment.elevation if altitude is None else altitude
+        speeds = np.asarray(speeds, dtype=float)
+        mach = speeds / self.environment.speed_of_sound(altitude)
+        forcing, damping = self.coefficients(cant_angles, mach)
+        return speeds * forcing / damping
+
+    def sweep(
+        self, cant_angles, speeds, altitude=None, duration=10, dt=0.01, time=None, omega0=0
+    ):
+        # constant speed and altitude for every case, starting from omega0. The roll
+        # equation is then linear with constant coefficients and is solved exactly:
+        #   w3(t) = w_ss + (omega0 - w_ss) * exp(-t / tau), tau = I_33 / (0.5 rho V damping)
+        # time: rocket time for the roll inertia, defaults to burn out
+        altitude = self.environment.elevation if altitude is None else altitude
+        time = self.rocket.motor.burn_out_time if time is None else time
+        speeds = np.asarray(speeds, dtype=float)
+
+        rho = self.environment.density(altitude)
+        mach = speeds / self.environment.speed_of_sound(altitude)
+        forcing, damping = self.coefficients(cant_angles, mach)
+        I_33 = self.rocket.I_33(time)
+
+        forcing = 0.5 * rho * speeds**2 * forcing
+        damping = 0.5 * rho * speeds * damping
+        omega_ss = forcing / damping
+
+        t = np.arange(0, duration + dt / 2, dt)
+        decay = np.exp(-(damping / I_33)[..., np.newaxis] * t)
+        omega = omega_ss[..., np.newaxis] + (omega0 - omega_ss[..., np.newaxis]) * decay
+        return RollSweep(cant_angles, speeds, t, omega)
+
+    def along_flight(self, flight, cant_angles, speed_factors=(1,), dt=0.01):
+        # roll response along the speed/altitude history of an existing flight (e.g. a
+        # nominal ascent with uncanted canards), with its speed scaled by speed_factors.
+        # Each step holds the coefficients constant and uses the exact exponential update.
+        speed_factors = np.asarray(speed_factors, dtype=float)
+        t = np.arange(flight.out_of_rail_time, flight.t_final + dt / 2, dt)
+        free_stream_speed = np.asarray(flight.free_stream_speed(t))
+        altitude = np.asarray(flight.z(t))
+        rho = np.asarray(self.environment.density(altitude))
+        speed_of_sound = np.asarray(self.environment.speed_of_sound(altitude))
+        I_33 = np.array([self.rocket.I_33.get_value_opt(ti) for ti in t])
+
+        speeds = speed_factors[:, np.newaxis] * free_stream_speed  # (factors, time)
+        forcing, damping = self.coefficients(cant_angles, speeds / speed_of_sound)
+        forcing = 0.5 * rho * speeds**2 * forcing  # (cants, factors, time)
+        damping = 0.5 * rho * speeds * damping
+        omega_ss = forcing / np.where(damping > 0, damping, np.inf)
+        decay = np.exp(-damping / I_33 * dt)
+
+        omega = np.zeros(forcing.shape)
+        for k in range(1, len(t)):
+            omega[..., k] = omega_ss[..., k - 1] + (
+                omega[..., k - 1] - omega_ss[..., k - 1]
+            ) * decay[..., k - 1]
+        return RollSweep(cant_angles, speed_factors, t, omega, speed_label="Speed factor")
+
+
+if __name__ == "__main__":
+    import time as timer
+
+    from rocketpy import Environment
+
+    from Nimbus_AllCanardSpin import Nimbus, canards
+    from Nimbus_SingleCanard import Nimbus as NimbusSingle, canards as single_canard
+
+    env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+    env.set_atmospheric_model(type="standard_atmosphere")
+
+    cant_angles = np.arange(0, 16)
+    speeds = np.linspace(30, 320, 30)
+
+    for name, rocket, fin_set in [
+        ("3 canards", Nimbus, canards),
+        ("single canard", NimbusSingle, single_canard),
+    ]:
+        start = timer.perf_counter()
+        study = RollStudy(rocket, fin_set, env)
+        sweep = study.sweep(cant_angles, speeds, altitude=1500, duration=10)
+        print(f"{name}: {timer.perf_counter() - start:.3f} s")
+        sweep.summary()
+
+    sweep.plot_spin_families()
+    sweep.plot_peak_roll_map()
+    sweep.plot_spin_histogram()
@@ -0,0 +1,348 @@
+# Global sensitivity analysis (Sobol indices) of the Nimbus Monte Carlo parameters
+# The uncertainties in NimbusMonteCarlo.py are arbitrary for now, before tightening any of
+# them we want to know which ones actually drive the apogee and landing dispersion.
+# SobolAnalysis reuses the stochastic objects of NimbusMonteCarlo.py: every factor below is
+# drawn from the distribution given there, everything else is held at its nominal value.
+# Saltelli's scheme: two base samples A and B plus, for every group, A with that group's
+# columns taken from B. The A and B flights are shared by all groups, and the same runs give
+# both the first order (Saltelli 2010) and total (Jansen) indices, so N * (groups + 2)
+# ascent + descent flights in one parallel batch give every index. Flown samples are kept
+# (and can be saved), so regrouping or increasing N only flies the missing ones.
+#
+# usage:
+#   analysis = SobolAnalysis(n_base=64)
+#   analysis.run()
+#   analysis.print_indices(); analysis.plot()
+
+# imports
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import matplotlib.pyplot as plt
+import numpy as np
+from scipy.special import ndtri
+from scipy.stats import qmc
+
+# factor -> (NimbusMonteCarlo stochastic object, attribute) it sets. The ascent and descent
+# counterparts of the same physical quantity share one factor
+PARAMETERS = {
+    "mass": [("stochastic_Ascent", "mass"), ("stochastic_Descent", "mass")],
+    "inertia_11": [
+        ("stochastic_Ascent", "I_11_without_motor"),
+        ("stochastic_Descent", "I_11_without_motor"),
+    ],
+    "inertia_22": [
+        ("stochastic_Ascent", "I_22_without_motor"),
+        ("stochastic_Descent", "I_22_without_motor"),
+    ],
+    "inertia_33": [
+        ("stochastic_Ascent", "I_33_without_motor"),
+        ("stochastic_Descent", "I_33_without_motor"),
+    ],
+    "fin_root_chord": [("stochastic_fin_setA", "root_chord"), ("stochastic_fin_setD", "root_chord")],
+    "fin_tip_chord": [("stochastic_fin_setA", "tip_chord"), ("stochastic_fin_setD", "tip_chord")],
+    "fin_span": [("stochastic_fin_setA", "span"), ("stochastic_fin_setD", "span")],
+    "canard_root_chord": [("stochastic_canardsA", "root_chord"), ("stochastic_canardsD", "root_chord")],
+    "canard_tip_chord": [("stochastic_canardsA", "tip_chord"), ("stochastic_canardsD", "tip_chord")],
+    "canard_span": [("stochastic_canardsA", "span"), ("stochastic_canardsD", "span")],
+    "nose_length": [("stochastic_nose_coneA", "length")],  # used by both rockets
+    "inclination": [("stochastic_flightAscent", "inclination")],
+    "heading": [("stochastic_flightAscent", "heading")],
+    "ensemble_member": [("stochastic_env", "ensemble_member")],
+}
+
+# indices are computed per group (a group can hold several factors)
+GROUPS = {
+    "mass": ["mass"],
+    "inertia": ["inertia_11", "inertia_22", "inertia_33"],
+    "fin chord/span": [
+        "fin_root_chord", "fin_tip_chord", "fin_span",
+        "canard_root_chord", "canard_tip_chord", "canard_span",
+    ],
+    "nose length": ["nose_length"],
+    "inclination/heading": ["inclination", "heading"],
+    "ensemble member": ["ensemble_member"],
+}
+
+OUTPUTS = ("apogee", "landing_x", "landing_y", "landing_distance")
+
+
+def spec_value(spec, u):
+    # value of a stochastic attribute at quantile u: tuples are (nominal, std, distribution),
+    # lists are equally likely choices
+    if isinstance(spec, list):
+        return spec[min(int(u * len(spec)), len(spec) - 1)]
+    nominal, spread, distribution = spec
+    if distribution is np.random.normal:
+        return nominal + spread * ndtri(u)
+    if distribution is np.random.uniform:
+        return nominal + (spread - nominal) * u  # np.random.uniform(low, high)
+    raise ValueError(f"Unsupported distribution {distribution.__name__} for the Sobol analysis")
+
+
+def _freeze(model):
+    # every draw of a stochastic object (and of its surfaces, motor, tanks and parachutes)
+    # at its nominal value
+    from rocketpy.rocket.components import Components
+    from rocketpy.stochastic.stochastic_model import StochasticModel
+
+    def nominal(value):
+        if isinstance(value, tuple):
+            return [value[0]]
+        if isinstance(value, list) and len(value) > 1 and not isinstance(value[0], StochasticModel):
+            return value[:1]
+        return value
+
+    for name, value in list(vars(model).items()):
+        setattr(model, name, nominal(value))
+        if isinstance(value, Components):
+            for i, component in enumerate(value):
+                _freeze(component.component)
+                value._components[i] = component._replace(position=nominal(component.position))
+    for parachute in getattr(model, "parachutes", []):
+        _freeze(parachute)
+    for tank in getattr(model, "positioned_tanks", {}).values():
+        _freeze(tank["tank"])
+        tank["position"] = nominal(tank["position"])
+
+
+@functools.lru_cache(maxsize=None)
+def _worker_model():
+    # NimbusMonteCarlo's stochastic objects, frozen at nominal, once per worker process,
+    # plus the factor distributions as given in the script. Importing the script only
+    # builds the rockets, the forecast download and the nominal ascent the stochastic
+    # flight is based on are the only other work
+    import NimbusMonteCarlo
+    from rocketpy.stochastic.stochastic_model import StochasticModel
+
+    stochastic_env, _, stochastic_flightAscent = NimbusMonteCarlo.stochastic_launch(
+        NimbusMonteCarlo.ensemble_environment()
+    )
+    model = SimpleNamespace(
+        **{name: value for name, value in vars(NimbusMonteCarlo).items() if isinstance(value, StochasticModel)},
+        stochastic_env=stochastic_env,
+        stochastic_flightAscent=stochastic_flightAscent,
+    )
+    specs = {
+        factor: [(target, attribute, getattr(getattr(model, target), attribute))
+                 for target, attribute in targets]
+        for factor, targets in PARAMETERS.items()
+    }
+    for stochastic_model in vars(model).values():
+        _freeze(stochastic_model)
+    # the descent's parachutes, at nominal like the rest (NimbusMonteCarlo attaches them per sample)
+    model.stochastic_parachutes = NimbusMonteCarlo.stochastic_parachutes
+    return model, specs
+
+
+def _evaluate(factors, row, seed):
+    # worker: ascent + descent with the factors at quantiles `row`, returns OUTPUTS
+    from rocketpy import Flight
+
+    model, specs = _worker_model()
+    for factor, u in zip(factors, row):
+        for target, attribute, spec in specs[factor]:
+            setattr(getattr(model, target), attribute, [spec_value(spec, u)])
+
+    # the parachute trigger noise is the only draw left, same for every sample
+    np.random.seed(seed)
+    try:
+        env = model.stochastic_env.create_object()
+        stochastic_flight = model.stochastic_flightAscent
+        ascent = Flight(
+            rocket=model.stochastic_Ascent.create_object(),
+            environment=env,
+            rail_length=stochastic_flight._randomize_rail_length(),
+            inclination=stochastic_flight._randomize_inclination(),
+            heading=stochastic_flight._randomize_heading(),
+            terminate_on_apogee=True,
+            name="Ascent",
+        )
+        descent_rocket = model.stochastic_Descent.create_object()
+        descent_rocket.parachutes = [parachute.create_object() for parachute in model.stochastic_parachutes]
+        descent = Flight(
+            rocket=descent_rocket,
+            environment=env,
+            rail_length=12,
+            inclination=0,
+            heading=0,
+            initial_solution=ascent,
+            name="Descent",
+        )
+    except Exception as error:  # a diverged sample shouldn't lose the whole batch
+        print(f"Sobol sample failed: {error}")
+        return np.full(len(OUTPUTS), np.nan)
+    x, y = descent.x_impact, descent.y_impact
+    return np.array([ascent.apogee - env.elevation, x, y, np.hypot(x, y)])
+
+
+def sobol_indices(f_A, f_B, f_AB):
+    # first order and total indices of every group, f_AB is (groups, N) (or with extra
+    # leading bootstrap axes on all three)
+    # (f_B centred, otherwise the mean apogee of ~3 km swamps the first order estimate)
+    both = np.concatenate([f_A, f_B], axis=-1)
+    variance = np.var(both, axis=-1, ddof=1)
+    f_B = f_B - np.mean(both, axis=-1, keepdims=True)
+    first = np.mean(f_B * (f_AB - f_A), axis=-1) / variance
+    total = 0.5 * np.mean((f_A - f_AB) ** 2, axis=-1) / variance
+    return first, total
+
+
+class SobolAnalysis:
+    # n_base: base sample size N, rounded up to a power of 2 for the Sobol sequence
+    # cache: .npz of flown samples, loaded if it exists and updated by run()
+    def __init__(self, groups=GROUPS, n_base=64, seed=0, max_workers=None, cache=None):
+        self.groups = groups
+        self.factors = list(PARAMETERS)
+        for group, factors in groups.items():
+            for factor in factors:
+                if factor not in PARAMETERS:
+                    raise ValueError(f"Unknown factor '{factor}' in group '{group}'")
+        self.n_base = 2 ** int(np.ceil(np.log2(n_base)))
+        self.seed = seed
+        self.max_workers = max_workers
+        self.cache = cache
+
+        # quantile rows already flown -> outputs
+        self.evaluations = {}
+        self.n_failed = 0
+        if cache is not None and os.path.exists(cache):
+            self.load(cache)
+
+    def sample(self):
+        # A, B (N, factors) and {group: AB} on a scrambled Sobol sequence, the first N rows
+        # of a bigger N are the same, so earlier flights are reused
+        d = len(self.factors)
+        sampler = qmc.Sobol(d=2 * d, scramble=True, seed=self.seed)
+        base = sampler.random_base2(int(np.log2(self.n_base)))
+        A, B = base[:, :d], base[:, d:]
+        AB = {}
+        for group, factors in self.groups.items():
+            columns = [self.factors.index(factor) for factor in factors]
+            AB[group] = A.copy()
+            AB[group][:, columns] = B[:, columns]
+        return A, B, AB
+
+    def _outputs(self, rows):
+        return np.array([self.evaluations[row.tobytes()] for row in rows])
+
+    def run(self):
+        # fly every sample not flown yet, in one parallel batch
+        A, B, AB = self.sample()
+        rows = {row.tobytes(): row for row in np.vstack([A, B, *AB.values()])}
+        missing = [row for key, row in rows.items() if key not in self.evaluations]
+        if missing:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                outputs = pool.map(
+                    _evaluate,
+                    [self.factors] * len(missing),
+                    missing,
+                    [self.seed] * len(missing),
+                    chunksize=max(1, len(missing) // (4 * (self.max_workers or os.cpu_count()))),
+                )
+                for row, output in zip(missing, outputs):
+                    self.evaluations[row.tobytes()] = output
+            if self.cache is not None:
+                self.save(self.cache)
+        return len(missing)
+
+    def indices(self, n_bootstrap=200, confidence=0.95):
+        # {output: {"first", "total", "first_ci", "total_ci"}}, arrays in group order
+        A, B, AB = self.sample()
+        f_A, f_B = self._outputs(A).T, self._outputs(B).T
+        f_AB = np.stack([self._outputs(rows).T for rows in AB.values()], axis=1)
+
+        # drop the base rows with a failed flight anywhere in them
+        valid = np.isfinite(f_A).all(0) & np.isfinite(f_B).all(0) & np.isfinite(f_AB).all((0, 1))
+        f_A, f_B, f_AB = f_A[:, valid], f_B[:, valid], f_AB[:, :, valid]
+        self.n_failed = int((~valid).sum())
+
+        rng = np.random.default_rng(self.seed)
+        resample = rng.integers(0, f_A.shape[-1], (n_bootstrap, f_A.shape[-1]))
+        tail = 100 * (1 - confidence) / 2
+
+        results = {}
+        for k, output in enumerate(OUTPUTS):
+            first, total = sobol_indices(f_A[k], f_B[k], f_AB[k])
+            boot_first, boot_total = sobol_indices(
+                f_A[k][resample][:, np.newaxis],
+                f_B[k][resample][:, np.newaxis],
+                f_AB[k][:, resample].transpose(1, 0, 2),
+            )
+            results[output] = {
+                "first": first,
+                "total": total,
+                "first_ci": np.percentile(boot_first, [tail, 100 - tail], axis=0).T,
+                "total_ci": np.percentile(boot_total, [tail, 100 - tail], axis=0).T,
+                "std": float(np.std(np.concatenate([f_A[k], f_B[k]]), ddof=1)),
+            }
+        return results
+
+    def print_indices(self, results=None):
+        results = self.indices() if results is None else results
+        print(f"Sobol indices, N = {self.n_base}, {len(self.evaluations)} flights"
+              + (f", {self.n_failed} failed base rows dropped" if self.n_failed else ""))
+        for output, result in results.items():
+            print(f"\n{output} (std {result['std']:.1f} m)")
+            print(f"  {'group':<22}{'first order':>22}{'total':>22}")
+            for i, group in enumerate(self.groups):
+                first_ci, total_ci = result["first_ci"][i], result["total_ci"][i]
+                print(
+                    f"  {group:<22}"
+                    f"{result['first'][i]:>8.3f} [{first_ci[0]:6.3f}, {first_ci[1]:6.3f}]"
+                    f"{result['total'][i]:>8.3f} [{total_ci[0]:6.3f}, {total_ci[1]:6.3f}]"
+                )
+
+    def save(self, path):
+        keys = list(self.evaluations)
+        np.savez(
+            path,
+            factors=np.array(self.factors),
+            rows=np.array([np.frombuffer(key) for key in keys]).reshape(-1, len(self.factors)),
+            outputs=np.array([self.evaluations[key] for key in keys]).reshape(-1, len(OUTPUTS)),
+        )
+        return path
+
+    def load(self, path):
+        # flown samples of the same factor list only
+        data = np.load(path)
+        if list(data["factors"]) != self.factors:
+            print(f"{path}: different factors, not reused")
+            return
+        for row, output in zip(data["rows"], data["outputs"]):
+            self.evaluations[row.tobytes()] = output
+
+    def plot(self, results=None, show=True):
+        results = self.indices() if results is None else results
+        fig, axes = plt.subplots(1, len(results), figsize=(4 * len(results), 4), sharey=True)
+        position = np.arange(len(self.groups))
+        for ax, (output, result) in zip(np.atleast_1d(axes), results.items()):
+            for offset, kind, label in ((-0.2, "first", "First order"), (0.2, "total", "Total")):
+                errors = np.abs(result[f"{kind}_ci"].T - result[kind])
+                ax.bar(position + offset, result[kind], 0.4, yerr=errors, capsize=3, label=label)
+            ax.set_xticks(position, list(self.groups), rotation=45, ha="right")
+            ax.set_title(output)
+        np.atleast_1d(axes)[0].set_ylabel("Sobol index")
+        np.atleast_1d(axes)[0].legend()
+        fig.tight_layout()
+        if show:
+            plt.show()
+        return fig
+
+
+if __name__ == "__main__":
+    import sys
+    import time as timer
+
+    # python RocketPy/Sensitivity.py [N], flown samples are kept in sobol_samples.npz
+    analysis = SobolAnalysis(
+        n_base=int(sys.argv[1]) if len(sys.argv) > 1 else 64, cache="sobol_samples.npz"
+    )
+    start = timer.perf_counter()
+    flown = analysis.run()
+    print(f"{flown} new flights in {timer.perf_counter() - start:.0f} s")
+    results = analysis.indices()
+    analysis.print_indices(results)
+    analysis.plot(results)
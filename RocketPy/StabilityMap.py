@@ -0,0 +1,271 @@
+# Static margin / stability maps precomputed over the burn
+# rocketpy evaluates the stability margin through the Rocket's Functions every time it is
+# asked for (Flight, all_info plots, and again for every variant in a sweep), while it only
+# depends on the centre of mass vs time (the three Thanos tanks draining over the 7 s burn)
+# and the centre of pressure vs Mach. StabilityMap tabulates both on a grid once per rocket
+# configuration, the margin at any (time, Mach) is then two np.interp calls:
+#   margin(t, M) = csys * (cm(t) - cp(M)) / (2 * radius)   (calibers, as rocketpy)
+# so constraint checks in sweeps and optimisation loops cost microseconds, vectorised.
+# stability_map(rocket) keeps one map per configuration (surfaces, positions, masses, motor
+# and tank contents), the MAX_MAPS most recently used.
+#
+# usage:
+#   stability = stability_map(Nimbus)
+#   stability.margin(t, mach)              # arrays in, array out
+#   stability.min_margin(mach_max=0.9)     # worst case over the burn
+#   stability.along_flight(Ascent)         # margin along a flown trajectory
+
+# imports
+import hashlib
+from collections import OrderedDict
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+MIN_STABILITY_MARGIN = 1.5  # calibers, EuRoC minimum at rail exit
+MAX_MAPS = 128  # configurations kept, least recently used dropped first
+
+# the curves each rocketpy tank type is defined by (the others are derived from them)
+TANK_CURVES = {
+    "MassFlowRateBasedTank": (
+        "liquid_mass_flow_rate_in", "gas_mass_flow_rate_in",
+        "liquid_mass_flow_rate_out", "gas_mass_flow_rate_out",
+    ),
+    "LevelBasedTank": ("liquid_height",),
+    "MassBasedTank": ("liquid_mass", "gas_mass"),
+    "UllageBasedTank": ("ullage",),
+}
+
+_maps = OrderedDict()  # configuration key -> StabilityMap, in order of use
+
+
+def _numbers(obj):
+    # the numeric attributes of an object, sorted by name
+    return tuple(
+        (name, float(value))
+        for name, value in sorted(vars(obj).items())
+        if isinstance(value, (int, float, np.floating)) and not isinstance(value, bool)
+    )
+
+
+def _curve(function):
+    # a rocketpy Function by content: digest of its data points, or the callable itself
+    # (held in the key, so it can't be collected and its id reused)
+    source = getattr(function, "source", function)
+    if isinstance(source, np.ndarray):
+        return hashlib.sha1(np.ascontiguousarray(source, dtype=float).tobytes()).hexdigest()
+    return source
+
+
+def _fluid(fluid):
+    return (fluid.name, float(fluid.density))
+
+
+def motor_key(motor):
+    # the motor by content: dry mass and its position, burn time, thrust curve and, for
+    # liquid/hybrid motors, every tank's geometry, fluids, fill masses, flow curves and position
+    tanks = []
+    for positioned in getattr(motor, "positioned_tanks", []):
+        tank = positioned["tank"]
+        tanks.append((
+            type(tank).__name__,
+            float(positioned["position"]),
+            _numbers(tank),
+            _fluid(tank.liquid),
+            _fluid(tank.gas),
+            _numbers(tank.geometry),
+            _curve(tank.geometry.radius),
+            tuple(_curve(getattr(tank, name)) for name in TANK_CURVES.get(type(tank).__name__, ())),
+        ))
+    return (type(motor).__name__, _numbers(motor), _curve(motor.thrust), tuple(tanks))
+
+
+def configuration_key(rocket):
+    # everything the margin depends on: rocket mass properties, motor contents, and the
+    # geometry and position of every aerodynamic surface
+    surfaces = []
+    for surface, position in rocket.aerodynamic_surfaces:
+        surfaces.append((type(surface).__name__, surface.name, float(position), _numbers(surface)))
+    return (
+        float(rocket.radius),
+        float(rocket.mass),
+        float(rocket.center_of_mass_without_motor),
+        rocket._csys,
+        motor_key(rocket.motor),
+        float(rocket.motor_position),
+        tuple(surfaces),
+    )
+
+
+class StabilityMap:
+    # time: grid over the burn (s), mach: grid of Mach numbers, past either end the values
+    # are held (the centre of mass doesn't move after burn out)
+    def __init__(self, rocket, time=None, mach=None, name=None):
+        burn_out = rocket.motor.burn_out_time
+        self.time = np.linspace(0, burn_out, 141) if time is None else np.asarray(time, float)
+        self.mach = np.linspace(0, 2, 81) if mach is None else np.asarray(mach, float)
+        self.name = name or "Rocket"
+        self.burn_out_time = burn_out
+        self.caliber = 2 * rocket.radius
+        self.csys = rocket._csys
+
+        # the only calls into the Rocket's Functions
+        self.cm = np.asarray(rocket.center_of_mass.get_value(self.time), dtype=float)
+        self.cp = np.asarray(rocket.cp_position.get_value(self.mach), dtype=float)
+        self.lift_coefficient_derivative = np.asarray(
+            rocket.total_lift_coeff_der.get_value(self.mach), dtype=float
+        )
+
+    @property
+    def margins(self):
+        # full (time, Mach) table in calibers
+        return self.csys * (self.cm[:, np.newaxis] - self.cp[np.newaxis, :]) / self.caliber
+
+    @property
+    def static_margins(self):
+        # vs time at Mach 0, as rocket.static_margin
+        return self.static_margin(self.time)
+
+    def center_of_mass(self, time):
+        return np.interp(time, self.time, self.cm)
+
+    def center_of_pressure(self, mach):
+        return np.interp(mach, self.mach, self.cp)
+
+    def margin(self, time, mach=0):
+        # stability margin (calibers) at any (time, Mach), broadcast like numpy
+        return self.csys * (self.center_of_mass(time) - self.center_of_pressure(mach)) / self.caliber
+
+    def static_margin(self, time):
+        return self.margin(time, 0)
+
+    def min_margin(self, t_start=0, t_end=None, mach_min=0, mach_max=None):
+        # worst margin over a time window and Mach range, and where it happens
+        t_end = self.burn_out_time if t_end is None else t_end
+        mach_max = self.mach[-1] if mach_max is None else mach_max
+        time = np.union1d(self.time[(self.time > t_start) & (self.time < t_end)], [t_start, t_end])
+        mach = np.union1d(self.mach[(self.mach > mach_min) & (self.mach < mach_max)], [mach_min, mach_max])
+        # separable: the worst margin pairs the worst time with the worst Mach
+        cm = self.csys * self.center_of_mass(time)
+        cp = self.csys * self.center_of_pressure(mach)
+        i, j = int(np.argmin(cm)), int(np.argmax(cp))
+        return {
+            "margin": float((cm[i] - cp[j]) / self.caliber),
+            "time": float(time[i]),
+            "mach": float(mach[j]),
+        }
+
+    def is_stable(self, time, mach=0, minimum=MIN_STABILITY_MARGIN, maximum=None):
+        # constraint check, True where the margin is within [minimum, maximum]
+        margin = self.margin(time, mach)
+        stable = margin >= minimum
+        if maximum is not None:
+            stable &= margin <= maximum
+        return stable
+
+    def constraint(self, time, mach=0, minimum=MIN_STABILITY_MARGIN):
+        # >= 0 when satisfied, for scipy.optimize inequality constraints
+        return self.margin(time, mach) - minimum
+
+    def along_flight(self, flight):
+        # margin along a flown trajectory (time, margin), from the flight's Mach number
+        time = flight.time
+        mach = flight.mach_number.get_value(time)
+        return time, self.margin(time, mach)
+
+    def save(self, path):
+        np.savez(
+            path,
+            time=self.time,
+            mach=self.mach,
+            cm=self.cm,
+            cp=self.cp,
+            lift_coefficient_derivative=self.lift_coefficient_derivative,
+            constants=np.array([self.burn_out_time, self.caliber, self.csys]),
+            name=self.name,
+        )
+        return path
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        stability = cls.__new__(cls)
+        stability.time, stability.mach = data["time"], data["mach"]
+        stability.cm, stability.cp = data["cm"], data["cp"]
+        stability.lift_coefficient_derivative = data["lift_coefficient_derivative"]
+        stability.burn_out_time, stability.caliber, csys = data["constants"]
+        stability.csys = int(csys)
+        stability.name = str(data["name"])
+        return stability
+
+    def plot(self, minimum=MIN_STABILITY_MARGIN, show=True):
+        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(11, 4))
+        mesh = ax1.pcolormesh(self.time, self.mach, self.margins.T, shading="auto", cmap="viridis")
+        plt.colorbar(mesh, ax=ax1, label="Stability margin (c)")
+        ax1.contour(self.time, self.mach, self.margins.T, levels=[minimum], colors="r")
+        ax1.set_xlabel("Time (s)")
+        ax1.set_ylabel("Mach number")
+        ax1.set_title(f"{self.name} stability margin")
+
+        ax2.plot(self.time, self.static_margins, label="Static margin (Mach 0)")
+        ax2.plot(self.time, self.margin(self.time, self.mach[-1]), label=f"Mach {self.mach[-1]:.1f}")
+        ax2.axhline(minimum, color="r", ls="--", label=f"{minimum} c")
+        ax2.set_xlabel("Time (s)")
+        ax2.set_ylabel("Stability margin (c)")
+        ax2.legend()
+        fig.tight_layout()
+        if show:
+            plt.show()
+        return fig
+
+
+def stability_map(rocket, time=None, mach=None, name=None):
+    # one StabilityMap per rocket configuration (and grid), built on first use
+    key = (
+        configuration_key(rocket),
+        None if time is None else tuple(np.asarray(time, float)),
+        None if mach is None else tuple(np.asarray(mach, float)),
+    )
+    if key in _maps:
+        _maps.move_to_end(key)
+        return _maps[key]
+    _maps[key] = StabilityMap(rocket, time, mach, name)
+    if len(_maps) > MAX_MAPS:
+        _maps.popitem(last=False)
+    return _maps[key]
+
+
+if __name__ == "__main__":
+    import time as timer
+
+    from rocketpy import Environment, Flight
+
+    from Nimbus import Nimbus
+
+    start = timer.perf_counter()
+    stability = stability_map(Nimbus, name="Nimbus")
+    print(f"map built in {timer.perf_counter() - start:.3f} s")
+    print(f"cached: {stability_map(Nimbus) is stability}")
+
+    # a sweep style constraint check, a million (time, Mach) points
+    rng = np.random.default_rng(0)
+    time, mach = rng.uniform(0, 7, 1_000_000), rng.uniform(0, 1, 1_000_000)
+    start = timer.perf_counter()
+    stable = stability.is_stable(time, mach)
+    print(f"{len(time)} lookups in {timer.perf_counter() - start:.3f} s, {stable.mean():.1%} stable")
+
+    start = timer.perf_counter()
+    reference = [Nimbus.stability_margin.get_value_opt(m, t) for m, t in zip(mach[:10_000], time[:10_000])]
+    print(f"10000 rocket.stability_margin calls in {timer.perf_counter() - start:.3f} s, "
+          f"max difference {np.max(np.abs(stability.margin(time[:10_000], mach[:10_000]) - reference)):.1e} c")
+    print("worst over the burn below Mach 1:", stability.min_margin(mach_max=1))
+
+    env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+    env.set_atmospheric_model(type="custom_atmosphere", wind_u=2, wind_v=3)
+    Ascent = Flight(rocket=Nimbus, environment=env, rail_length=12, inclination=86, heading=0,
+                    terminate_on_apogee=True, name="Ascent")
+    time, margin = stability.along_flight(Ascent)
+    print(f"along the ascent: min {margin.min():.3f} c (rocketpy {Ascent.min_stability_margin:.3f} c), "
+          f"out of rail {np.interp(Ascent.out_of_rail_time, time, margin):.3f} c "
+          f"(rocketpy {Ascent.out_of_rail_stability_margin:.3f} c)")
+    stability.plot()
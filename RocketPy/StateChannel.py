@@ -0,0 +1,166 @@
+# Shared memory handoff of an ascent to descent workers
+# Descent flights start from the ascent, either from the Flight itself
+# (initial_solution=Ascent) or from its state at apogee (NimbusMonteCarlo's
+# final_state_vectorA). A Flight can't even be sent to worker processes with the standard
+# pickler (its Functions hold local closures), and with dill every task would carry the
+# whole object (solution, rocket, environment, cached Functions).
+# Here the apogee state, and optionally the decimated ascent trajectory, are written once
+# into a shared memory block. Workers only receive a small handle (block name + layout) and
+# map the arrays straight out of the block, nothing else is copied or pickled per task.
+#
+# usage:
+#   with publish_ascent(Ascent, trajectory=True) as channel:
+#       pool.map(run_descent, [channel.handle] * n)
+#   # in the worker
+#   with channel_handle.attach() as ascent:
+#       Flight(..., initial_solution=ascent.initial_solution)
+
+# imports
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from TrajectoryStore import STATE_COLUMNS, CompactTrajectory
+
+STATE_SIZE = 1 + len(STATE_COLUMNS)  # time + 13 states, as rocketpy's initial_solution
+
+
+class ChannelHandle:
+    # picklable description of a published ascent, this is what gets sent to the workers
+    def __init__(self, block_name, n_points=0, dtype="float64", name=""):
+        self.block_name = block_name
+        self.n_points = n_points
+        self.dtype = np.dtype(dtype).str
+        self.name = name
+
+    def layout(self):
+        # byte offsets of the apogee state, trajectory time and trajectory states
+        state_end = STATE_SIZE * 8
+        time_end = state_end + self.n_points * 8
+        states_end = time_end + self.n_points * len(STATE_COLUMNS) * np.dtype(self.dtype).itemsize
+        return state_end, time_end, states_end
+
+    def attach(self):
+        return SharedAscent(self, shared_memory.SharedMemory(name=self.block_name))
+
+    def __repr__(self):
+        return f"ChannelHandle('{self.block_name}', {self.n_points} points, {self.dtype})"
+
+
+class SharedAscent:
+    # read only numpy views into the shared block, valid until close()
+    def __init__(self, handle, block, owner=False):
+        self.handle = handle
+        self.block = block
+        self.owner = owner
+        state_end, time_end, states_end = handle.layout()
+        buffer = block.buf
+        self.state = np.frombuffer(buffer, np.float64, STATE_SIZE, 0)
+        self.time = np.frombuffer(buffer, np.float64, handle.n_points, state_end)
+        self.states = np.frombuffer(
+            buffer, handle.dtype, handle.n_points * len(STATE_COLUMNS), time_end
+        ).reshape(handle.n_points, len(STATE_COLUMNS))
+        if not owner:
+            for array in (self.state, self.time, self.states):
+                array.flags.writeable = False
+
+    @property
+    def initial_solution(self):
+        # [t, x, y, z, vx, vy, vz, e0, e1, e2, e3, w1, w2, w3] for Flight(initial_solution=...)
+        return self.state.tolist()
+
+    @property
+    def trajectory(self):
+        # a copy, so it outlives the block (close() fails while views into it are held)
+        return CompactTrajectory(self.time.copy(), self.states.copy(), name=self.handle.name)
+
+    def close(self):
+        # drop the views before closing, the block can't be closed while they're alive
+        self.state = self.time = self.states = None
+        self.block.close()
+        if self.owner:
+            self.block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def publish_ascent(flight, time=None, trajectory=False, dtype=np.float64, **decimation):
+    # state at `time` (default apogee), plus the ascent trajectory if asked for
+    # (decimation keywords as CompactTrajectory.from_flight, e.g. max_points=200)
+    time = flight.apogee_time if time is None else time
+    state = np.asarray(flight.get_solution_at_time(time), dtype=np.float64)
+
+    compact = None
+    if trajectory:
+        compact = CompactTrajectory.from_flight(flight, dtype=dtype, **decimation)
+    handle = ChannelHandle(
+        block_name="",
+        n_points=len(compact) if compact is not None else 0,
+        dtype=dtype,
+        name=flight.name,
+    )
+    block = shared_memory.SharedMemory(create=True, size=handle.layout()[-1])
+    handle.block_name = block.name
+
+    channel = SharedAscent(handle, block, owner=True)
+    channel.state[:] = state
+    if compact is not None:
+        channel.time[:] = compact.time
+        channel.states[:] = compact.states
+    return channel
+
+
+def _demo_environment(wind_v):
+    from rocketpy import Environment
+
+    env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+    env.set_atmospheric_model(type="custom_atmosphere", wind_u=0, wind_v=wind_v)
+    return env
+
+
+def _demo_descent(handle, wind_v):
+    # worker of the demo below, module level so it also works with spawned processes
+    from rocketpy import Flight
+
+    from Nimbus import NimbusDescent
+
+    with handle.attach() as ascent:
+        initial_solution = ascent.initial_solution
+    descent = Flight(
+        rocket=NimbusDescent, environment=_demo_environment(wind_v), rail_length=12,
+        inclination=0, heading=0, initial_solution=initial_solution, name="Descent",
+    )
+    return descent.x_impact, descent.y_impact
+
+
+if __name__ == "__main__":
+    import pickle
+    import time as timer
+    from concurrent.futures import ProcessPoolExecutor
+
+    from rocketpy import Flight
+
+    from Nimbus import Nimbus
+
+    Ascent = Flight(
+        rocket=Nimbus, environment=_demo_environment(3), rail_length=12, inclination=86,
+        heading=0, terminate_on_apogee=True, name="Ascent",
+    )
+
+    with publish_ascent(Ascent, trajectory=True, max_points=200) as channel:
+        print(f"pickled handle: {len(pickle.dumps(channel.handle))} B, {channel.handle}")
+
+        # descents under increasing wind, each worker maps the apogee state
+        wind_speeds = np.linspace(0, 8.9, 8)
+        start = timer.perf_counter()
+        with ProcessPoolExecutor() as pool:
+            landings = list(
+                pool.map(_demo_descent, [channel.handle] * len(wind_speeds), wind_speeds)
+            )
+        print(f"{len(wind_speeds)} descents in {timer.perf_counter() - start:.1f} s")
+        for wind_v, (x, y) in zip(wind_speeds, landings):
+            print(f"wind_v {wind_v:.1f} m/s: landing x {x:.0f} m, y {y:.0f} m")
@@ -0,0 +1,261 @@
+# Stochastic counterpart of the LiquidMotor built in Thanos.py
+# rocketpy only ships stochastic Solid/Generic motors, so without this the Monte Carlo
+# script had to approximate Thanos_R with a GenericMotor.
+# The tank geometries (CylindricalTank) and the discretised flow rate curves are built
+# once from the nominal motor and shared by every sample, only the scalar inputs
+# (fill masses, flow rate scaling, dry mass, ...) are redrawn per sample.
+
+# imports
+from random import choice
+
+from rocketpy import LiquidMotor, MassFlowRateBasedTank
+from rocketpy.mathutils.function import funcify_method
+from rocketpy.stochastic.stochastic_motor_model import StochasticMotorModel
+from rocketpy.stochastic.stochastic_model import StochasticModel
+
+
+class _ScaledMassFlowRateBasedTank(MassFlowRateBasedTank):
+    # tank whose flow rates are the nominal ones times `scale`: the fluid masses are the
+    # nominal integrated flows rescaled, instead of integrating the flows again per sample
+    def __init__(self, nominal_tank, nominal_flows, scale, initial_liquid_mass, initial_gas_mass):
+        self._nominal_flows = nominal_flows
+        self._scale = scale
+        super().__init__(
+            name=nominal_tank.name,
+            geometry=nominal_tank.geometry,
+            flux_time=nominal_tank.flux_time,
+            liquid=nominal_tank.liquid,
+            gas=nominal_tank.gas,
+            initial_liquid_mass=initial_liquid_mass,
+            initial_gas_mass=initial_gas_mass,
+            liquid_mass_flow_rate_in=nominal_tank.liquid_mass_flow_rate_in * scale,
+            gas_mass_flow_rate_in=nominal_tank.gas_mass_flow_rate_in * scale,
+            liquid_mass_flow_rate_out=nominal_tank.liquid_mass_flow_rate_out * scale,
+            gas_mass_flow_rate_out=nominal_tank.gas_mass_flow_rate_out * scale,
+            discretize=None,  # flows were already discretised by the nominal tank
+        )
+
+    @funcify_method("Time (s)", "Mass (kg)")
+    def liquid_mass(self):
+        liquid_mass = self.initial_liquid_mass + self._scale * self._nominal_flows["liquid"]
+        if (liquid_mass < 0).any():
+            raise ValueError(
+                f"The tank {self.name} is underfilled. "
+                "The liquid mass is negative given the mass flow rates."
+            )
+        return liquid_mass
+
+    @funcify_method("Time (s)", "Mass (kg)")
+    def gas_mass(self):
+        gas_mass = self.initial_gas_mass + self._scale * self._nominal_flows["gas"]
+        if (gas_mass < -1e-6).any():
+            raise ValueError(
+                f"The tank {self.name} is underfilled. "
+                "The gas mass is negative given the mass flow rates."
+            )
+        return gas_mass
+
+
+class StochasticMassFlowRateBasedTank(StochasticModel):
+    # initial_liquid_mass / initial_gas_mass: usual stochastic inputs (std, tuple or list)
+    # liquid_mass_flow_rate_out_factor: multiplies the flow rates of the tank (the
+    #     pressurant/ullage inflow follows the outflow), on top of the scaling that keeps
+    #     the tank draining over the same flux time when the fill mass changes
+    def __init__(
+        self,
+        tank,
+        initial_liquid_mass=None,
+        initial_gas_mass=None,
+        liquid_mass_flow_rate_out_factor=(1, 0),
+    ):
+        if not isinstance(tank, MassFlowRateBasedTank):
+            raise TypeError("`tank` must be a MassFlowRateBasedTank")
+
+        # warm up the geometry caches once, every sampled tank reuses the same geometry
+        tank.geometry.inverse_volume
+        tank.geometry.total_volume
+
+        # integrated net flows of the nominal tank, shared by every sample
+        self._nominal_flows = {
+            "liquid": tank.liquid_mass - tank.initial_liquid_mass,
+            "gas": tank.gas_mass - tank.initial_gas_mass,
+        }
+
+        # liquid that leaves the nominal tank over the flux time, used to cap the flow
+        # scaling so a sample never drains more than it was filled with
+        self._nominal_liquid_drained = -self._nominal_flows["liquid"].y_array[-1]
+
+        super().__init__(
+            tank,
+            initial_liquid_mass=initial_liquid_mass,
+            initial_gas_mass=initial_gas_mass,
+            liquid_mass_flow_rate_out_factor=liquid_mass_flow_rate_out_factor,
+        )
+
+    def create_object(self):
+        generated_dict = next(self.dict_generator())
+        tank = self.object
+
+        # scale the flows with the fill so the tank still empties at the nominal burn out
+        if tank.initial_liquid_mass > 0:
+            fill_ratio = generated_dict["initial_liquid_mass"] / tank.initial_liquid_mass
+        else:
+            fill_ratio = 1
+        scale = fill_ratio * generated_dict["liquid_mass_flow_rate_out_factor"]
+        if self._nominal_liquid_drained > 0:
+            max_scale = (
+                generated_dict["initial_liquid_mass"]
+                * (1 - 1e-9)
+                / self._nominal_liquid_drained
+            )
+            scale = min(scale, max_scale)
+
+        return _ScaledMassFlowRateBasedTank(
+            nominal_tank=tank,
+            nominal_flows=self._nominal_flows,
+            scale=scale,
+            initial_liquid_mass=generated_dict["initial_liquid_mass"],
+            initial_gas_mass=generated_dict["initial_gas_mass"],
+        )
+
+
+class StochasticLiquidMotor(StochasticMotorModel):
+    # same inputs as rocketpy's StochasticGenericMotor where they exist on a LiquidMotor,
+    # tanks are perturbed through add_tank
+    def __init__(
+        self,
+        liquid_motor,
+        thrust_source=None,
+        total_impulse=None,
+        burn_start_time=None,
+        burn_out_time=None,
+        dry_mass=None,
+        dry_inertia_11=None,
+        dry_inertia_22=None,
+        dry_inertia_33=None,
+        dry_inertia_12=None,
+        dry_inertia_13=None,
+        dry_inertia_23=None,
+        nozzle_radius=None,
+        nozzle_position=None,
+        center_of_dry_mass_position=None,
+    ):
+        if not isinstance(liquid_motor, LiquidMotor):
+            raise TypeError("`liquid_motor` must be a LiquidMotor")
+
+        super().__init__(
+            liquid_motor,
+            thrust_source=thrust_source,
+            total_impulse=total_impulse,
+            burn_start_time=burn_start_time,
+            burn_out_time=burn_out_time,
+            dry_mass=dry_mass,
+            dry_I_11=dry_inertia_11,
+            dry_I_22=dry_inertia_22,
+            dry_I_33=dry_inertia_33,
+            dry_I_12=dry_inertia_12,
+            dry_I_13=dry_inertia_13,
+            dry_I_23=dry_inertia_23,
+            nozzle_radius=nozzle_radius,
+            nozzle_position=nozzle_position,
+            center_of_dry_mass_position=center_of_dry_mass_position,
+            interpolate=None,
+            coordinate_system_orientation=None,
+        )
+
+        # start from the nominal tanks, add_tank swaps in perturbed ones
+        # (kept in a dict keyed by tank name, dict_generator would draw from a list)
+        self.positioned_tanks = {
+            positioned_tank["tank"].name: {
+                "tank": StochasticMassFlowRateBasedTank(positioned_tank["tank"]),
+                "position": [positioned_tank["position"]],
+            }
+            for positioned_tank in liquid_motor.positioned_tanks
+        }
+
+    def add_tank(self, tank, position=None):
+        # tank must be one of the tanks of the nominal motor (or a stochastic wrapper of one)
+        if isinstance(tank, MassFlowRateBasedTank):
+            tank = StochasticMassFlowRateBasedTank(tank)
+        if not isinstance(tank, StochasticMassFlowRateBasedTank):
+            raise TypeError(
+                "`tank` must be a MassFlowRateBasedTank or StochasticMassFlowRateBasedTank"
+            )
+
+        positioned_tank = self.positioned_tanks.get(tank.object.name)
+        if positioned_tank is None or positioned_tank["tank"].object is not tank.object:
+            raise ValueError(
+                f"Tank '{tank.object.name}' is not part of the nominal liquid motor"
+            )
+
+        nominal_position = positioned_tank["position"][0]
+        get_position = lambda *_: nominal_position
+        if isinstance(position, tuple):
+            position = self._validate_tuple("position", position, getattr=get_position)
+        elif isinstance(position, (int, float)):
+            position = self._validate_scalar("position", position, getattr=get_position)
+        elif isinstance(position, list):
+            position = self._validate_list("position", position, getattr=get_position)
+        elif position is None:
+            position = [nominal_position]
+        else:
+            raise AssertionError("`position` must be a tuple, list, int, or float")
+
+        positioned_tank["tank"] = tank
+        positioned_tank["position"] = position
+
+    def _randomize_position(self, position):
+        if isinstance(position, tuple):
+            return position[-1](position[0], position[1])
+        return choice(position)
+
+    def dict_generator(self):
+        generated_dict = next(super().dict_generator())
+        generated_dict["tanks"] = []
+        self.last_rnd_dict = generated_dict
+        yield generated_dict
+
+    def create_object(self):
+        generated_dict = next(self.dict_generator())
+
+        # only resample the thrust curve when the burn or impulse were actually perturbed
+        burn_time = (generated_dict["burn_start_time"], generated_dict["burn_out_time"])
+        if burn_time == self.object.burn_time and (
+            generated_dict["total_impulse"] == self.object.total_impulse
+        ):
+            reshape_thrust_curve = False
+        else:
+            reshape_thrust_curve = (burn_time, generated_dict["total_impulse"])
+
+        motor = LiquidMotor(
+            thrust_source=generated_dict["thrust_source"],
+            dry_mass=generated_dict["dry_mass"],
+            dry_inertia=(
+                generated_dict["dry_I_11"],
+                generated_dict["dry_I_22"],
+                generated_dict["dry_I_33"],
+                generated_dict["dry_I_12"],
+                generated_dict["dry_I_13"],
+                generated_dict["dry_I_23"],
+            ),
+            nozzle_radius=generated_dict["nozzle_radius"],
+            center_of_dry_mass_position=generated_dict["center_of_dry_mass_position"],
+            nozzle_position=generated_dict["nozzle_position"],
+            burn_time=burn_time,
+            reshape_thrust_curve=reshape_thrust_curve,
+            interpolation_method=generated_dict["interpolate"],
+            coordinate_system_orientation=generated_dict[
+                "coordinate_system_orientation"
+            ],
+        )
+
+        for positioned_tank in self.positioned_tanks.values():
+            stochastic_tank = positioned_tank["tank"]
+            tank = stochastic_tank.create_object()
+            position_rnd = self._randomize_position(positioned_tank["position"])
+            motor.add_tank(tank=tank, position=position_rnd)
+            self.last_rnd_dict["tanks"].append(
+                dict(stochastic_tank.last_rnd_dict, name=tank.name, position=position_rnd)
+            )
+
+        return motor
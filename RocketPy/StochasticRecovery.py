@@ -0,0 +1,174 @@
+# Stochastic drogue and main parachutes for the Monte Carlo
+# NimbusMonteCarlo added the parachutes to stochastic_Descent as they are, so cd_s, lag and
+# the main deployment altitude were the same in every sample and the landing dispersion
+# came from the ascent and the winds only. StochasticRecoveryParachute is rocketpy's
+# StochasticParachute (cd_s, lag, sampling_rate, noise given the usual way) plus
+# trigger_altitude, the main's deployment altitude above the pad (a numeric Parachute
+# trigger, on the way down). Its samples are drawn in blocks with numpy instead of one
+# rocketpy dict_generator call per sample, create_object hands them out one by one so it
+# plugs into StochasticRocket / MonteCarlo unchanged. Without a seed the generator is
+# seeded from numpy's global state at the first draw, so np.random.seed in a script makes
+# the parachute draws reproducible along with rocketpy's.
+# RecoveryCampaign draws a whole campaign of every parachute at once (seeded), and
+# attaches the samples to rockets that are already built:
+#  - parachute_sets() per sample lists of Parachutes for BatchFlight's `parachutes`,
+#  - variants() per sample RecoveryForks variants, for RecoverySweep / fork_flight descents
+#    from one apogee snapshot,
+#  - attach(rocket, i) swaps a rocket's parachutes for sample i's (returns the old ones).
+#
+# usage:
+#   stochastic_main = StochasticRecoveryParachute(main, cd_s=(29.128, 1.5), lag=(0, 0.6, "uniform"),
+#                                                 trigger_altitude=(450, 15))
+#   stochastic_Descent.add_parachute(stochastic_main)                  # rocketpy MonteCarlo
+#   campaign = RecoveryCampaign([stochastic_main, stochastic_drogue], 1000, seed=0)
+#   BatchFlight([Nimbus] * 1000, env, descent_rockets=[NimbusDescent] * 1000,
+#               parachutes=campaign.parachute_sets())
+
+# imports
+import numpy as np
+from rocketpy.rocket import Parachute
+from rocketpy.stochastic import StochasticParachute
+
+BLOCK_SIZE = 1000  # samples drawn at a time for create_object
+PARACHUTE_ARGUMENTS = ("name", "cd_s", "trigger", "sampling_rate", "lag", "noise")
+
+
+def _generator(seed=None):
+    # numpy Generator, seeded from the global np.random state when no seed is given
+    return np.random.default_rng(np.random.randint(2**32, dtype=np.int64) if seed is None else seed)
+
+
+class StochasticRecoveryParachute(StochasticParachute):
+    # trigger_altitude: (mean, std) or (mean, std, "distribution") of the deployment
+    # altitude in m above the pad, replaces the parachute's trigger, None keeps it
+    def __init__(self, parachute, cd_s=None, trigger=None, sampling_rate=None, lag=None, noise=None,
+                 trigger_altitude=None, block_size=BLOCK_SIZE, seed=None):
+        super().__init__(parachute, cd_s=cd_s, trigger=trigger, sampling_rate=sampling_rate, lag=lag, noise=noise)
+        self._trigger_altitude = None
+        if trigger_altitude is not None:
+            self._trigger_altitude = self._validate_tuple("trigger_altitude", tuple(trigger_altitude))
+        self._block_size = block_size
+        self._seed, self._rng = seed, None  # generator made at the first draw
+        self._block, self._next = None, 0
+
+    def _arguments(self):
+        # the randomised Parachute arguments, (name, value) as dict_generator sees them
+        arguments = [(name, getattr(self, name)) for name in PARACHUTE_ARGUMENTS]
+        if self._trigger_altitude is not None:
+            arguments[PARACHUTE_ARGUMENTS.index("trigger")] = ("trigger", self._trigger_altitude)
+        return arguments
+
+    def draw(self, n, rng=None):
+        # n samples of every argument at once, {argument: array or list}
+        if rng is None:
+            if self._rng is None:
+                self._rng = _generator(self._seed)
+            rng = self._rng
+        draws = {}
+        for name, value in self._arguments():
+            if isinstance(value, tuple):
+                # the tuple's distribution, from the seeded generator
+                draws[name] = getattr(rng, value[-1].__name__)(value[0], value[1], size=n)
+            elif isinstance(value, list):
+                picks = rng.integers(len(value), size=n) if len(value) > 1 else np.zeros(n, dtype=int)
+                draws[name] = [value[pick] for pick in picks]
+        # no negative lags or drag areas from normal tails
+        draws["lag"] = np.maximum(np.asarray(draws["lag"], dtype=float), 0)
+        draws["cd_s"] = np.maximum(np.asarray(draws["cd_s"], dtype=float), 1e-6)
+        return draws
+
+    def sample(self, draws, i):
+        # Parachute arguments of sample i of a draw
+        return {
+            name: (value[i].item() if isinstance(value, np.ndarray) else value[i])
+            for name, value in draws.items()
+        }
+
+    def create_object(self):
+        # the next sample of the current block, a new block when it runs out
+        if self._block is None or self._next >= self._block_size:
+            self._block, self._next = self.draw(self._block_size), 0
+        arguments = self.sample(self._block, self._next)
+        self._next += 1
+        self.last_rnd_dict = arguments
+        return Parachute(**arguments)
+
+
+class RecoveryCampaign:
+    # n samples of each stochastic parachute (StochasticRecoveryParachute), in the order
+    # they are given (the order the rocket's parachutes are checked in)
+    def __init__(self, stochastic_parachutes, n, seed=None):
+        rng = _generator(seed)
+        self.n = n
+        self.stochastic_parachutes = list(stochastic_parachutes)
+        self.draws = [parachute.draw(n, rng) for parachute in self.stochastic_parachutes]
+        self.names = [parachute.parachute.name for parachute in self.stochastic_parachutes]
+
+    def arguments(self, i):
+        return [parachute.sample(draws, i) for parachute, draws in zip(self.stochastic_parachutes, self.draws)]
+
+    def parachutes(self, i):
+        return [Parachute(**arguments) for arguments in self.arguments(i)]
+
+    def parachute_sets(self):
+        return [self.parachutes(i) for i in range(self.n)]
+
+    def variants(self, parameters=("cd_s", "lag", "trigger")):
+        # RecoveryForks variants, {name: {parameter: value}} per sample
+        return [
+            {arguments["name"]: {parameter: arguments[parameter] for parameter in parameters}
+             for arguments in self.arguments(i)}
+            for i in range(self.n)
+        ]
+
+    def attach(self, rocket, i):
+        # sample i's parachutes on an existing rocket, returns the ones it had
+        parachutes, rocket.parachutes = rocket.parachutes, self.parachutes(i)
+        return parachutes
+
+    def summary(self):
+        for name, draws in zip(self.names, self.draws):
+            for parameter in ("cd_s", "lag", "trigger"):
+                values = draws[parameter]
+                if isinstance(values, np.ndarray):
+                    print(f"{name:>8} {parameter:<8} {np.mean(values):10.4g} +- {np.std(values):.3g}")
+
+
+if __name__ == "__main__":
+    import time as timer
+
+    from rocketpy import Environment
+
+    from BatchFlight import BatchFlight
+    from Nimbus import Nimbus, NimbusDescent
+
+    env = Environment(latitude=39.4751, longitude=-8.3764, elevation=78)
+    env.set_atmospheric_model(type="custom_atmosphere", wind_u=2, wind_v=3)
+
+    # NimbusDescent's parachutes, in its order (main checked first)
+    main, drogue = NimbusDescent.parachutes
+    stochastic_main = StochasticRecoveryParachute(main, cd_s=(29.128, 1.5), lag=(7, 0.5), trigger_altitude=(500, 15))
+    stochastic_drogue = StochasticRecoveryParachute(drogue, cd_s=(0.3936, 0.03), lag=(0, 0.4, "uniform"))
+
+    n = 300
+    start = timer.perf_counter()
+    campaign = RecoveryCampaign([stochastic_main, stochastic_drogue], n, seed=0)
+    parachute_sets = campaign.parachute_sets()
+    print(f"{n} recovery samples drawn and built in {(timer.perf_counter() - start) * 1000:.0f} ms")
+    campaign.summary()
+
+    rng = np.random.default_rng(0)
+    inclination, heading = rng.normal(86, 1, n), rng.normal(0, 2, n)
+    for label, parachutes in (("fixed recovery", None), ("stochastic recovery", parachute_sets)):
+        start = timer.perf_counter()
+        results = BatchFlight([Nimbus] * n, env, inclination=inclination, heading=heading,
+                              descent_rockets=[NimbusDescent] * n, parachutes=parachutes, seed=0).run()
+        print(f"{label}: {n} flights in {timer.perf_counter() - start:.1f} s, landing spread "
+              f"{np.std(results['x_impact']):.0f} x {np.std(results['y_impact']):.0f} m, "
+              f"impact velocity {np.mean(results['impact_velocity']):.2f} +- {np.std(results['impact_velocity']):.2f} m/s")
+
+    # create_object for rocketpy's MonteCarlo, blocks of draws handed out one by one
+    start = timer.perf_counter()
+    samples = [stochastic_main.create_object() for _ in range(2000)]
+    print(f"2000 create_object calls in {(timer.perf_counter() - start) * 1000:.0f} ms, "
+          f"last {stochastic_main.last_rnd_dict}")
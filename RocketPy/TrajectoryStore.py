@@ -0,0 +1,228 @@
+# Compact storage of flight trajectories
+# A Flight keeps every solver step of the 13 element state as a list of Python lists, e.g. a
+# NimbusDescent under main from apogee (max_time=1e4) is thousands of rows of boxed floats,
+# and pickling/exporting thousands of them for a Monte Carlo campaign is slow and large.
+# CompactTrajectory keeps a decimated copy in one contiguous array (float32 or float64),
+# TrajectoryStore packs many of them into a single buffer with offsets, and both save to
+# a plain (uncompressed, no pickle) .npz that loads back without rocketpy.
+#
+# decimation:
+#   CompactTrajectory.from_flight(flight, dt=0.5)          # fixed time step
+#   CompactTrajectory.from_flight(flight, max_points=200)  # events + downsampled solver steps
+
+# imports
+import numpy as np
+
+STATE_COLUMNS = ("x", "y", "z", "vx", "vy", "vz", "e0", "e1", "e2", "e3", "w1", "w2", "w3")
+
+
+def flight_events(flight):
+    # times of the events of a flight that fall inside its solution, by name
+    solution_start, solution_end = flight.solution[0][0], flight.solution[-1][0]
+    events = {
+        "start": solution_start,
+        "out_of_rail": flight.out_of_rail_time,
+        "burn_out": flight.rocket.motor.burn_out_time,
+        "apogee": flight.apogee_time,
+    }
+    for i, (time, parachute) in enumerate(flight.parachute_events):
+        events[f"{parachute.name}_{i}"] = time
+    events["end"] = solution_end
+    return {
+        name: float(time)
+        for name, time in events.items()
+        if solution_start <= time <= solution_end
+    }
+
+
+def interpolate_states(solution_time, solution_states, time):
+    # linear interpolation of every state column at once
+    if len(solution_time) < 2:
+        # a single state, held at every time
+        return np.repeat(np.asarray(solution_states, dtype=float)[:1], len(time), axis=0)
+    index = np.clip(np.searchsorted(solution_time, time, side="right") - 1, 0, len(solution_time) - 2)
+    t0, t1 = solution_time[index], solution_time[index + 1]
+    weight = np.where(t1 > t0, (time - t0) / np.where(t1 > t0, t1 - t0, 1), 0)[:, np.newaxis]
+    states = solution_states[index] * (1 - weight) + solution_states[index + 1] * weight
+    # keep the attitude quaternions unit length after blending
+    states[:, 6:10] /= np.linalg.norm(states[:, 6:10], axis=1, keepdims=True)
+    return states
+
+
+class CompactTrajectory:
+    # time (float64, n) and states (dtype, n x 13) of one flight, events by name
+    def __init__(self, time, states, events=None, name=""):
+        self.time = np.ascontiguousarray(time, dtype=np.float64)
+        self.states = np.ascontiguousarray(states)
+        self.events = events or {}
+        self.name = name
+
+    @classmethod
+    def from_flight(cls, flight, dt=None, max_points=None, dtype=np.float32):
+        # dt: resample on a fixed time step (the events are not inserted)
+        # max_points: keep the solver steps at the events and about max_points others
+        # neither: keep every solver step, only the storage changes
+        solution = np.asarray(flight.solution, dtype=np.float64)
+        solution_time, solution_states = solution[:, 0], solution[:, 1:]
+        events = flight_events(flight)
+
+        if dt is not None:
+            time = np.arange(solution_time[0], solution_time[-1], dt)
+            time = np.append(time, solution_time[-1])
+            states = interpolate_states(solution_time, solution_states, time)
+        elif max_points is not None and len(solution_time) > max_points:
+            keep = np.zeros(len(solution_time), dtype=bool)
+            keep[:: int(np.ceil(len(solution_time) / max_points))] = True
+            keep[-1] = True
+            # the solver step at (or just after) each event
+            event_index = np.searchsorted(solution_time, list(events.values()))
+            keep[np.clip(event_index, 0, len(solution_time) - 1)] = True
+            time, states = solution_time[keep], solution_states[keep]
+        else:
+            time, states = solution_time, solution_states
+
+        return cls(time, states.astype(dtype), events, name=flight.name)
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, column):
+        # a state column by name, e.g. trajectory["z"]
+        return self.states[:, STATE_COLUMNS.index(column)]
+
+    def at(self, time):
+        # state at arbitrary times, interpolated in float64
+        time = np.atleast_1d(np.asarray(time, dtype=np.float64))
+        return interpolate_states(self.time, self.states.astype(np.float64), time)
+
+    @property
+    def nbytes(self):
+        return self.time.nbytes + self.states.nbytes
+
+    def save(self, path):
+        np.savez(
+            path,
+            time=self.time,
+            states=self.states,
+            event_names=np.array(list(self.events), dtype=str),
+            event_times=np.array(list(self.events.values()), dtype=np.float64),
+            name=np.array(self.name),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            events = dict(zip(data["event_names"].tolist(), data["event_times"].tolist()))
+            return cls(data["time"], data["states"], events, name=str(data["name"]))
+
+    def __repr__(self):
+        return (
+            f"CompactTrajectory('{self.name}', {len(self)} points, "
+            f"{self.states.dtype}, {self.nbytes / 1024:.1f} kB)"
+        )
+
+
+class TrajectoryStore:
+    # many trajectories in one growing buffer: trajectory i is rows offsets[i]:offsets[i+1]
+    def __init__(self, dtype=np.float32, capacity=4096):
+        self.dtype = np.dtype(dtype)
+        self._time = np.empty(capacity, dtype=np.float64)
+        self._states = np.empty((capacity, len(STATE_COLUMNS)), dtype=self.dtype)
+        self.offsets = [0]
+        self.names = []
+        self.events = []
+
+    def _reserve(self, rows):
+        needed = self.offsets[-1] + rows
+        if needed <= len(self._time):
+            return
+        capacity = max(needed, 2 * len(self._time))
+        self._time = np.resize(self._time, capacity)
+        self._states = np.resize(self._states, (capacity, len(STATE_COLUMNS)))
+
+    def append(self, trajectory, **decimation):
+        # a CompactTrajectory, or a Flight decimated with CompactTrajectory.from_flight
+        if not isinstance(trajectory, CompactTrajectory):
+            trajectory = CompactTrajectory.from_flight(trajectory, dtype=self.dtype, **decimation)
+        start, rows = self.offsets[-1], len(trajectory)
+        self._reserve(rows)
+        self._time[start : start + rows] = trajectory.time
+        self._states[start : start + rows] = trajectory.states
+        self.offsets.append(start + rows)
+        self.names.append(trajectory.name)
+        self.events.append(trajectory.events)
+        return len(self.offsets) - 2
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        # views into the shared buffer, nothing is copied
+        if i < 0:
+            i += len(self)
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return CompactTrajectory(
+            self._time[start:end], self._states[start:end], self.events[i], self.names[i]
+        )
+
+    @property
+    def nbytes(self):
+        rows = self.offsets[-1]
+        return self._time[:rows].nbytes + self._states[:rows].nbytes
+
+    def save(self, path):
+        rows = self.offsets[-1]
+        event_names = sorted({name for events in self.events for name in events})
+        event_times = np.full((len(self), len(event_names)), np.nan)
+        for i, events in enumerate(self.events):
+            for j, name in enumerate(event_names):
+                event_times[i, j] = events.get(name, np.nan)
+        np.savez(
+            path,
+            time=self._time[:rows],
+            states=self._states[:rows],
+            offsets=np.array(self.offsets, dtype=np.int64),
+            names=np.array(self.names, dtype=str),
+            event_names=np.array(event_names, dtype=str),
+            event_times=event_times,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            store = cls(dtype=data["states"].dtype, capacity=len(data["time"]))
+            rows = len(data["time"])
+            store._time[:rows] = data["time"]
+            store._states[:rows] = data["states"]
+            store.offsets = data["offsets"].tolist()
+            store.names = data["names"].tolist()
+            event_names = data["event_names"].tolist()
+            store.events = [
+                {name: time for name, time in zip(event_names, times) if not np.isnan(time)}
+                for times in data["event_times"]
+            ]
+        return store
+
+
+if __name__ == "__main__":
+    import os
+    import time as timer
+
+    from Nimbus_MaxDrift import Ascent, Descent
+
+    full = CompactTrajectory.from_flight(Descent, dtype=np.float64)
+    print("full solution:", full)
+    for decimation in ({"dt": 1.0}, {"max_points": 200}):
+        trajectory = CompactTrajectory.from_flight(Descent, **decimation)
+        error = np.abs(trajectory.at(full.time) - full.states)[:, :3].max()
+        print(decimation, trajectory, f"max position error {error:.2f} m")
+
+    store = TrajectoryStore()
+    for flight in (Ascent, Descent):
+        store.append(flight, max_points=200)
+    start = timer.perf_counter()
+    store.save("trajectories.npz")
+    print(f"{len(store)} trajectories, {store.nbytes / 1024:.1f} kB, "
+          f"saved in {1000 * (timer.perf_counter() - start):.2f} ms")
+    print(TrajectoryStore.load("trajectories.npz")[1])
+    os.remove("trajectories.npz")
@@ -0,0 +1,326 @@
+# Worst case wind profile search for the main-at-apogee drift
+# Nimbus_MaxDrift.py takes the worst drift to be a constant 8.9 m/s wind from one
+# direction. The ascent weathercocks into the low level wind though, so a profile that
+# turns with altitude (within a max speed and shear envelope) can carry the rocket further.
+# Here the landing point is modelled as
+#   apogee(w) + descent drift(w)
+# with w the wind at a set of altitude nodes (linear in between, as custom_atmosphere):
+#  - apogee(w): full ascents with the wind perturbed at each node give the (linearised)
+#    response of the apogee position and altitude to the wind at every node,
+#  - descent drift(w): under the main the rocket falls at its terminal velocity and moves
+#    with the wind, so the drift is sum_k w_k * T_k, T_k the time spent near node k,
+#    from the density profile, parachute cd_s and descent mass.
+# Thousands of candidate profiles are evaluated with this model in one matrix product, the
+# best ones are refined with SLSQP inside the envelope, and the top few are flown with full
+# ascent + main-at-apogee descent Flights.
+#
+# usage:
+#   search = WorstCaseWind(max_speed=8.9, max_shear=0.02)
+#   worst = search.run()   # full flight results of the top profiles, worst first
+
+# imports
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.optimize import minimize
+
+LATITUDE, LONGITUDE, ELEVATION = 39.4751, -8.3764, 78
+
+MAIN_CD_S = 29.128  # main parachute, as Nimbus.py / Nimbus_MaxDrift.py
+
+
+def apogee_main_trigger(p, h, y):
+    # activate main when vz < 0 m/s (i.e. at apogee), as in Nimbus_MaxDrift.py
+    return True if y[5] < 0 else False
+
+
+@functools.lru_cache(maxsize=None)
+def max_drift_rocket():
+    # NimbusDescent with the main opening at apogee, built once per process
+    from Nimbus import NimbusDescent
+
+    NimbusDescent.add_parachute(
+        name="main",
+        cd_s=MAIN_CD_S,
+        trigger=apogee_main_trigger,
+        sampling_rate=100,
+        lag=0,
+        noise=(0, 8.3, 0.5),
+    )
+    return NimbusDescent
+
+
+def wind_environment(nodes, wind, elevation=ELEVATION):
+    # rocketpy Environment with the wind linear between the altitude nodes (m AGL)
+    from rocketpy import Environment
+
+    env = Environment(latitude=LATITUDE, longitude=LONGITUDE, elevation=elevation)
+    heights = elevation + np.asarray(nodes, dtype=float)
+    wind = np.asarray(wind, dtype=float)
+    env.set_atmospheric_model(
+        type="custom_atmosphere",
+        wind_u=np.column_stack([heights, wind[:, 0]]),
+        wind_v=np.column_stack([heights, wind[:, 1]]),
+    )
+    return env
+
+
+def fly_ascent(nodes, wind, inclination=86, heading=0):
+    # worker: apogee x, y, z (m, z above sea level) under a wind profile
+    from rocketpy import Flight
+
+    from Nimbus import Nimbus
+
+    ascent = Flight(
+        rocket=Nimbus, environment=wind_environment(nodes, wind), rail_length=12,
+        inclination=inclination, heading=heading, terminate_on_apogee=True, name="Ascent",
+    )
+    return ascent.apogee_x, ascent.apogee_y, ascent.apogee
+
+
+def fly_max_drift(nodes, wind, inclination=86, heading=0):
+    # worker: full ascent + main-at-apogee descent, landing x, y (m)
+    from rocketpy import Flight
+
+    from Nimbus import Nimbus
+
+    env = wind_environment(nodes, wind)
+    ascent = Flight(
+        rocket=Nimbus, environment=env, rail_length=12, inclination=inclination,
+        heading=heading, terminate_on_apogee=True, name="Ascent",
+    )
+    descent = Flight(
+        rocket=max_drift_rocket(), environment=env, rail_length=12, inclination=0,
+        heading=0, initial_solution=ascent, name="Descent",
+        max_time=1e4,  # the main at apogee overruns the default max of 600s
+    )
+    return descent.x_impact, descent.y_impact
+
+
+class WorstCaseWind:
+    # max_speed: wind speed limit, m/s, a number or a function of altitude AGL
+    # max_shear: limit on the change of the wind vector with altitude, (m/s)/m (None: no limit)
+    # nodes: altitudes AGL (m) where the wind profile is defined
+    def __init__(
+        self,
+        max_speed=8.9,
+        max_shear=0.02,
+        nodes=np.arange(0, 4001, 250),
+        inclination=86,
+        heading=0,
+        perturbation=5,
+        max_workers=None,
+        seed=0,
+    ):
+        self.nodes = np.asarray(nodes, dtype=float)
+        speed = max_speed if callable(max_speed) else (lambda z: max_speed + 0 * z)
+        self.max_speed = np.asarray(speed(self.nodes), dtype=float)
+        self.max_shear = max_shear
+        self.inclination, self.heading = inclination, heading
+        self.perturbation = perturbation
+        self.max_workers = max_workers
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def n_nodes(self):
+        return len(self.nodes)
+
+    def _map(self, function, winds, pool=None):
+        # function over the winds in parallel. pool: an executor kept by the caller, so its
+        # workers import Nimbus only once
+        if pool is None:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                return self._map(function, winds, pool)
+        n = len(winds)
+        return list(
+            pool.map(
+                function, [self.nodes] * n, winds,
+                [self.inclination] * n, [self.heading] * n,
+            )
+        )
+
+    def build_model(self, pool=None):
+        # nominal (no wind) ascent, then one ascent per node the ascent reaches and per
+        # wind component, the apogee doesn't depend on the wind above it
+        zero = np.zeros((self.n_nodes, 2))
+        self.apogee0 = np.array(self._map(fly_ascent, [zero], pool)[0])
+        apogee_agl = self.apogee0[2] - ELEVATION
+        reached = [k for k in range(self.n_nodes) if k == 0 or self.nodes[k - 1] < apogee_agl]
+        winds = []
+        for k in reached:
+            for component in range(2):
+                wind = zero.copy()
+                wind[k, component] = self.perturbation
+                winds.append(wind)
+        apogees = np.array(self._map(fly_ascent, winds, pool))
+
+        # (3, 2 * n_nodes) response of apogee x, y, z to the node winds, per m/s
+        self.apogee_jacobian = np.zeros((3, 2 * self.n_nodes))
+        for i, k in enumerate(reached):
+            for component in range(2):
+                self.apogee_jacobian[:, 2 * k + component] = (
+                    apogees[2 * i + component] - self.apogee0
+                ) / self.perturbation
+
+        # time spent falling past each node under the main, at terminal velocity
+        from rocketpy import Environment
+
+        env = Environment(latitude=LATITUDE, longitude=LONGITUDE, elevation=ELEVATION)
+        env.set_atmospheric_model(type="standard_atmosphere")
+        mass = max_drift_rocket().total_mass(0)
+        z = np.linspace(0, self.nodes[-1], 2001)
+        rho = np.asarray(env.density(ELEVATION + z))
+        descent_rate = np.sqrt(2 * mass * env.gravity(ELEVATION) / (rho * MAIN_CD_S))
+        # hat functions of the linear interpolation between nodes
+        hats = np.array([np.interp(z, self.nodes, row) for row in np.eye(self.n_nodes)])
+        dt = hats / descent_rate
+        # cumulative time from the ground up, T(z_apogee) = time_table[:, index of z]
+        self._z = z
+        layer_time = (dt[:, 1:] + dt[:, :-1]) / 2 * np.diff(z)
+        self._time_table = np.concatenate(
+            [np.zeros((self.n_nodes, 1)), np.cumsum(layer_time, axis=1)], axis=1
+        )
+        return self
+
+    def landing(self, winds):
+        # fast model, winds (n, n_nodes, 2) -> landing points (n, 2)
+        winds = np.asarray(winds, dtype=float).reshape(-1, self.n_nodes, 2)
+        flat = winds.reshape(len(winds), -1)
+        apogee = self.apogee0 + flat @ self.apogee_jacobian.T  # (n, 3)
+        apogee_agl = np.clip(apogee[:, 2] - ELEVATION, 0, self._z[-1])
+        # time weights of each node for the actual apogee altitude, (n, n_nodes)
+        index = np.searchsorted(self._z, apogee_agl).clip(1, len(self._z) - 1)
+        weight = (apogee_agl - self._z[index - 1]) / (self._z[index] - self._z[index - 1])
+        times = self._time_table[:, index - 1] * (1 - weight) + self._time_table[:, index] * weight
+        drift = np.einsum("kn,nkc->nc", times, winds)
+        return apogee[:, :2] + drift
+
+    def project(self, winds):
+        # pull profiles inside the envelope: speed clipped per node, then the shear limited
+        # going up from the ground
+        winds = np.array(winds, dtype=float).reshape(-1, self.n_nodes, 2)
+        speed = np.linalg.norm(winds, axis=-1, keepdims=True)
+        winds *= np.minimum(1, self.max_speed[:, np.newaxis] / np.maximum(speed, 1e-12))
+        if self.max_shear is not None:
+            max_step = self.max_shear * np.diff(self.nodes)
+            for k in range(1, self.n_nodes):
+                step = winds[:, k] - winds[:, k - 1]
+                norm = np.linalg.norm(step, axis=-1, keepdims=True)
+                winds[:, k] = winds[:, k - 1] + step * np.minimum(
+                    1, max_step[k - 1] / np.maximum(norm, 1e-12)
+                )
+        return winds
+
+    def candidates(self, n_random=4000, n_directions=72):
+        # constant winds (MaxDrift's family), two layer profiles turning at some altitude,
+        # and random smooth profiles, all projected into the envelope
+        angles = np.linspace(0, 2 * np.pi, n_directions, endpoint=False)
+        unit = np.column_stack([np.sin(angles), np.cos(angles)])  # wind towards (east, north)
+        constant = unit[:, np.newaxis, :] * self.max_speed[np.newaxis, :, np.newaxis]
+
+        turn_index = self.rng.integers(1, self.n_nodes, n_random // 2)
+        low = unit[self.rng.integers(0, n_directions, n_random // 2)]
+        high = unit[self.rng.integers(0, n_directions, n_random // 2)]
+        below = np.arange(self.n_nodes)[np.newaxis, :] < turn_index[:, np.newaxis]
+        two_layer = np.where(below[..., np.newaxis], low[:, np.newaxis], high[:, np.newaxis])
+        two_layer = two_layer * self.max_speed[np.newaxis, :, np.newaxis]
+
+        steps = self.rng.normal(size=(n_random - n_random // 2, self.n_nodes, 2))
+        random = np.cumsum(steps, axis=1) * self.max_speed.max() / 2
+
+        return self.project(np.concatenate([constant, two_layer, random]))
+
+    def _refine(self, wind):
+        # SLSQP on the fast model inside the speed and shear envelope
+        n = self.n_nodes
+
+        def objective(x):
+            return -np.linalg.norm(self.landing(x)[0])
+
+        constraints = [
+            {"type": "ineq", "fun": lambda x: self.max_speed**2 - (x.reshape(n, 2) ** 2).sum(axis=1)}
+        ]
+        if self.max_shear is not None:
+            max_step = self.max_shear * np.diff(self.nodes)
+            constraints.append(
+                {
+                    "type": "ineq",
+                    "fun": lambda x: max_step**2
+                    - (np.diff(x.reshape(n, 2), axis=0) ** 2).sum(axis=1),
+                }
+            )
+        result = minimize(
+            objective, wind.ravel(), method="SLSQP", constraints=constraints,
+            options={"maxiter": 200, "ftol": 1e-6},
+        )
+        return self.project(result.x)[0]
+
+    def search(self, n_random=4000, n_refine=8):
+        # best profiles of the fast model, worst (largest drift) first
+        candidates = self.candidates(n_random)
+        distance = np.linalg.norm(self.landing(candidates), axis=1)
+        best = candidates[np.argsort(distance)[::-1][:n_refine]]
+        refined = np.array([self._refine(wind) for wind in best])
+        refined_distance = np.linalg.norm(self.landing(refined), axis=1)
+        order = np.argsort(refined_distance)[::-1]
+        return refined[order], refined_distance[order]
+
+    def run(self, n_random=4000, n_refine=8, n_verify=3):
+        # model, search, then full flights of the top profiles and of MaxDrift's constant wind,
+        # all on one process pool
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            self.build_model(pool)
+            profiles, model_distance = self.search(n_random, n_refine)
+
+            # refined profiles often converge to the same worst case, fly distinct ones only
+            distinct = [0]
+            for i in range(1, len(profiles)):
+                if all(np.abs(profiles[i] - profiles[j]).max() > 2 for j in distinct):
+                    distinct.append(i)
+            verify = profiles[distinct[:n_verify]]
+
+            max_drift_wind = np.zeros((self.n_nodes, 2))
+            max_drift_wind[:, 1] = self.max_speed  # Nimbus_MaxDrift.py: wind_u=0, wind_v=8.9
+            landings = np.array(self._map(fly_max_drift, list(verify) + [max_drift_wind], pool))
+
+        results = [
+            {
+                "wind": wind,
+                "model_landing": self.landing(wind)[0],
+                "landing": landing,
+                "drift": float(np.linalg.norm(landing)),
+            }
+            for wind, landing in zip(verify, landings[:-1])
+        ]
+        results.sort(key=lambda result: result["drift"], reverse=True)
+        self.constant_wind_drift = float(np.linalg.norm(landings[-1]))
+        return results
+
+    def plot_profile(self, wind, ax=None):
+        import matplotlib.pyplot as plt
+
+        if ax is None:
+            _, ax = plt.subplots()
+        ax.plot(wind[:, 0], self.nodes, label="wind_u (east)")
+        ax.plot(wind[:, 1], self.nodes, label="wind_v (north)")
+        ax.plot(np.linalg.norm(wind, axis=1), self.nodes, "k--", label="speed")
+        ax.set_xlabel("Wind (m/s)")
+        ax.set_ylabel("Altitude AGL (m)")
+        ax.legend()
+        ax.grid(True)
+        plt.show()
+
+
+if __name__ == "__main__":
+    import time as timer
+
+    search = WorstCaseWind(max_speed=8.9, max_shear=0.02)
+    start = timer.perf_counter()
+    worst = search.run()
+    print(f"search and verification in {timer.perf_counter() - start:.0f} s")
+    print(f"Nimbus_MaxDrift constant wind: drift {search.constant_wind_drift:.0f} m")
+    for result in worst:
+        model = np.linalg.norm(result["model_landing"])
+        print(f"worst case profile: drift {result['drift']:.0f} m (model {model:.0f} m)")
+    search.plot_profile(worst[0]["wind"])